@@ -0,0 +1,10 @@
+import importlib.util
+import sys
+
+collect_ignore = []
+
+if importlib.util.find_spec('numpy') is None:
+    collect_ignore.append('oathtool/vector.py')
+
+if sys.platform == 'win32':
+    collect_ignore += ['oathtool/counters.py', 'oathtool/cluster.py']
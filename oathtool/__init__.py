@@ -1,16 +1,151 @@
-import argparse
-import base64
 import binascii
 import hashlib
 import hmac as stdlib_hmac
+import os
 import struct
 import sys
 import time
 
+_counter = struct.Struct('>q')
+
+
+digests = dict(sha1=hashlib.sha1, sha256=hashlib.sha256, sha512=hashlib.sha512)
+"""Digests available by name, as for ``--digest``."""
+
+
+def _hmac_new(key, digest):
+    return lambda msg: stdlib_hmac.new(key, msg, digest).digest()
+
+
+def _hmac_digest(key, digest):
+    name = digest().name
+    return lambda msg: stdlib_hmac.digest(key, msg, name)
+
+
+def _hmac_copy(key, digest):
+    proto = stdlib_hmac.new(key, None, digest)
+
+    def mac(msg):
+        clone = proto.copy()
+        clone.update(msg)
+        return clone.digest()
+
+    return mac
+
+
+def _hmac_hashlib(key, digest):
+    # RFC 2104 directly on pre-keyed hashlib states
+    block_size = digest().block_size
+    if len(key) > block_size:
+        key = digest(key).digest()
+    key = key.ljust(block_size, b'\0')
+    inner_proto = digest(bytes(b ^ 0x36 for b in key))
+    outer_proto = digest(bytes(b ^ 0x5C for b in key))
+
+    def mac(msg):
+        inner = inner_proto.copy()
+        inner.update(msg)
+        outer = outer_proto.copy()
+        outer.update(inner.digest())
+        return outer.digest()
+
+    return mac
+
+
+hmac_backends = dict(
+    new=_hmac_new, digest=_hmac_digest, copy=_hmac_copy, hashlib=_hmac_hashlib
+)
+"""
+HMAC implementations by name. Each takes a key and a digest constructor
+and returns a function computing the HMAC of a message under that key.
+"""
+
+_hmac_backend = None
+
+
+def hmac_backend():
+    """
+    The name of the HMAC backend in use: the one set by use_hmac_backend,
+    else $OATHTOOL_HMAC_BACKEND, else the choice saved by calibrate_hmac,
+    else 'copy'.
+    """
+    global _hmac_backend
+    if _hmac_backend is None:
+        _hmac_backend = (
+            os.environ.get('OATHTOOL_HMAC_BACKEND')
+            or _load_calibration().get('backend')
+            or 'copy'
+        )
+        if _hmac_backend not in hmac_backends:
+            _hmac_backend = 'copy'
+    return _hmac_backend
+
+
+def use_hmac_backend(name):
+    """Use the named HMAC backend for keys created from now on."""
+    global _hmac_backend
+    if name not in hmac_backends:
+        raise ValueError(f'unknown HMAC backend: {name}')
+    _hmac_backend = name
+
+
+def keyed_hmac(key, digest=hashlib.sha1):
+    """A function computing HMACs under key with the selected backend."""
+    return hmac_backends[hmac_backend()](key, digest)
+
 
 def hmac(key, msg, digest=hashlib.sha1):
-    """HMAC implementation using standard library."""
-    return stdlib_hmac.new(key, msg, digest).digest()
+    """
+    HMAC implementation using standard library. A one-shot HMAC has no
+    key schedule to reuse, so it bypasses the backends.
+    """
+    return stdlib_hmac.digest(key, msg, digest)
+
+
+def _calibration_path():
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache, 'oathtool', 'hmac-backend.json')
+
+
+def _load_calibration():
+    try:
+        with open(_calibration_path(), encoding='utf-8') as file:
+            import json  # only once there is something to read
+
+            saved = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    # a choice made by another interpreter does not apply
+    return saved if saved.get('python') == sys.version else {}
+
+
+def calibrate_hmac(number=2000, save=True):
+    """
+    Time each HMAC backend keying a secret and computing one code with
+    it, as generate_otp does, switch to the fastest and, if save,
+    remember it for later runs. Return the seconds per code by backend
+    name.
+    """
+    import json
+    import timeit
+
+    key = b'12345678901234567890'
+    msg = _counter.pack(1)
+    timings = {}
+    for name, backend in hmac_backends.items():
+        timings[name] = (
+            min(timeit.repeat(lambda: backend(key, hashlib.sha1)(msg), number=number))
+            / number
+        )
+    fastest = min(timings, key=timings.get)
+    use_hmac_backend(fastest)
+    if save:
+        path = _calibration_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        saved = dict(backend=fastest, python=sys.version, timings=timings)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(saved, file, indent=2)
+    return timings
 
 
 def pad(input, size=8):
@@ -29,27 +164,79 @@ def clean(input):
     return input.replace(' ', '')
 
 
-def generate_otp(key, hotp_value=None, digest=hashlib.sha1):
+def _b32_table():
+    # Base32 (either case) to the digits of int(..., 32), '=' kept for
+    # stripping, anything else to '!', which int() rejects
+    table = bytearray(b'!' * 256)
+    alphabet = b'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567'
+    for char, digit in zip(alphabet, b'0123456789abcdefghijklmnopqrstuv'):
+        table[char] = table[bytes([char]).lower()[0]] = digit
+    table[ord('=')] = ord('=')
+    return bytes(table)
+
+
+_b32_digits = _b32_table()
+
+
+def b32decode(key):
     """
-    >>> generate_otp('MZXW6YTBOJUWU23MNU', 52276810)
-    '487656'
-    >>> generate_otp('MZXW6YTBOJUWU23MNU'*10, 52276810)
-    '295635'
+    Decode a Base32 secret like base64.b32decode(pad(clean(key)),
+    casefold=True), in a single translation pass and one int conversion.
+    Raise binascii.Error for invalid input.
+
+    >>> b32decode('MZXW 6ytb OI')
+    b'foobar'
+    >>> b32decode('MZX')
+    Traceback (most recent call last):
+    ...
+    binascii.Error: Incorrect padding
+    """
+    try:
+        padded = key.encode('ascii').translate(_b32_digits, b' ')
+    except UnicodeEncodeError:
+        raise binascii.Error('Non-base32 digit found') from None
+    digits = padded.rstrip(b'=')
+    size = len(digits)
+    # as with pad(), the given padding plus the missing padding must come
+    # to exactly what the final quantum needs
+    given = len(padded) - size
+    if size % 8 in (1, 3, 6) or given + -len(padded) % 8 != -size % 8:
+        raise binascii.Error('Incorrect padding')
+    bits = size * 5
+    if not digits:
+        return b''
+    try:
+        value = int(digits, 32)
+    except ValueError:
+        raise binascii.Error('Non-base32 digit found') from None
+    return (value >> (bits % 8)).to_bytes(bits // 8, 'big')
+
+
+def decode_key(key):
+    """
+    Decode a Base32 secret, tolerating spaces, lowercase and missing
+    padding.
+
+    >>> decode_key('MZXW 6YTB ojuw')
+    b'foobari'
     """
-    # convert HOTP to bytes
-    # https://tools.ietf.org/rfc/rfc6238.txt
-    hotp_value = struct.pack('>q', hotp_value or int(time.time() / 30))
-    # convert base32 key to bytes
     try:
-        key = base64.b32decode(pad(clean(key)), casefold=True)
+        return b32decode(key)
     except binascii.Error as e:
         raise ValueError(
             f"Invalid secret key: {e}\n"
             "Secret keys must be valid Base32 format (A-Z, 2-7).\n"
             "Example: JBSWY3DPEHPK3PXP"
         )
-    # generate HMAC from HOTP based on key
-    HMAC = hmac(key, hotp_value, digest)
+
+
+def truncate(HMAC):
+    """
+    Dynamic truncation of an HMAC to a 6-digit code (RFC 4226 5.3).
+
+    >>> truncate(bytes(range(20)))
+    '595078'
+    """
     # compute hash truncation
     cut = HMAC[-1] & 0x0F
     # encode into smaller number of digits
@@ -58,6 +245,328 @@ def generate_otp(key, hotp_value=None, digest=hashlib.sha1):
     )
 
 
+class OTPKey:
+    """
+    A secret key decoded once and reused across many codes.
+
+    The keyed HMAC for each digest is prepared on first use with the
+    current HMAC backend (see hmac_backend) and reused for every counter,
+    so repeated codes for the same secret skip the Base32 decoding and,
+    with the 'copy' and 'hashlib' backends, the HMAC key schedule.
+
+    >>> key = OTPKey('MZXW6YTBOJUWU23MNU')
+    >>> key.hotp(52276810)
+    '487656'
+    >>> key.totp(52276810 * 30)
+    '487656'
+    """
+
+    __slots__ = ('_macs', 'key')
+
+    def __init__(self, key):
+        self.key = decode_key(key)
+        self._macs = {}
+
+    @classmethod
+    def from_bytes(cls, key):
+        """
+        An OTPKey for an already decoded secret.
+
+        >>> OTPKey.from_bytes(b'foobari').hotp(1) == OTPKey('MZXW6YTBOJUQ').hotp(1)
+        True
+        """
+        self = cls.__new__(cls)
+        self.key = bytes(key)
+        self._macs = {}
+        return self
+
+    def __repr__(self):
+        return f'{type(self).__name__}(<{len(self.key)} bytes>)'
+
+    def _mac(self, digest):
+        try:
+            return self._macs[digest]
+        except KeyError:
+            mac = self._macs[digest] = keyed_hmac(self.key, digest)
+            return mac
+
+    def hmac(self, msg, digest=hashlib.sha1):
+        """HMAC of msg under this key."""
+        return self._mac(digest)(msg)
+
+    def hotp(self, counter, digest=hashlib.sha1):
+        """The code for an explicit counter value."""
+        # convert HOTP to bytes
+        # https://tools.ietf.org/rfc/rfc6238.txt
+        return truncate(self.hmac(_counter.pack(counter), digest))
+
+    def hotp_range(self, start, count, digest=hashlib.sha1):
+        """
+        Lazily yield the codes for counters start..start+count-1.
+
+        The counter is packed into a single reused buffer and every
+        HMAC uses the same keyed function.
+
+        >>> list(OTPKey('GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ').hotp_range(1, 3))
+        ['287082', '359152', '969429']
+        """
+        mac = self._mac(digest)
+        buf = bytearray(_counter.size)
+        pack_into = _counter.pack_into
+        for counter in range(start, start + count):
+            pack_into(buf, 0, counter)
+            yield truncate(mac(buf))
+
+    def totp(self, t=None, digest=hashlib.sha1, period=30):
+        """The code for the time step containing t (default: now)."""
+        if t is None:
+            t = time.time()
+        return self.hotp(int(t / period), digest)
+
+    def verify(
+        self, code, counter, window=1, last_used_counter=None, digest=hashlib.sha1
+    ):
+        """
+        The counter within window steps of counter whose code matches,
+        or None. Candidates are tried nearest first (see search_order)
+        and the scan stops at the first match. Counters at or before
+        last_used_counter are never accepted, so a caller that stores
+        the returned counter can reject replayed codes.
+        """
+        if not isinstance(code, str):
+            code = '%06d' % code
+        if not (code.isascii() and code.isdigit()):
+            # compare_digest rejects non-ASCII str; no code matches anyway
+            return None
+        for candidate in search_order(counter, window):
+            if last_used_counter is not None and candidate <= last_used_counter:
+                continue
+            if stdlib_hmac.compare_digest(self.hotp(candidate, digest), code):
+                return candidate
+        return None
+
+
+def search_order(counter, window):
+    """
+    Counters within window steps of counter, nearest first and, at each
+    distance, the past (a slow typist) before the future (a fast clock).
+
+    >>> list(search_order(10, 2))
+    [10, 9, 11, 8, 12]
+    """
+    yield counter
+    for distance in range(1, window + 1):
+        yield counter - distance
+        yield counter + distance
+
+
+def generate_otp(key, hotp_value=None, digest=hashlib.sha1):
+    """
+    >>> generate_otp('MZXW6YTBOJUWU23MNU', 52276810)
+    '487656'
+    >>> generate_otp('MZXW6YTBOJUWU23MNU'*10, 52276810)
+    '295635'
+    """
+    return OTPKey(key).hotp(hotp_value or int(time.time() / 30), digest)
+
+
+def generate_otp_range(key, start, count, digest=hashlib.sha1):
+    """
+    Generate the codes for count consecutive counters beginning at start,
+    decoding the key only once. Invalid keys raise immediately; the codes
+    themselves are produced lazily.
+
+    >>> codes = generate_otp_range('MZXW6YTBOJUWU23MNU', 52276809, 3)
+    >>> next(codes), next(codes)
+    ('233429', '487656')
+    """
+    return OTPKey(key).hotp_range(start, count, digest)
+
+
+def verify_otp(
+    key,
+    code,
+    window=1,
+    last_used_counter=None,
+    digest=hashlib.sha1,
+    t=None,
+    period=30,
+):
+    """
+    Verify a TOTP code for key at time t (default: now), accepting codes
+    up to window steps either side. Return the matching counter, or None.
+
+    Store the returned counter and pass it back as last_used_counter to
+    reject replays of the same (or an earlier) code.
+
+    >>> secret = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+    >>> verify_otp(secret, '287082', t=59)
+    1
+    >>> verify_otp(secret, '287082', t=59, last_used_counter=1) is None
+    True
+    >>> verify_otp(secret, '287082', t=89)
+    1
+    >>> verify_otp(secret, '287082', t=119) is None
+    True
+    """
+    if t is None:
+        t = time.time()
+    key = OTPKey(key)
+    return key.verify(code, int(t / period), window, last_used_counter, digest)
+
+
+def parse_key_line(line):
+    """
+    Split a line of a key list into (label, secret). The label is
+    optional and separated from the secret by a tab.
+
+    >>> parse_key_line('github\\tMZXW 6YTB\\n')
+    ('github', 'MZXW 6YTB')
+    >>> parse_key_line('JBSWY3DPEHPK3PXP')
+    (None, 'JBSWY3DPEHPK3PXP')
+    """
+    label, sep, secret = line.strip().rpartition('\t')
+    return (label.strip() if sep else None), secret.strip()
+
+
+def decode_keys(lines, start=1):
+    """
+    Decode every secret in an iterable of key list lines (see
+    parse_key_line), such as an open file, in a single pass.
+
+    Return (keys, invalid): a dict of label to raw key bytes, and a list
+    of (lineno, label, reason) for each line that could not be decoded,
+    including repeated labels. Lines without a label are labeled by line
+    number, as in generate_batch.
+
+    >>> keys, invalid = decode_keys(['a\\tMZXW6YTBOI', '!!', 'a\\tMZXW6'])
+    >>> keys
+    {'a': b'foobar'}
+    >>> invalid
+    [(2, '2', 'Non-base32 digit found'), (3, 'a', 'Duplicate label')]
+    """
+    keys = {}
+    invalid = []
+    for lineno, line in enumerate(lines, start):
+        label, secret = parse_key_line(line)
+        if not secret:
+            continue
+        if label is None:
+            label = str(lineno)
+        if label in keys:
+            invalid.append((lineno, label, 'Duplicate label'))
+            continue
+        try:
+            keys[label] = b32decode(secret)
+        except binascii.Error as e:
+            invalid.append((lineno, label, str(e)))
+    return keys, invalid
+
+
+def generate_batch(lines, digest=hashlib.sha1, start=1):
+    """
+    Generate the current code for each secret in an iterable of key list
+    lines (see parse_key_line), one line at a time.
+
+    Yields (lineno, label, code, error) for every non-blank line. Lines
+    without a label are labeled by line number. Invalid secrets yield
+    code None and a one-line error instead of raising.
+
+    >>> list(generate_batch(['a\\tJBSWY3DPEHPK3PXP', '', 'b\\t!!']))[1]
+    (3, 'b', None, 'Invalid secret key: Non-base32 digit found')
+    """
+    for lineno, line in enumerate(lines, start):
+        label, secret = parse_key_line(line)
+        if not secret:
+            continue
+        if label is None:
+            label = str(lineno)
+        try:
+            yield lineno, label, OTPKey(secret).totp(digest=digest), None
+        except ValueError as e:
+            yield lineno, label, None, str(e).splitlines()[0]
+
+
+def _generate_chunk(chunk, digest, start):
+    return list(generate_batch(chunk, digest, start))
+
+
+def _default_executor():
+    # free-threaded builds can use threads; otherwise side-step the GIL
+    gil_enabled = getattr(sys, '_is_gil_enabled', lambda: True)()
+    return 'process' if gil_enabled else 'thread'
+
+
+def generate_bulk(
+    lines, jobs=None, digest=hashlib.sha1, executor=None, chunk_size=4096
+):
+    """
+    Like generate_batch, but spread across a pool of jobs workers
+    (default: one per CPU).
+
+    Lines are sent to the pool in chunks of chunk_size to amortize
+    pickling and dispatch, and results are yielded in input order. At
+    most two chunks per worker are in flight, so memory stays bounded
+    for arbitrarily long inputs. executor is 'process' or 'thread';
+    the default is 'thread' on free-threaded builds, else 'process'.
+
+    >>> list(generate_bulk(['JBSWY3DPEHPK3PXP', 'x'], jobs=1))[1]
+    (2, '2', None, 'Invalid secret key: Incorrect padding')
+    """
+    import collections
+    import concurrent.futures
+    import itertools
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1:
+        yield from generate_batch(lines, digest)
+        return
+    pools = dict(
+        process=concurrent.futures.ProcessPoolExecutor,
+        thread=concurrent.futures.ThreadPoolExecutor,
+    )
+    lines = iter(lines)
+    pending = collections.deque()
+    start = 1
+    with pools[executor or _default_executor()](jobs) as pool:
+        while True:
+            chunk = list(itertools.islice(lines, chunk_size))
+            if chunk:
+                pending.append(pool.submit(_generate_chunk, chunk, digest, start))
+                start += len(chunk)
+            if pending and (not chunk or len(pending) >= 2 * jobs):
+                yield from pending.popleft().result()
+            elif not chunk:
+                break
+
+
+def write_batch(results, out, err, format='text', chunk_size=1024):
+    """
+    Write batch results to out as 'label code' lines or JSON Lines,
+    reporting errors to err. Output is joined and written in chunks.
+    Return the number of errors.
+    """
+    import json
+
+    errors = 0
+    chunk = []
+    for lineno, label, code, error in results:
+        if error is not None:
+            err.write(f'line {lineno}: {error}\n')
+            errors += 1
+            continue
+        if format == 'json':
+            chunk.append(json.dumps(dict(label=label, code=code)) + '\n')
+        else:
+            chunk.append(f'{label} {code}\n')
+        if len(chunk) >= chunk_size:
+            out.write(''.join(chunk))
+            chunk.clear()
+    out.write(''.join(chunk))
+    out.flush()
+    return errors
+
+
 def get_version():
     """Get package version from importlib.metadata."""
     try:
@@ -67,12 +576,90 @@ def get_version():
         return 'unknown'
 
 
-def main():
+def _daemon_otp(key, path, digest):
+    try:
+        from oathtool import client
+    except ImportError:  # standalone script
+        return generate_otp(key, digest=digest)
+    return client.generate_otp(key, path, digest)
+
+
+def _store_otp(path, label):
+    from oathtool import keystore
+
+    try:
+        with keystore.KeyStore(path) as store:
+            print(store.generate_otp(label))
+    except KeyError:
+        print(f'Error: no key labeled {label!r} in {path}', file=sys.stderr)
+        sys.exit(1)
+    except (OSError, ValueError) as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+
+
+def _hotp_otp(key, counter, path, slot, digest):
+    try:
+        key = OTPKey(key)
+        if path is None:
+            print(key.hotp(counter, digest))
+            return
+        from oathtool import counters
+
+        with counters.CounterStore(path, slots=slot + 1) as store:
+            print(store.hotp(slot, key, digest))
+    except (ImportError, OSError, ValueError) as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+
+
+def _print_otp(key, socket, digest):
+    try:
+        if socket:
+            print(_daemon_otp(key, socket, digest))
+        else:
+            print(generate_otp(key, digest=digest))
+    except ValueError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+
+
+def _jobs(value):
+    import argparse
+
+    jobs = int(value)
+    if jobs < 0:
+        raise argparse.ArgumentTypeError(f'must be 0 or more, not {jobs}')
+    return jobs
+
+
+def _counter_value(value):
+    import argparse
+
+    counter = int(value)
+    if not 0 <= counter < 2**63:
+        raise argparse.ArgumentTypeError(f'must be 0 to 2**63-1, not {counter}')
+    return counter
+
+
+def _slot(value):
+    import argparse
+
+    slot = int(value)
+    if slot < 0:
+        raise argparse.ArgumentTypeError(f'must be 0 or more, not {slot}')
+    return slot
+
+
+def _parser():
+    import argparse
+
     parser = argparse.ArgumentParser(
         description='Generate TOTP (Time-based One-Time Password) codes',
         epilog='Examples:\n'
                '  oathtool JBSWY3DPEHPK3PXP\n'
-               '  echo JBSWY3DPEHPK3PXP | oathtool',
+               '  echo JBSWY3DPEHPK3PXP | oathtool\n'
+               '  oathtool serve SOCKET --keys FILE    (see oathtool serve -h)',
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
     parser.add_argument(
@@ -83,8 +670,8 @@ def main():
     )
     parser.add_argument(
         '--version',
-        action='version',
-        version=f'oathtool {get_version()}'
+        action='store_true',
+        help="show program's version number and exit"
     )
     parser.add_argument(
         '--totp',
@@ -98,12 +685,126 @@ def main():
     )
     parser.add_argument(
         '--sha256',
+        action='store_const',
+        dest='digest',
+        const='sha256',
+        help='Use SHA256 instead of SHA1 for HMAC (same as --digest sha256)'
+    )
+    parser.add_argument(
+        '--digest',
+        choices=sorted(digests),
+        help='Hash algorithm for HMAC (default: sha1)'
+    )
+    parser.set_defaults(digest='sha1')
+    parser.add_argument(
+        '--calibrate',
+        action='store_true',
+        help='Time the available HMAC backends, remember the fastest '
+             'for later runs and exit'
+    )
+    parser.add_argument(
+        '--batch',
         action='store_true',
-        help='Use SHA256 instead of SHA1 for HMAC'
+        help='Read one secret per line from stdin, optionally preceded by '
+             'a label and a tab, and print "label code" for each'
     )
+    parser.add_argument(
+        '--format',
+        choices=['text', 'json'],
+        default='text',
+        help='Output format for --batch (default: text)'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=_jobs,
+        metavar='N',
+        help='Spread --batch across N parallel workers (0 for one per CPU)'
+    )
+    parser.add_argument(
+        '--store',
+        metavar='FILE',
+        help='Read the secret for --label from a keystore built with '
+             'python -m oathtool.keystore'
+    )
+    parser.add_argument(
+        '--label',
+        help='Label of the key to use from --store'
+    )
+    parser.add_argument(
+        '--socket',
+        metavar='PATH',
+        default=os.environ.get('OATHTOOL_SOCKET'),
+        help='Ask the oathtool daemon listening at PATH, falling back to '
+             'in-process generation if none is running '
+             '(default: $OATHTOOL_SOCKET)'
+    )
+    parser.add_argument(
+        '--hotp',
+        action='store_true',
+        help='Generate a counter-based HOTP code, with --counter or '
+             '--counter-file'
+    )
+    parser.add_argument(
+        '--counter',
+        type=_counter_value,
+        metavar='N',
+        help='HOTP counter to use'
+    )
+    parser.add_argument(
+        '--counter-file',
+        metavar='FILE',
+        help='Use and advance the HOTP counter stored in FILE, which is '
+             'created if missing and may be shared between processes (Unix)'
+    )
+    parser.add_argument(
+        '--slot',
+        type=_slot,
+        metavar='N',
+        help='Counter in --counter-file to use (default: 0)'
+    )
+    return parser
+
+
+def _batch(parser, args, digest):
+    if args.key:
+        parser.error('--batch reads secrets from stdin only')
+    if args.base32:
+        parser.error('--base32 cannot be combined with --batch')
+    if args.jobs is None:
+        results = generate_batch(sys.stdin, digest=digest)
+    else:
+        results = generate_bulk(sys.stdin, jobs=args.jobs, digest=digest)
+    if write_batch(results, sys.stdout, sys.stderr, args.format):
+        sys.exit(1)
+
+
+def _plain_key(args):
+    # The common cases, a lone key or one on stdin, need no option parsing
+    # (nor the imports that brings); anything else, including an empty
+    # key, goes through the full parser.
+    if len(args) == 1 and not args[0].startswith('-'):
+        return args[0]
+    if not args and not sys.stdin.isatty():
+        return sys.stdin.read().strip()
+    return None
+
+
+def _check_options(parser, args):
+    if args.jobs is not None and not args.batch:
+        parser.error('--jobs requires --batch')
+    if args.slot is not None and not args.counter_file:
+        parser.error('--slot requires --counter-file')
+    if args.counter is not None or args.counter_file:
+        if not args.hotp:
+            parser.error('--counter and --counter-file require --hotp')
+    if args.hotp:
+        if (args.counter is None) == (args.counter_file is None):
+            parser.error('--hotp takes one of --counter or --counter-file')
+        if args.batch:
+            parser.error('--hotp cannot be combined with --batch')
 
-    args = parser.parse_args()
 
+def _read_key(parser, args):
     # Get key from stdin if not provided as argument
     if not sys.stdin.isatty() and not args.key:
         key = sys.stdin.read().strip()
@@ -121,12 +822,64 @@ def main():
         if len(cleaned_key) != 32:
             print(f'Error: --base32 flag requires a 32-character secret key, got {len(cleaned_key)} characters', file=sys.stderr)
             sys.exit(1)
+    return key
 
-    # Select hash algorithm
-    digest = hashlib.sha256 if args.sha256 else hashlib.sha1
 
+def _calibrate():
+    timings = calibrate_hmac()
+    for name, seconds in sorted(timings.items(), key=lambda item: item[1]):
+        print(f'{name:<10} {seconds * 1e6:8.3f} us')
+    print(f'selected: {hmac_backend()}')
+
+
+def _start_metrics(path):
     try:
-        print(generate_otp(key, digest=digest))
-    except ValueError as e:
-        print(f'Error: {e}', file=sys.stderr)
-        sys.exit(1)
+        from oathtool import metrics
+    except ImportError:  # standalone script
+        return
+    import atexit
+
+    metrics.record_startup()
+    metrics.enable()
+    atexit.register(metrics.write, path)
+
+
+def main():
+    if os.environ.get('OATHTOOL_METRICS'):
+        _start_metrics(os.environ['OATHTOOL_METRICS'])
+    args = sys.argv[1:]
+    if args[:1] == ['serve']:
+        from oathtool import daemon
+
+        return daemon.main(args[1:])
+
+    key = _plain_key(args)
+    if key:
+        return _print_otp(key, os.environ.get('OATHTOOL_SOCKET'), hashlib.sha1)
+
+    parser = _parser()
+    args = parser.parse_args()
+
+    if args.version:
+        print(f'oathtool {get_version()}')
+        parser.exit()
+
+    if args.calibrate:
+        return _calibrate()
+
+    # Select hash algorithm
+    digest = digests[args.digest]
+
+    if args.store or args.label:
+        if not (args.store and args.label) or args.key or args.batch:
+            parser.error('--store and --label go together, without a key')
+        return _store_otp(args.store, args.label)
+
+    _check_options(parser, args)
+    if args.batch:
+        return _batch(parser, args, digest)
+
+    key = _read_key(parser, args)
+    if args.hotp:
+        return _hotp_otp(key, args.counter, args.counter_file, args.slot or 0, digest)
+    _print_otp(key, args.socket, digest)
@@ -0,0 +1,720 @@
+"""
+Micro-benchmarks for the oathtool hot paths.
+
+Run all benchmarks, or only the named ones::
+
+    $ python -m oathtool.bench
+    $ python -m oathtool.bench generate decode verify batch startup
+
+Save the results as JSON, and later compare a run against them. The
+run fails if any result is worse than its baseline by more than its
+threshold: a fraction given by --threshold (default 0.1), or by
+--threshold NAME=FRACTION for a single result::
+
+    $ python -m oathtool.bench --json baseline.json
+    $ python -m oathtool.bench --baseline baseline.json \\
+          --threshold 0.2 --threshold startup-cli=0.5
+
+Everything runs locally, with no network access.
+"""
+
+import argparse
+import base64
+import contextlib
+import hashlib
+import hmac
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+
+import oathtool
+from oathtool.sample import secrets
+
+SECRET = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+
+benchmarks = {}
+
+
+def benchmark(func):
+    """Register func under its name, with dashes for underscores."""
+    benchmarks[func.__name__.replace('_', '-')] = func
+    return func
+
+
+def best_of(func, number, repeat=5):
+    """Best wall-clock seconds per call of func over repeat runs."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) / number
+
+
+def result(name, value, unit='s', budget=None):
+    """
+    A benchmark result; one with a budget fails the run if its value is
+    worse than that, whatever the baseline.
+    """
+    res = dict(name=name, value=value, unit=unit)
+    if budget is not None:
+        res['budget'] = budget
+    return res
+
+
+@benchmark
+def window(sizes=(1, 3, 11, 101), codes=2020):
+    """
+    Per-code cost of a counter window via repeated generate_otp calls
+    versus a single generate_otp_range call.
+    """
+    for size in sizes:
+        number = max(codes // size, 1)
+
+        def loop():
+            for counter in range(1000, 1000 + size):
+                oathtool.generate_otp(SECRET, counter)
+
+        def ranged():
+            for _ in oathtool.generate_otp_range(SECRET, 1000, size):
+                pass
+
+        yield result(f'window-{size}-generate_otp', best_of(loop, number) / size)
+        yield result(f'window-{size}-range', best_of(ranged, number) / size)
+
+
+@benchmark
+def generate(number=20_000):
+    """Seconds per generate_otp call with SHA1 and with SHA256."""
+    for digest in (hashlib.sha1, hashlib.sha256):
+
+        def call(digest=digest):
+            oathtool.generate_otp(SECRET, 1000, digest)
+
+        yield result(f'generate-{digest().name}', best_of(call, number))
+
+
+@benchmark
+def decode(number=50_000):
+    """Seconds per decode_key call, for a clean and a spaced, lowercase secret."""
+    spaced = ' '.join(SECRET[pos : pos + 4] for pos in range(0, 32, 4)).lower()
+    yield result('decode', best_of(lambda: oathtool.decode_key(SECRET), number))
+    yield result('decode-spaced', best_of(lambda: oathtool.decode_key(spaced), number))
+
+
+@benchmark
+def verify(windows=(1, 5), number=5_000):
+    """
+    Seconds per verify_otp call with a window of steps either side, for
+    a code at the far edge of the window and for a miss, which checks
+    every step.
+    """
+    key = oathtool.OTPKey(SECRET)
+    t = 1000 * 30
+    for window in windows:
+        edge = key.hotp(1000 + window)
+
+        def hit(window=window, edge=edge):
+            oathtool.verify_otp(SECRET, edge, window, t=t)
+
+        def miss(window=window):
+            oathtool.verify_otp(SECRET, 'xxxxxx', window, t=t)
+
+        yield result(f'verify-window-{window}-edge', best_of(hit, number))
+        yield result(f'verify-window-{window}-miss', best_of(miss, number))
+
+
+@benchmark
+def batch(keys=20_000):
+    """
+    Throughput (keys/s) of --batch without parallelism: generate_batch
+    and write_batch over a key list, for text and JSON output.
+    """
+    import io
+
+    lines = [f'acct{n}\t{secret}\n' for n, secret in enumerate(secrets(keys))]
+    for format in ('text', 'json'):
+
+        def run(format=format):
+            results = oathtool.generate_batch(lines)
+            oathtool.write_batch(results, io.StringIO(), sys.stderr, format)
+
+        yield result(f'batch-{format}', keys / best_of(run, 1, 3), 'keys/s')
+
+
+@benchmark
+def scaling(keys=100_000, max_jobs=None):
+    """
+    Bulk throughput (keys/s) of generate_bulk for 1..N jobs with the
+    thread and process backends. Result names note whether the GIL is
+    enabled, so free-threaded builds can be compared directly.
+    """
+    lines = [f'acct{n}\t{secret}' for n, secret in enumerate(secrets(keys))]
+    gil = 'gil' if getattr(sys, '_is_gil_enabled', lambda: True)() else 'nogil'
+    for jobs in range(1, (max_jobs or os.cpu_count() or 1) + 1):
+        for executor in ('thread', 'process'):
+            start = time.perf_counter()
+            for _ in oathtool.generate_bulk(lines, jobs=jobs, executor=executor):
+                pass
+            elapsed = time.perf_counter() - start
+            yield result(f'scaling-{gil}-{executor}-{jobs}', keys / elapsed, 'keys/s')
+
+
+class counting_hmacs:
+    """Count HMACs (via truncations) computed within the block."""
+
+    def __enter__(self):
+        self.count = 0
+        self.orig = oathtool.truncate
+
+        def truncate(HMAC):
+            self.count += 1
+            return self.orig(HMAC)
+
+        oathtool.truncate = truncate
+        return self
+
+    def __exit__(self, *exc_info):
+        oathtool.truncate = self.orig
+
+
+@benchmark
+def drift(keys=10_000, rounds=5, window=4):
+    """
+    Average HMACs per verification for a simulated population of skewed
+    clients, with stateless verification versus a DriftTracker.
+
+    Clock skews are 0 steps for 70% of clients, +/-1 for 20%, +/-2 for 8%
+    and +/-3 for 2%; one login in ten is additionally a step late.
+    """
+    import random
+
+    from oathtool.drift import DriftTracker
+
+    rand = random.Random(0)
+    population = [oathtool.OTPKey(secret) for secret in secrets(keys)]
+    skews = rand.choices([0, -1, 1, -2, 2, -3, 3], [70, 10, 10, 4, 4, 1, 1], k=keys)
+    logins = []
+    for round in range(rounds):
+        counter = 1_000_000 + round * 100
+        for key_id, key in enumerate(population):
+            late = rand.random() < 0.1
+            code = key.hotp(counter + skews[key_id] - late)
+            logins.append((key_id, key, code, counter))
+
+    with counting_hmacs() as stateless:
+        for _, key, code, counter in logins:
+            assert key.verify(code, counter, window) is not None
+    tracker = DriftTracker()
+    with counting_hmacs() as tracked:
+        for key_id, key, code, counter in logins:
+            assert tracker.verify(key_id, key, code, window, t=counter * 30) is not None
+    yield result('drift-stateless', stateless.count / len(logins), 'hmacs/verify')
+    yield result('drift-tracked', tracked.count / len(logins), 'hmacs/verify')
+
+
+@benchmark
+def fleet(keys=100_000):
+    """
+    Bytes per key and codes per second of a KeyFleet against a list of
+    the same Base32 secrets, indexed by the same ids, with generate_otp.
+    """
+    import tracemalloc
+
+    from oathtool.fleet import KeyFleet
+
+    tracemalloc.start()
+    baseline = list(secrets(keys))
+    list_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    packed = KeyFleet(baseline)
+    fleet_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    yield result('fleet-list-memory', list_bytes / keys, 'bytes/key')
+    yield result('fleet-memory', fleet_bytes / keys, 'bytes/key')
+
+    start = time.perf_counter()
+    for secret in baseline:
+        oathtool.generate_otp(secret, 1000)
+    yield result(
+        'fleet-list-throughput', keys / (time.perf_counter() - start), 'codes/s'
+    )
+    start = time.perf_counter()
+    packed.codes_at(1000)
+    yield result('fleet-throughput', keys / (time.perf_counter() - start), 'codes/s')
+
+
+@benchmark
+def truncate(keys=100_000):
+    """
+    Truncation and formatting of a batch of SHA1 digests: the scalar
+    truncate() loop versus the vectorized NumPy pass (if installed).
+    """
+    from oathtool import vector
+
+    raw = [oathtool.decode_key(secret) for secret in secrets(keys)]
+    msg = oathtool._counter.pack(1000)
+    digests = [oathtool.hmac(key, msg) for key in raw]
+
+    def scalar():
+        return ''.join(oathtool.truncate(d) + '\n' for d in digests)
+
+    yield result('truncate-scalar', best_of(scalar, 1) / keys)
+
+    def bulk_scalar():
+        return [oathtool.truncate(hmac.digest(key, msg, 'sha1')) for key in raw]
+
+    yield result('bulk-codes-scalar', best_of(bulk_scalar, 1) / keys)
+    if vector.np is None:
+        return
+    matrix = vector.np.frombuffer(b''.join(digests), vector.np.uint8).reshape(keys, 20)
+
+    def vectorized():
+        return vector.format_codes(vector.truncate_array(matrix))
+
+    assert vectorized().decode() == scalar()
+    yield result('truncate-numpy', best_of(vectorized, 1) / keys)
+
+    def bulk_numpy():
+        return vector.bulk_codes(raw, 1000)
+
+    assert bulk_numpy() == bulk_scalar()
+    yield result('bulk-codes-numpy', best_of(bulk_numpy, 1) / keys)
+
+
+@benchmark
+def hmac_batch(keys=100_000):
+    """
+    HMAC throughput (keys/s) at one counter: the hashlib-backed
+    oathtool.hmac loop versus the experimental NumPy HMACBatch engine,
+    which needs NumPy and is skipped without it.
+    """
+    from oathtool import vector
+
+    raw = [oathtool.decode_key(secret) for secret in secrets(keys)]
+    msg = oathtool._counter.pack(1000)
+    for digest in (hashlib.sha1, hashlib.sha256):
+        name = digest().name
+
+        def loop():
+            return [oathtool.hmac(key, msg, digest) for key in raw]
+
+        yield result(f'hmac-{name}-hashlib', keys / best_of(loop, 1, 3), 'keys/s')
+        if vector.np is None:
+            continue
+        batch = vector.HMACBatch(raw, digest)
+        assert [bytes(row) for row in batch.digests(1000)] == loop()
+        elapsed = best_of(lambda: batch.digests(1000), 1, 3)
+        yield result(f'hmac-{name}-numpy', keys / elapsed, 'keys/s')
+
+
+@benchmark
+def ingest(keys=1_000_000):
+    """
+    Decoding a key list: the per-key clean/pad/b32decode path versus
+    decode_keys, in keys/s.
+    """
+    lines = [f'{n}\t{secret}\n' for n, secret in enumerate(secrets(keys))]
+
+    def per_key():
+        decoded = {}
+        for line in lines:
+            label, secret = oathtool.parse_key_line(line)
+            decoded[label] = base64.b32decode(
+                oathtool.pad(oathtool.clean(secret)), casefold=True
+            )
+        return decoded
+
+    def bulk():
+        return oathtool.decode_keys(lines)[0]
+
+    assert bulk() == per_key()
+    yield result('ingest-per-key', keys / best_of(per_key, 1, 3), 'keys/s')
+    yield result('ingest-decode-keys', keys / best_of(bulk, 1, 3), 'keys/s')
+
+
+@benchmark
+def reload(keys=100_000, changes=100):
+    """
+    Seconds to load a key list into a KeySource from scratch, and to
+    reload it after rotating changes of its keys.
+    """
+    from oathtool.source import KeySource
+
+    fleet = secrets(keys + changes)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'secrets.txt')
+
+        def write(rotated):
+            with open(path, 'w') as file:
+                file.writelines(
+                    f'acct{n}\t{fleet[keys + n if n < rotated else n]}\n'
+                    for n in range(keys)
+                )
+
+        write(0)
+        start = time.perf_counter()
+        source = KeySource(path)
+        yield result('reload-full', time.perf_counter() - start)
+        write(changes)
+        start = time.perf_counter()
+        change = source.reload()
+        yield result(f'reload-{changes}-rotated', time.perf_counter() - start)
+    assert len(change.rotated) == changes
+
+
+@benchmark
+def counters(increments=10_000, slots=1000):
+    """
+    HOTP counter updates per second: rewriting a JSON file of counters
+    on every use versus oathtool.counters.CounterStore.
+    """
+    import json
+
+    from oathtool.counters import CounterStore
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'counters.json')
+        with open(path, 'w') as file:
+            json.dump({str(slot): 0 for slot in range(slots)}, file)
+
+        def rewrite():
+            for n in range(increments):
+                with open(path) as file:
+                    saved = json.load(file)
+                saved[str(n % slots)] += 1
+                with open(path + '.tmp', 'w') as file:
+                    json.dump(saved, file)
+                os.replace(path + '.tmp', path)
+
+        elapsed = best_of(rewrite, 1, 3)
+        yield result('counters-json', increments / elapsed, 'updates/s')
+        with CounterStore(os.path.join(tmp, 'counters'), slots) as store:
+
+            def mapped():
+                for n in range(increments):
+                    store.increment(n % slots)
+
+            elapsed = best_of(mapped, 1, 3)
+        yield result('counters-mmap', increments / elapsed, 'updates/s')
+
+
+@benchmark
+def metrics(number=20_000):
+    """
+    Seconds per generate_otp call before instrumentation is enabled,
+    while it is enabled, and after it is disabled again.
+    """
+    from oathtool import metrics
+
+    def call():
+        oathtool.generate_otp(SECRET, 1000)
+
+    yield result('metrics-never-enabled', best_of(call, number))
+    with metrics.instrumented():
+        yield result('metrics-enabled', best_of(call, number))
+    yield result('metrics-disabled', best_of(call, number))
+    metrics.reset()
+
+
+async def _loop_lag(call, clients, requests, interval=0.001):
+    """
+    Run clients that each await call(n) requests times, yielding to the
+    event loop between requests, alongside a ticker that sleeps for
+    interval at a time. Return the ticker's worst and 99th percentile
+    oversleep, and the seconds until every client finished.
+    """
+    import asyncio
+
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - start - interval)
+
+    async def client(first):
+        for n in range(first, first + requests):
+            await call(n)
+            await asyncio.sleep(0)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(interval * 5)
+    lags.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(client(c * requests + 1) for c in range(clients)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await task
+    lags.sort()
+    return lags[-1], lags[len(lags) * 99 // 100], elapsed
+
+
+@benchmark
+def event_loop(clients=1000, requests=20):
+    """
+    Event-loop latency under a burst of logins: how late a 1 ms timer
+    fires while clients concurrently generate codes by calling
+    generate_otp directly on the loop, and through the batching
+    oathtool.aio API, with the time the burst took.
+    """
+    import asyncio
+
+    from oathtool import aio
+
+    async def direct(n):
+        return oathtool.generate_otp(SECRET, n)
+
+    async def batched(n):
+        return await aio.agenerate_otp(SECRET, n)
+
+    for name, call in (('direct', direct), ('batched', batched)):
+        worst, p99, elapsed = asyncio.run(_loop_lag(call, clients, requests))
+        yield result(f'event-loop-{name}-max-lag', worst)
+        yield result(f'event-loop-{name}-p99-lag', p99)
+        yield result(f'event-loop-{name}-burst', elapsed)
+
+
+@contextlib.contextmanager
+def cold_runner():
+    """
+    Yield a function that runs a command and returns its wall-clock
+    seconds and stderr. Python bytecode is cached in a temporary
+    directory, as for an installed package, and oathtool is imported
+    from this tree.
+    """
+    path = os.path.dirname(os.path.dirname(oathtool.__file__))
+    with tempfile.TemporaryDirectory() as cache:
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=cache)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [path, env.get('PYTHONPATH')]))
+
+        def run(*command):
+            start = time.perf_counter()
+            proc = subprocess.run(
+                command, env=env, capture_output=True, text=True, check=True
+            )
+            return time.perf_counter() - start, proc.stderr
+
+        yield run
+
+
+@benchmark
+def startup(runs=20, import_budget=0.010, cli_budget=0.030):
+    """
+    Cold start of the command line: the cumulative import time of
+    oathtool as reported by -X importtime, and the wall-clock time of
+    ``python -m oathtool KEY`` beyond that of a bare interpreter. The
+    run fails if either is over its budget, in seconds.
+    """
+    with cold_runner() as run:
+        run(sys.executable, '-m', 'oathtool', SECRET)
+        importtime = (sys.executable, '-X', 'importtime', '-c', 'import oathtool')
+        # the last line reports oathtool: self | cumulative | name
+        imports = min(int(run(*importtime)[1].split('|')[-2]) for _ in range(runs))
+        bare = min(run(sys.executable, '-c', 'pass')[0] for _ in range(runs))
+        cli = min(run(sys.executable, '-m', 'oathtool', SECRET)[0] for _ in range(runs))
+    yield result('startup-import', imports / 1e6, budget=import_budget)
+    yield result('startup-cli', cli - bare, budget=cli_budget)
+
+
+CONSOLE_SCRIPT = """\
+import sys
+from oathtool import main
+sys.exit(main())
+"""
+
+
+@benchmark
+def standalone(runs=20):
+    """
+    Cold-start wall-clock time of generating one code with the console
+    script as pip installs it, and with each format of standalone
+    script from generate-script.
+    """
+    here = os.path.dirname(oathtool.__file__)
+    generate = runpy.run_path(os.path.join(here, 'generate-script.py'))
+    with cold_runner() as run, tempfile.TemporaryDirectory() as tmp:
+        commands = {'console-script': os.path.join(tmp, 'console-script')}
+        with open(commands['console-script'], 'w') as file:
+            file.write(f'#!{sys.executable}\n{CONSOLE_SCRIPT}')
+        for format in ('script', 'stripped', 'zipapp'):
+            commands[format] = os.path.join(tmp, format)
+            with open(commands[format], 'wb') as file:
+                file.write(generate['standalone'](format))
+        for name, command in commands.items():
+            os.chmod(command, 0o755)
+            run(command, SECRET)
+            elapsed = min(run(command, SECRET)[0] for _ in range(runs))
+            yield result(f'standalone-{name}', elapsed)
+
+
+def format_result(res):
+    value, unit = res['value'], res['unit']
+    if unit == 's':
+        value, unit = value * 1e6, 'us'
+    return f'{res["name"]:<40} {value:>12.3f} {unit}'
+
+
+def worse(unit):
+    """
+    A function of (baseline, value) giving how much worse value is, as
+    a fraction of the time taken: rates ('.../s') should go up, and all
+    other results down.
+    """
+    if unit.endswith('/s'):
+        return lambda old, new: old / new - 1
+    return lambda old, new: new / old - 1
+
+
+def compare(results, baseline, thresholds, default=0.1):
+    """
+    Yield (name, baseline value, value, regression) for each of results
+    more than its threshold worse than the result of the same name and
+    unit in baseline. thresholds maps names to fractions; other
+    results use default.
+
+    >>> baseline = [result('a', 1.0), result('b', 100, 'keys/s')]
+    >>> list(compare([result('a', 1.05), result('b', 80, 'keys/s')], baseline, {}))
+    [('b', 100, 80, 0.25)]
+    >>> list(compare([result('a', 1.5)], baseline, {'a': 0.6}))
+    []
+    """
+    before = {(res['name'], res['unit']): res['value'] for res in baseline}
+    for res in results:
+        old = before.get((res['name'], res['unit']))
+        if not old or not res['value']:
+            continue
+        regression = worse(res['unit'])(old, res['value'])
+        if regression > thresholds.get(res['name'], default):
+            yield res['name'], old, res['value'], regression
+
+
+def over_budget(results):
+    """
+    Yield (name, budget, value, overrun) for each of results worse than
+    its budget.
+
+    >>> list(over_budget([result('a', 0.02, budget=0.01), result('b', 0.5)]))
+    [('a', 0.01, 0.02, 1.0)]
+    """
+    for res in results:
+        budget = res.get('budget')
+        if budget is None:
+            continue
+        overrun = worse(res['unit'])(budget, res['value'])
+        if overrun > 0:
+            yield res['name'], budget, res['value'], overrun
+
+
+def parse_thresholds(values):
+    """
+    The default threshold and per-name thresholds from --threshold
+    values, each a fraction or name=fraction.
+
+    >>> parse_thresholds(['0.2', 'startup-cli=0.5'])
+    (0.2, {'startup-cli': 0.5})
+    """
+    default, thresholds = 0.1, {}
+    for value in values:
+        name, sep, fraction = value.rpartition('=')
+        if sep:
+            thresholds[name] = float(fraction)
+        else:
+            default = float(fraction)
+    return default, thresholds
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        'names',
+        nargs='*',
+        metavar='name',
+        help='benchmarks to run (default: all of %s)' % ', '.join(sorted(benchmarks)),
+    )
+    parser.add_argument(
+        '--json',
+        metavar='FILE',
+        help='also write the results as JSON to FILE (- for stdout only)',
+    )
+    parser.add_argument(
+        '--baseline',
+        metavar='FILE',
+        help='compare with results saved by --json, failing on regressions',
+    )
+    parser.add_argument(
+        '--threshold',
+        action='append',
+        default=[],
+        metavar='[NAME=]FRACTION',
+        help='allowed slowdown against the baseline, for all results or '
+        'only NAME (default: 0.1); may be repeated',
+    )
+    args = parser.parse_args(args)
+    unknown = set(args.names) - set(benchmarks)
+    if unknown:
+        parser.error('unknown benchmark(s): %s' % ', '.join(sorted(unknown)))
+    try:
+        default, thresholds = parse_thresholds(args.threshold)
+    except ValueError as e:
+        parser.error(f'invalid --threshold: {e}')
+    baseline = _load_baseline(parser, args.baseline) if args.baseline else []
+    report = sys.stderr if args.json == '-' else sys.stdout
+    results = []
+    for name in args.names or sorted(benchmarks):
+        for res in benchmarks[name]():
+            results.append(res)
+            print(format_result(res), file=report, flush=True)
+    if args.json:
+        _write_json(args.json, results)
+    failed = False
+    for name, old, new, regression in compare(results, baseline, thresholds, default):
+        print(
+            f'regression: {name} {old:.6g} -> {new:.6g} '
+            f'({regression:+.1%}, over {thresholds.get(name, default):.0%})',
+            file=sys.stderr,
+        )
+        failed = True
+    for name, budget, value, overrun in over_budget(results):
+        print(
+            f'over budget: {name} {value:.6g} ({overrun:+.1%} on {budget:.6g})',
+            file=sys.stderr,
+        )
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+def _load_baseline(parser, path):
+    import json
+
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)['results']
+    except (OSError, ValueError, KeyError) as e:
+        parser.error(f'cannot read baseline {path}: {e}')
+
+
+def _write_json(path, results):
+    import json
+    import platform
+
+    doc = dict(python=sys.version, platform=platform.platform(), results=results)
+    if path == '-':
+        json.dump(doc, sys.stdout, indent=2)
+        print()
+    else:
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(doc, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+A bounded, thread-safe cache of generated codes that expires entries
+when their time step ends.
+
+>>> cache = CodeCache(maxsize=2)
+>>> cache.generate_otp('MZXW6YTBOJUWU23MNU', 52276810, now=52276810 * 30)
+'487656'
+>>> cache.generate_otp('mzxw 6ytb ojuw u23m nu', 52276810, now=52276810 * 30)
+'487656'
+>>> cache.cache_info()
+CacheInfo(hits=1, misses=1, evictions=0, expirations=0, maxsize=2, currsize=1)
+"""
+
+import collections
+import hashlib
+import os
+import threading
+import time
+from typing import NamedTuple
+
+import oathtool
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    maxsize: int
+    currsize: int
+
+
+class CodeCache:
+    """
+    An LRU cache of codes keyed by (key fingerprint, digest, counter).
+
+    Secrets are never stored; entries are keyed by a salted BLAKE2
+    fingerprint of the normalized secret, with a salt private to this
+    cache. An entry expires as soon as the time step for its counter
+    has passed, and the least recently used entry is evicted when the
+    cache holds maxsize entries.
+    """
+
+    def __init__(self, maxsize=4096, period=30):
+        self.maxsize = maxsize
+        self.period = period
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._salt = os.urandom(16)
+        self._step = None
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def fingerprint(self, key):
+        """A salted digest identifying key, whatever its spacing or case."""
+        normalized = oathtool.clean(key).upper().rstrip('=').encode()
+        return hashlib.blake2b(normalized, key=self._salt, digest_size=16).digest()
+
+    def generate_otp(self, key, hotp_value=None, digest=hashlib.sha1, now=None):
+        """
+        As oathtool.generate_otp, answering from the cache where possible.
+        Codes for counters whose time step has already passed are
+        computed but not cached.
+        """
+        step = int((time.time() if now is None else now) / self.period)
+        counter = hotp_value or step
+        entry = self.fingerprint(key), digest().name, counter
+        with self._lock:
+            self._expire(step)
+            try:
+                code = self._entries[entry]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(entry)
+                return code
+        code = oathtool.OTPKey(key).hotp(counter, digest)
+        if counter >= step:
+            with self._lock:
+                self._store(entry, code)
+        return code
+
+    def _store(self, entry, code):
+        self._entries[entry] = code
+        self._entries.move_to_end(entry)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _expire(self, step):
+        """Drop entries for steps before step, once per step rollover."""
+        if step == self._step:
+            return
+        self._step = step
+        stale = [entry for entry in self._entries if entry[2] < step]
+        for entry in stale:
+            del self._entries[entry]
+        self.expirations += len(stale)
+
+    def cache_info(self):
+        with self._lock:
+            return CacheInfo(
+                self.hits,
+                self.misses,
+                self.evictions,
+                self.expirations,
+                self.maxsize,
+                len(self._entries),
+            )
+
+    def cache_clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
@@ -0,0 +1,95 @@
+"""
+A blocking client for the OTP daemon (see ``oathtool.daemon``).
+
+Kept apart from the daemon, and light on imports, so that asking a
+running daemon for a code costs less than computing it in-process.
+"""
+
+import hashlib
+import socket
+
+import oathtool
+
+
+class Client:
+    """
+    A blocking client for a running daemon, reusing one connection.
+    Raises OSError if no daemon is listening at path.
+    """
+
+    def __init__(self, path, timeout=1.0):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(path)
+        except OSError:
+            self.sock.close()
+            raise
+        self.file = self.sock.makefile('rwb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def request(self, *words):
+        """
+        Send one request; return the result or raise ValueError. Words
+        may not contain whitespace, which would split them, or a
+        newline, which would start another request.
+        """
+        words = [str(word) for word in words]
+        for word in words:
+            if not word or word.split() != [word]:
+                raise ValueError(f'invalid request word: {word!r}')
+        self.file.write(' '.join(words).encode() + b'\n')
+        self.file.flush()
+        response = self.file.readline().decode().rstrip('\n')
+        if not response:
+            raise ConnectionError('daemon closed the connection')
+        status, _, result = response.partition(' ')
+        if status == 'ERR':
+            raise ValueError(result)
+        return result if status == 'OK' else None
+
+    def code(self, label, counter=None):
+        extra = () if counter is None else (counter,)
+        return self.request('CODE', label, *extra)
+
+    def verify(self, label, code):
+        """The matching counter, or None."""
+        result = self.request('VERIFY', label, code)
+        return None if result is None else int(result)
+
+    def generate_otp(self, key, digest=hashlib.sha1):
+        return self.request('KEY', digest().name, oathtool.clean(key))
+
+    def add(self, label, secret):
+        self.request('ADD', label, secret)
+
+    def delete(self, label):
+        self.request('DEL', label)
+
+    def export(self, label):
+        """The Base32 secret for label, if the daemon allows export."""
+        return self.request('EXPORT', label)
+
+    def labels(self):
+        return self.request('LABELS').split()
+
+
+def generate_otp(key, path, digest=hashlib.sha1):
+    """
+    The current code for key from the daemon at path, or computed
+    in-process if no daemon is running there.
+    """
+    try:
+        with Client(path) as client:
+            return client.generate_otp(key, digest)
+    except OSError:
+        return oathtool.generate_otp(key, digest=digest)
@@ -0,0 +1,316 @@
+"""
+Keys sharded across several daemons (see ``oathtool.daemon``) by
+consistent hashing on their labels, for fleets too big for one process.
+
+Each label belongs to the node whose point follows the label's hash on
+a ring where every node has ``replicas`` virtual points, so keys spread
+evenly and adding or removing a node moves only the keys it gains or
+loses: about 1/N of them, rather than nearly all as with ``hash % N``.
+
+>>> ring = HashRing(['a.sock', 'b.sock', 'c.sock'])
+>>> labels = [f'user{n}' for n in range(3000)]
+>>> before = {label: ring.node_for(label) for label in labels}
+>>> ring.add('d.sock')
+>>> moved = [label for label in labels if ring.node_for(label) != before[label]]
+>>> {ring.node_for(label) for label in moved}
+{'d.sock'}
+
+A Cluster routes requests to the daemon owning each key, and moves keys
+(with the daemons' ``EXPORT``, ``ADD`` and ``DEL`` commands) as nodes
+come and go, so its daemons must be started with ``--allow-export``.
+To run a whole cluster of local worker processes::
+
+    $ python -m oathtool.cluster /run/oathtool --nodes 4 --keys secrets.txt
+
+Available on Unix only.
+"""
+
+import argparse
+import base64
+import bisect
+import contextlib
+import hashlib
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import oathtool
+from oathtool import daemon
+
+
+def _point(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'big')
+
+
+def _valid_label(label):
+    # labels are single words in the daemon protocol
+    return bool(label) and label.split() == [label]
+
+
+class HashRing:
+    """
+    A consistent-hash ring of nodes (any strings, such as socket paths),
+    each placed at replicas virtual points.
+    """
+
+    def __init__(self, nodes=(), replicas=100):
+        self.replicas = replicas
+        self.points = []
+        self.owners = []
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self):
+        return sorted(set(self.owners))
+
+    def __len__(self):
+        return len(self.points) // self.replicas
+
+    def __contains__(self, node):
+        return node in self.owners
+
+    def add(self, node):
+        if node in self:
+            raise ValueError(f'node already in ring: {node}')
+        for replica in range(self.replicas):
+            point = _point(f'{node}#{replica}')
+            index = bisect.bisect(self.points, point)
+            self.points.insert(index, point)
+            self.owners.insert(index, node)
+
+    def remove(self, node):
+        if node not in self:
+            raise ValueError(f'node not in ring: {node}')
+        kept = [(p, n) for p, n in zip(self.points, self.owners) if n != node]
+        self.points = [point for point, _ in kept]
+        self.owners = [owner for _, owner in kept]
+
+    def node_for(self, label):
+        """The node owning label."""
+        if not self.points:
+            raise LookupError('no nodes in ring')
+        index = bisect.bisect(self.points, _point(label)) % len(self.points)
+        return self.owners[index]
+
+
+class Cluster:
+    """
+    A client for keys spread over the daemons listening at nodes (Unix
+    socket paths), routing each request by label. Like
+    ``daemon.Client``, it holds one connection per node and is not
+    thread-safe.
+    """
+
+    def __init__(self, nodes, replicas=100, timeout=1.0):
+        self.ring = HashRing(nodes, replicas)
+        self.timeout = timeout
+        self.clients = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        while self.clients:
+            self.clients.popitem()[1].close()
+
+    def client(self, node):
+        try:
+            return self.clients[node]
+        except KeyError:
+            client = self.clients[node] = daemon.Client(node, self.timeout)
+            return client
+
+    def owner(self, label):
+        """The client for the node owning label."""
+        return self.client(self.ring.node_for(label))
+
+    def load(self, lines):
+        """
+        Add the keys in an iterable of key list lines (see
+        oathtool.decode_keys) to their nodes; return the invalid lines,
+        including those with labels the daemons cannot hold, as
+        (lineno, label, reason).
+        """
+        invalid = []
+
+        def checked(lines):
+            for lineno, line in enumerate(lines, 1):
+                label, secret = oathtool.parse_key_line(line)
+                if secret and label is not None and not _valid_label(label):
+                    invalid.append((lineno, label, 'Invalid label'))
+                    yield ''
+                else:
+                    yield line
+
+        keys, rejected = oathtool.decode_keys(checked(lines))
+        for label, key in keys.items():
+            self.add(label, base64.b32encode(key).decode())
+        return sorted(invalid + rejected)
+
+    def add(self, label, secret):
+        if not _valid_label(label):
+            raise ValueError(f'invalid label: {label!r}')
+        self.owner(label).add(label, secret)
+
+    def delete(self, label):
+        self.owner(label).delete(label)
+
+    def code(self, label, counter=None):
+        return self.owner(label).code(label, counter)
+
+    def verify(self, label, code):
+        """The matching counter, or None."""
+        return self.owner(label).verify(label, code)
+
+    def labels(self):
+        """The labels held by each node."""
+        return {node: self.client(node).labels() for node in self.ring.nodes}
+
+    def _move(self, label, source):
+        # add before deleting, so that a failure leaves the key on the
+        # source (or on both) rather than on neither
+        self.owner(label).add(label, source.export(label))
+        source.delete(label)
+
+    def add_node(self, node):
+        """
+        Add the daemon at node to the ring and move to it the keys it
+        now owns; return how many moved. If the daemon does not answer,
+        the ring is left as it was; if a move fails, the keys already
+        moved are moved back and the node is dropped again.
+        """
+        if node in self.ring:
+            raise ValueError(f'node already in ring: {node}')
+        self.client(node).request('PING')
+        holdings = self.labels()
+        self.ring.add(node)
+        moved = []
+        try:
+            for old, labels in holdings.items():
+                for label in labels:
+                    if self.ring.node_for(label) == node:
+                        self._move(label, self.client(old))
+                        moved.append((label, node))
+        except BaseException:
+            self.ring.remove(node)
+            self._undo(moved)
+            raise
+        return len(moved)
+
+    def remove_node(self, node):
+        """
+        Move the keys held by the daemon at node to their new owners and
+        drop it from the ring; return how many moved. If a move fails,
+        the keys already moved are moved back and the node is restored.
+        """
+        if node in self.ring and len(self.ring) == 1:
+            raise ValueError(f'cannot remove {node}: its keys have nowhere to go')
+        source = self.client(node)
+        labels = source.labels()
+        self.ring.remove(node)
+        moved = []
+        try:
+            for label in labels:
+                self._move(label, source)
+                moved.append((label, self.ring.node_for(label)))
+        except BaseException:
+            self.ring.add(node)
+            self._undo(moved)
+            raise
+        self.clients.pop(node).close()
+        return len(labels)
+
+    def _undo(self, moved):
+        # return keys moved by a failed add_node or remove_node, now
+        # that the ring is restored, from the nodes now holding them
+        for label, holder in reversed(moved):
+            self._move(label, self.client(holder))
+
+
+@contextlib.contextmanager
+def workers(paths, digest='sha1', window=1, timeout=5.0):
+    """
+    Run an ``oathtool serve`` process, with no keys, on each socket
+    path; yield once all of them answer, and stop them on exit.
+    """
+    procs = []
+    try:
+        for path in paths:
+            command = [sys.executable, '-m', 'oathtool', 'serve', path]
+            command += ['--digest', digest, '--window', str(window), '--allow-export']
+            procs.append(subprocess.Popen(command, stderr=subprocess.DEVNULL))
+        deadline = time.monotonic() + timeout
+        for path in paths:
+            while True:
+                try:
+                    with daemon.Client(path) as client:
+                        client.request('PING')
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f'worker did not start: {path}') from None
+                    time.sleep(0.02)
+        yield
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m oathtool.cluster',
+        description='Serve keys sharded over local worker daemons',
+    )
+    parser.add_argument('directory', help='where to create the worker sockets')
+    parser.add_argument(
+        '--nodes',
+        type=int,
+        default=os.cpu_count() or 1,
+        metavar='N',
+        help='number of worker daemons (default: one per CPU)',
+    )
+    parser.add_argument(
+        '--keys',
+        type=argparse.FileType('r'),
+        help='key list, one "label<TAB>secret" per line',
+    )
+    parser.add_argument(
+        '--digest',
+        choices=sorted(oathtool.digests),
+        default='sha1',
+        help='Hash algorithm for HMAC (default: sha1)',
+    )
+    parser.add_argument(
+        '--window',
+        type=int,
+        default=1,
+        help='time steps either side of now accepted by VERIFY (default: 1)',
+    )
+    args = parser.parse_args(args)
+    if args.nodes < 1:
+        parser.error('--nodes must be at least 1')
+    os.makedirs(args.directory, exist_ok=True)
+    paths = [os.path.join(args.directory, f'node{n}.sock') for n in range(args.nodes)]
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    with contextlib.suppress(KeyboardInterrupt):
+        with workers(paths, args.digest, args.window), Cluster(paths) as cluster:
+            with args.keys or contextlib.nullcontext(()) as lines:
+                for lineno, label, reason in cluster.load(lines):
+                    print(f'line {lineno}: {reason}', file=sys.stderr)
+            for node, labels in cluster.labels().items():
+                print(f'{node}\t{len(labels)} keys')
+            sys.stdout.flush()
+            signal.pause()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Persistent HOTP counters, shared safely between processes.
+
+A counter file holds a fixed-size record per slot (a signed 64-bit
+counter) after a short header, and is used through mmap. Each operation
+takes a POSIX record lock (``fcntl.lockf``) on just the bytes of its
+slot, so processes using different slots never contend, and an update
+is a read and a write of eight mapped bytes rather than a rewrite of
+the file.
+
+>>> import tempfile
+>>> import oathtool
+>>> key = oathtool.OTPKey('GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ')
+>>> with tempfile.TemporaryDirectory() as tmp:
+...     with CounterStore(os.path.join(tmp, 'counters'), slots=2) as store:
+...         [store.hotp(1, key), store.hotp(1, key), store.get(1), store.get(0)]
+['755224', '287082', 2, 0]
+
+POSIX record locks belong to the process, not to a file descriptor:
+within one process, use a single CounterStore per file (it serializes
+its own threads), since closing any descriptor for the file releases
+the process's locks on it. Available on Unix only.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+MAGIC = b'OATHCTR1'
+header = struct.Struct('<8s8x')
+record = struct.Struct('<q')
+
+
+class CounterStore:
+    """
+    The HOTP counters in the file at path, which is created if missing
+    and grown to hold at least slots counters, each starting at 0.
+    """
+
+    def __init__(self, path, slots=1):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._lock = threading.Lock()
+        self.map = None
+        try:
+            with self._locked(0, header.size):
+                self._init(slots)
+            self._remap()
+        except BaseException:
+            os.close(self.fd)
+            raise
+
+    def _init(self, slots):
+        size = os.fstat(self.fd).st_size
+        if not size:
+            os.pwrite(self.fd, header.pack(MAGIC), 0)
+            size = header.size
+        elif os.pread(self.fd, len(MAGIC), 0) != MAGIC or size < header.size:
+            raise ValueError(f'{self.path} is not an oathtool counter file')
+        wanted = header.size + slots * record.size
+        if size < wanted:
+            os.ftruncate(self.fd, wanted)
+
+    def _remap(self):
+        if self.map is not None:
+            self.map.close()
+        self.map = mmap.mmap(self.fd, 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+            os.close(self.fd)
+
+    def __len__(self):
+        """The number of slots."""
+        return (len(self.map) - header.size) // record.size
+
+    @contextlib.contextmanager
+    def _locked(self, offset, length):
+        with self._lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, length, offset, os.SEEK_SET)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, length, offset, os.SEEK_SET)
+
+    @contextlib.contextmanager
+    def _slot(self, slot):
+        """Lock slot and yield its offset in the map."""
+        if slot < 0:
+            raise IndexError(slot)
+        offset = header.size + slot * record.size
+        with self._locked(offset, record.size):
+            if offset + record.size > len(self.map):
+                # another process may have grown the file
+                self._remap()
+                if offset + record.size > len(self.map):
+                    raise IndexError(slot)
+            yield offset
+
+    def get(self, slot):
+        """The current counter in slot."""
+        with self._slot(slot) as offset:
+            return record.unpack_from(self.map, offset)[0]
+
+    def set(self, slot, counter):
+        with self._slot(slot) as offset:
+            record.pack_into(self.map, offset, counter)
+
+    def increment(self, slot, step=1):
+        """Advance the counter in slot by step; return its previous value."""
+        with self._slot(slot) as offset:
+            (counter,) = record.unpack_from(self.map, offset)
+            record.pack_into(self.map, offset, counter + step)
+        return counter
+
+    def hotp(self, slot, key, digest=hashlib.sha1):
+        """The code for the OTPKey key at the counter in slot, then advance it."""
+        return key.hotp(self.increment(slot), digest)
+
+    def verify(self, slot, key, code, window=1, digest=hashlib.sha1):
+        """
+        Verify code for the OTPKey key at the counter in slot or up to
+        window counters ahead (RFC 4226 look-ahead). On a match, move
+        the counter past the matching one and return it; otherwise
+        return None and leave the counter as it was.
+        """
+        with self._slot(slot) as offset:
+            (counter,) = record.unpack_from(self.map, offset)
+            matched = key.verify(
+                code, counter, window, last_used_counter=counter - 1, digest=digest
+            )
+            if matched is not None:
+                record.pack_into(self.map, offset, matched + 1)
+        return matched
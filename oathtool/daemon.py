@@ -0,0 +1,321 @@
+"""
+A long-lived OTP daemon answering requests over a Unix domain socket,
+so that frequent callers pay the interpreter startup and key decoding
+only once.
+
+Start it with a key list (see ``oathtool.parse_key_line``)::
+
+    $ oathtool serve /run/oathtool.sock --keys secrets.txt
+
+Each request is one line; each response is one line, either ``OK``
+followed by a result, or ``ERR`` followed by a message:
+
+``CODE label [counter]``
+    The code for a loaded key at counter (default: now).
+``VERIFY label code``
+    ``OK counter`` for the counter that matched, or ``FAIL``.
+``KEY digest secret``
+    The current code for an ad-hoc secret, using digest
+    (``sha1``, ``sha256`` or ``sha512``).
+``ADD label secret``
+    Load (or replace) a key.
+``DEL label``
+    Unload a key.
+``EXPORT label``
+    ``OK`` followed by the key's secret in Base32, so that it can be
+    loaded elsewhere. Refused unless the daemon was started with
+    ``--allow-export``.
+``LABELS``
+    ``OK`` followed by the labels of the loaded keys.
+``PING``
+    ``OK``, to check the daemon is alive.
+
+Labels may not contain spaces. ``ADD``, ``EXPORT``, ``DEL`` and
+``LABELS`` let ``oathtool.cluster`` move keys between daemons.
+
+The socket is created with mode 0600, so only its owner (and root) can
+connect: a client can load and unload keys and, with ``--allow-export``,
+read them back. Put the socket in a directory only the daemon's users
+can reach to share it more widely.
+
+Connections are served by a single asyncio event loop, so thousands of
+concurrent clients cost no more than a few kilobytes each. Clients live
+in ``oathtool.client`` (and are importable from here too).
+"""
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import hashlib
+import os
+import signal
+import socket
+import stat
+import sys
+import time
+
+import oathtool
+from oathtool.client import Client, generate_otp  # noqa: F401
+
+
+class Server:
+    """
+    Answers protocol lines for a set of labeled keys.
+
+    >>> server = Server.from_lines(['demo\\tGEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'])
+    >>> server.handle_line('CODE demo 1')
+    'OK 287082'
+    >>> server.handle_line('VERIFY demo 359152', now=60)
+    'OK 2'
+    >>> server.handle_line('CODE nobody')
+    'ERR unknown label: nobody'
+    """
+
+    def __init__(self, keys=(), digest=hashlib.sha1, window=1, period=30, export=False):
+        self.keys = dict(keys)
+        self.digest = digest
+        self.window = window
+        self.period = period
+        self.export = export
+
+    @classmethod
+    def from_lines(cls, lines, **kwargs):
+        """Load a key list; invalid secrets raise ValueError."""
+        keys = {}
+        for lineno, line in enumerate(lines, 1):
+            label, secret = oathtool.parse_key_line(line)
+            if secret:
+                keys[label or str(lineno)] = oathtool.OTPKey(secret)
+        return cls(keys, **kwargs)
+
+    def handle_line(self, line, now=None):
+        command, _, rest = line.strip().partition(' ')
+        handler = getattr(self, 'cmd_' + command.lower(), None)
+        if handler is None:
+            return f'ERR unknown command: {command}'
+        try:
+            return handler(rest, time.time() if now is None else now)
+        except (ValueError, TypeError) as e:
+            return f'ERR {str(e).splitlines()[0]}'
+
+    def lookup(self, label):
+        try:
+            return self.keys[label]
+        except KeyError:
+            raise ValueError(f'unknown label: {label}') from None
+
+    def cmd_ping(self, rest, now):
+        return 'OK'
+
+    def cmd_code(self, rest, now):
+        label, _, counter = rest.partition(' ')
+        counter = int(counter) if counter else int(now / self.period)
+        if not 0 <= counter < 2**63:
+            raise ValueError(f'counter out of range: {counter}')
+        return 'OK ' + self.lookup(label).hotp(counter, self.digest)
+
+    def cmd_verify(self, rest, now):
+        label, _, code = rest.partition(' ')
+        counter = self.lookup(label).verify(
+            code, int(now / self.period), self.window, digest=self.digest
+        )
+        return 'FAIL' if counter is None else f'OK {counter}'
+
+    def cmd_add(self, rest, now):
+        label, _, secret = rest.partition(' ')
+        if not label or not secret:
+            raise ValueError('usage: ADD label secret')
+        self.keys[label] = oathtool.OTPKey(secret)
+        return 'OK'
+
+    def cmd_del(self, rest, now):
+        self.lookup(rest)
+        del self.keys[rest]
+        return 'OK'
+
+    def cmd_export(self, rest, now):
+        if not self.export:
+            raise ValueError('EXPORT is disabled; start with --allow-export')
+        key = self.lookup(rest)
+        return 'OK ' + base64.b32encode(key.key).decode().rstrip('=')
+
+    def cmd_labels(self, rest, now):
+        return ' '.join(['OK', *self.keys])
+
+    def cmd_key(self, rest, now):
+        name, _, secret = rest.partition(' ')
+        if name not in oathtool.digests:
+            raise ValueError(f'unsupported digest: {name}')
+        key = oathtool.OTPKey(secret)
+        return 'OK ' + key.totp(now, oathtool.digests[name], self.period)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await _readline(reader)
+                except ValueError as e:
+                    response = f'ERR {e}'
+                else:
+                    if not line:
+                        break
+                    response = self.handle_line(line.decode('utf-8', 'replace'))
+                writer.write(response.encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, path, ready=None):
+        """
+        Serve on the Unix socket at path until cancelled. A stale socket
+        left at path is replaced, but anything else there, including the
+        socket of a running daemon, is refused with FileExistsError.
+        """
+        _claim(path)
+        server = await asyncio.start_unix_server(
+            self.handle, sock=_bind(path), backlog=1024
+        )
+        created = os.stat(path)
+        try:
+            async with server:
+                if ready is not None:
+                    ready()
+                await server.serve_forever()
+        finally:
+            _release(path, created)
+
+
+async def _readline(reader):
+    """
+    The next line from reader, or b'' at the end. A line longer than
+    the reader's limit is discarded through its newline, then reported
+    with ValueError, so the connection stays usable.
+    """
+    try:
+        return await reader.readuntil(b'\n')
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+    except asyncio.LimitOverrunError:
+        pass
+    while True:
+        try:
+            await reader.readuntil(b'\n')
+            break
+        except asyncio.LimitOverrunError as e:
+            await reader.readexactly(e.consumed)
+        except asyncio.IncompleteReadError:
+            break
+    raise ValueError('line too long')
+
+
+def _claim(path):
+    """Make way for a new socket at path, removing only a stale socket."""
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f'{path} exists and is not a socket')
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise FileExistsError(f'a daemon is already listening on {path}')
+
+
+def _bind(path):
+    """A Unix socket bound at path, with mode 0600."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        # the mode is set as the socket is created, leaving no window in
+        # which others could connect
+        umask = os.umask(0o177)
+        try:
+            sock.bind(path)
+        finally:
+            os.umask(umask)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def _release(path, created):
+    """Remove the socket at path, if it is still the one created."""
+    with contextlib.suppress(OSError):
+        current = os.lstat(path)
+        if (current.st_dev, current.st_ino) == (created.st_dev, created.st_ino):
+            os.unlink(path)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog='oathtool serve',
+        description='Serve OTP codes over a Unix domain socket',
+    )
+    parser.add_argument('socket', help='path of the Unix socket to listen on')
+    parser.add_argument(
+        '--keys',
+        type=argparse.FileType('r'),
+        help='key list, one "label<TAB>secret" per line',
+    )
+    parser.add_argument(
+        '--sha256',
+        action='store_const',
+        dest='digest',
+        const='sha256',
+        help='Use SHA256 instead of SHA1 for HMAC (same as --digest sha256)',
+    )
+    parser.add_argument(
+        '--digest',
+        choices=sorted(oathtool.digests),
+        help='Hash algorithm for HMAC (default: sha1)',
+    )
+    parser.set_defaults(digest='sha1')
+    parser.add_argument(
+        '--window',
+        type=int,
+        default=1,
+        help='time steps either side of now accepted by VERIFY (default: 1)',
+    )
+    parser.add_argument(
+        '--allow-export',
+        action='store_true',
+        help='answer EXPORT requests with the secrets of loaded keys',
+    )
+    args = parser.parse_args(args)
+    digest = oathtool.digests[args.digest]
+    try:
+        with args.keys or contextlib.nullcontext(()) as lines:
+            server = Server.from_lines(
+                lines, digest=digest, window=args.window, export=args.allow_export
+            )
+    except ValueError as e:
+        parser.exit(1, f'Error: {e}\n')
+    print(
+        f'oathtool: serving {len(server.keys)} keys on {args.socket}', file=sys.stderr
+    )
+    try:
+        with contextlib.suppress(KeyboardInterrupt, asyncio.CancelledError):
+            asyncio.run(_serve_until_terminated(server, args.socket))
+    except OSError as e:
+        parser.exit(1, f'Error: {e}\n')
+
+
+async def _serve_until_terminated(server, path):
+    # let SIGTERM unwind serve() so the socket file is removed
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, asyncio.current_task().cancel
+    )
+    await server.serve(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Per-key clock-drift tracking for TOTP verification.
+
+Following RFC 6238 section 6, the tracker remembers, for each key, the
+offset in time steps at which its last code matched, and checks that
+offset first on the next verification. Only when that check misses does
+it search the usual verification window around the current step,
+nearest steps first, so a client whose clock is put right is accepted
+again. Well-behaved and consistently skewed clients alike then cost
+about one HMAC per verification.
+
+Keys are identified by small integer ids (such as row numbers of a key
+list) and each offset takes one byte, so the offsets for ten million
+keys fit in ten megabytes and can be saved and loaded as a flat file.
+
+>>> key = oathtool.OTPKey('GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ')
+>>> tracker = DriftTracker()
+>>> tracker.verify(0, key, key.hotp(12), t=10 * 30, window=2)
+12
+>>> tracker.offset(0)
+2
+>>> tracker.verify(0, key, key.hotp(22), t=20 * 30, window=0)
+22
+"""
+
+import array
+import hashlib
+import hmac
+import itertools
+import time
+
+import oathtool
+
+
+class DriftTracker:
+    """
+    The last matching offset, in time steps, of each key id.
+
+    Offsets are clamped to +/- max_drift (at most 127, the range of a
+    signed byte).
+    """
+
+    def __init__(self, offsets=(), max_drift=127):
+        self.offsets = array.array('b', offsets)
+        self.max_drift = min(max_drift, 127)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def offset(self, key_id):
+        """The recorded offset for key_id, or 0 if none."""
+        return self.offsets[key_id] if key_id < len(self.offsets) else 0
+
+    def record(self, key_id, offset):
+        offset = max(-self.max_drift, min(self.max_drift, offset))
+        if key_id >= len(self.offsets):
+            self.offsets.frombytes(bytes(key_id + 1 - len(self.offsets)))
+        self.offsets[key_id] = offset
+
+    def verify(
+        self,
+        key_id,
+        key,
+        code,
+        window=1,
+        last_used_counter=None,
+        digest=hashlib.sha1,
+        t=None,
+        period=30,
+    ):
+        """
+        Verify code for the OTPKey key, checking the step at the recorded
+        offset for key_id first and then up to window steps around the
+        current step. On a match, record the new offset and return the
+        counter; otherwise return None.
+        """
+        if t is None:
+            t = time.time()
+        if not isinstance(code, str):
+            code = '%06d' % code
+        if not (code.isascii() and code.isdigit()):
+            return None
+        counter = int(t / period)
+        expected = counter + self.offset(key_id)
+        nominal = (c for c in oathtool.search_order(counter, window) if c != expected)
+        for candidate in itertools.chain([expected], nominal):
+            if last_used_counter is not None and candidate <= last_used_counter:
+                continue
+            if hmac.compare_digest(key.hotp(candidate, digest), code):
+                self.record(key_id, candidate - counter)
+                return candidate
+        return None
+
+    def save(self, file):
+        """Write the offsets to a binary file object."""
+        self.offsets.tofile(file)
+
+    @classmethod
+    def load(cls, file, **kwargs):
+        """Read offsets previously written by save."""
+        return cls(file.read(), **kwargs)
@@ -0,0 +1,119 @@
+"""
+A compact in-memory container for very many decoded secrets.
+
+Rather than one Python object per key, a KeyFleet packs every decoded key into a single bytearray, located by an
+``array('I')`` of offsets and an ``array('H')`` of lengths. A key costs
+its raw bytes plus six, so a million 20-byte secrets take about 27 MB
+against roughly 90 MB as a list of the same secrets in Base32 (see
+``python -m oathtool.bench fleet``).
+
+Keys are identified by the id returned from ``add``. Ids stay stable:
+removing a key leaves a hole that is reclaimed by compacting the buffer
+once holes outweigh live keys, without renumbering.
+
+>>> fleet = KeyFleet(['GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ', 'MZXW6YTBOJUWU23MNU'])
+>>> fleet.codes_at(52276810)
+['701432', '487656']
+>>> fleet.remove(0)
+>>> fleet.codes_at(52276810)
+[None, '487656']
+>>> list(fleet.verify_many([(1, '487656'), (1, '000000')], 52276810))
+[52276810, None]
+"""
+
+import array
+import hashlib
+
+import oathtool
+
+DEAD = 0xFFFFFFFF
+"""Offset marking a removed key."""
+
+
+class KeyFleet:
+    """
+    Decoded secrets packed into one buffer, built from an iterable of
+    Base32 secrets.
+    """
+
+    def __init__(self, secrets=()):
+        self.data = bytearray()
+        self.offsets = array.array('I')
+        self.lengths = array.array('H')
+        self.removed = 0
+        self.garbage = 0
+        for secret in secrets:
+            self.add(secret)
+
+    def __len__(self):
+        """The number of live keys."""
+        return len(self.offsets) - self.removed
+
+    def add(self, secret):
+        """Add a Base32 secret; return its id."""
+        return self.add_bytes(oathtool.decode_key(secret))
+
+    def add_bytes(self, key):
+        """Add an already decoded secret; return its id."""
+        self.offsets.append(len(self.data))
+        self.lengths.append(len(key))
+        self.data += key
+        return len(self.offsets) - 1
+
+    def __contains__(self, key_id):
+        return 0 <= key_id < len(self.offsets) and self.offsets[key_id] != DEAD
+
+    def key(self, key_id):
+        """The decoded secret for key_id."""
+        if key_id not in self:
+            raise KeyError(key_id)
+        offset = self.offsets[key_id]
+        return bytes(self.data[offset : offset + self.lengths[key_id]])
+
+    def remove(self, key_id):
+        """Remove a key, compacting the buffer if it is mostly holes."""
+        if key_id not in self:
+            raise KeyError(key_id)
+        self.offsets[key_id] = DEAD
+        self.removed += 1
+        self.garbage += self.lengths[key_id]
+        if self.garbage * 2 > len(self.data):
+            self.compact()
+
+    def compact(self):
+        """Rewrite the buffer without the bytes of removed keys."""
+        data = bytearray()
+        view = memoryview(self.data)
+        for key_id, offset in enumerate(self.offsets):
+            if offset != DEAD:
+                self.offsets[key_id] = len(data)
+                data += view[offset : offset + self.lengths[key_id]]
+        view.release()
+        self.data = data
+        self.garbage = 0
+
+    def codes_at(self, counter, digest=hashlib.sha1):
+        """
+        The code of every key at counter, indexed by id (None for
+        removed keys), with the current HMAC backend (see
+        oathtool.hmac_backend).
+        """
+        msg = oathtool._counter.pack(counter)
+        backend = oathtool.hmac_backends[oathtool.hmac_backend()]
+        truncate = oathtool.truncate
+        data = self.data
+        return [
+            None
+            if offset == DEAD
+            else truncate(backend(data[offset : offset + length], digest)(msg))
+            for offset, length in zip(self.offsets, self.lengths)
+        ]
+
+    def verify_many(self, attempts, counter, window=0, digest=hashlib.sha1):
+        """
+        For each (key_id, code) in attempts, yield the counter within
+        window steps of counter at which the code matched, or None.
+        """
+        for key_id, code in attempts:
+            key = oathtool.OTPKey.from_bytes(self.key(key_id))
+            yield key.verify(code, counter, window, digest=digest)
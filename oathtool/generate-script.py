@@ -1,4 +1,10 @@
 import argparse
+import ast
+import importlib.util
+import io
+import marshal
+import sys
+import zipfile
 
 try:
     from importlib.resources import files  # type: ignore[attr-defined, unused-ignore]
@@ -8,20 +14,79 @@ except ImportError:  # pragma: nocover
 import autocommand
 import path
 
+import oathtool
+
 parser = argparse.ArgumentParser()
 parser.add_argument('target', nargs='?', type=path.Path, default=path.Path('oathtool'))
+parser.add_argument(
+    '--format',
+    choices=['script', 'stripped', 'zipapp'],
+    default='script',
+    help='script: the module source as is (default); stripped: without '
+    'docstrings and with the version fixed at build time; zipapp: the '
+    'stripped module, precompiled for this Python',
+)
+
+hook = '__name__ == "__main__" and main()'
+
+
+def strip(code, version):
+    """
+    The module code without docstrings, and with get_version returning
+    version rather than looking up the installed package.
+    """
+    tree = ast.parse(code)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.FunctionDef) and node.name == 'get_version':
+            node.body = [ast.Return(ast.Constant(version))]
+        body = getattr(node, 'body', None)
+        if not isinstance(body, list):
+            continue
+        node.body = [
+            stmt
+            for stmt in body
+            if not (
+                isinstance(stmt, ast.Expr)
+                and isinstance(stmt.value, ast.Constant)
+                and isinstance(stmt.value.value, str)
+            )
+        ] or [ast.Pass()]
+    return ast.unparse(tree)
+
+
+def zipapp(code):
+    """
+    A zipapp, as bytes, holding code precompiled to __main__.pyc for
+    the running interpreter, which its shebang names. Members are
+    stored uncompressed so that loading needs no zlib.
+    """
+    compiled = compile(code, '__main__.py', 'exec', optimize=2)
+    # magic, flags, mtime and size; a zero mtime means no source to check
+    pyc = importlib.util.MAGIC_NUMBER + bytes(12) + marshal.dumps(compiled)
+    archive = io.BytesIO()
+    archive.write(f'#!{sys.executable}\n'.encode())
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zf:
+        zf.writestr('__main__.pyc', pyc)
+    return archive.getvalue()
+
+
+def standalone(format='script'):
+    """The bytes of a standalone oathtool in format (see --format)."""
+    code = (files('oathtool') / '__init__.py').read_text()
+    if format != 'script':
+        code = strip(code, oathtool.get_version())
+    text = '\n'.join((code, hook))
+    if format == 'zipapp':
+        return zipapp(text)
+    return '\n'.join(('#!/usr/bin/env python', text)).encode()
 
 
 @autocommand.autocommand(__name__, parser=parser)
-def make_standalone_script(target):
+def make_standalone_script(target, format='script'):
     """
     On Unix-like systems, create an 'oathtool' executable
     script that stands alone without this Python library.
     """
-    code = (files('oathtool') / '__init__.py').read_text()
-    shebang = '#!/usr/bin/env python'
-    hook = '__name__ == "__main__" and main()'
-    text = '\n'.join((shebang, code, hook))
     resolved = target.expanduser()
-    resolved.write_text(text)
+    resolved.write_bytes(standalone(format))
     resolved.chmod('a+x')
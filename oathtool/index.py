@@ -0,0 +1,193 @@
+"""
+A reverse index answering "which key(s) produced this code?" in
+constant time.
+
+The index holds, for the current time step and window steps either
+side, a dict from each code (as an int) to the id of the key that
+produced it, or a tuple of ids when several keys share a code. When a
+step boundary passes, only the newly uncovered step is computed and the
+oldest one dropped.
+
+Memory: each step costs one dict entry and two ints (code and key id)
+per key. Measured with tracemalloc on CPython 3.11, that is about 110 MB
+per million keys per step, or about 330 MB per million keys for the
+default window of one step either side, in addition to the keys
+themselves. Computing each new step takes about 6 seconds of CPU per
+million keys.
+
+>>> keys = [oathtool.OTPKey('GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ')]
+>>> index = CodeIndex(keys, t=59)
+>>> index.lookup('287082', t=59)
+[0]
+>>> index.lookup('359152', t=59)
+[]
+>>> index.lookup('359152', t=59, window=1)
+[0]
+"""
+
+import hashlib
+import threading
+import time
+
+import oathtool
+
+
+class CodeIndex:
+    """
+    A code-to-key-id index over keys, a sequence of OTPKey objects
+    whose positions serve as their ids. A None in keys is a removed
+    key, and is skipped.
+    """
+
+    def __init__(self, keys, window=1, digest=hashlib.sha1, period=30, t=None):
+        self.keys = keys
+        self.window = window
+        self.digest = digest
+        self.period = period
+        self._steps = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # the keys updated while new steps are built, with their old keys
+        self._dirty = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.refresh(t)
+
+    def build_step(self, counter):
+        """The code-to-key-id mapping for one counter."""
+        codes = {}
+        for key_id, key in enumerate(self.keys):
+            if key is not None:
+                self._insert(codes, int(key.hotp(counter, self.digest)), key_id)
+        return codes
+
+    @staticmethod
+    def _insert(codes, code, key_id):
+        found = codes.setdefault(code, key_id)
+        if found != key_id:
+            previous = found if type(found) is tuple else (found,)
+            codes[code] = (*previous, key_id)
+
+    @staticmethod
+    def _discard(codes, code, key_id):
+        found = codes.get(code)
+        if found == key_id:
+            del codes[code]
+        elif type(found) is tuple:
+            rest = tuple(other for other in found if other != key_id)
+            codes[code] = rest if len(rest) > 1 else rest[0]
+
+    def update(self, key_id, key):
+        """
+        Replace the key with id key_id by the OTPKey key, or remove it if
+        key is None, re-indexing only that key in each indexed step; an
+        id one past the end adds a key. keys must be a list.
+
+        >>> index = CodeIndex([], t=59)
+        >>> index.update(0, oathtool.OTPKey('GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'))
+        >>> index.lookup('287082', t=59)
+        [0]
+        >>> index.update(0, None)
+        >>> index.lookup('287082', t=59)
+        []
+        """
+        with self._lock:
+            old = self.keys[key_id] if key_id < len(self.keys) else None
+            if self._dirty is not None:
+                self._dirty.setdefault(key_id, old)
+            if key_id == len(self.keys):
+                self.keys.append(key)
+            else:
+                self.keys[key_id] = key
+            for counter, codes in self._steps.items():
+                if old is not None:
+                    self._discard(codes, int(old.hotp(counter, self.digest)), key_id)
+                if key is not None:
+                    self._insert(codes, int(key.hotp(counter, self.digest)), key_id)
+
+    def refresh(self, t=None):
+        """
+        Bring the index up to date for time t (default: now), computing
+        only the steps not already indexed. Lookups keep using the
+        previous steps until the new set is swapped in.
+
+        New steps are built without holding the lock, so update() is not
+        held up for the seconds that can take; the updates made
+        meanwhile are replayed on the new steps before they are swapped
+        in.
+        """
+        current = int((time.time() if t is None else t) / self.period)
+        wanted = range(current - self.window, current + self.window + 1)
+        with self._refresh_lock:
+            with self._lock:
+                if set(self._steps) == set(wanted):
+                    return
+                missing = [counter for counter in wanted if counter not in self._steps]
+                self._dirty = {}
+            try:
+                built = {counter: self.build_step(counter) for counter in missing}
+            except BaseException:
+                with self._lock:
+                    self._dirty = None
+                raise
+            with self._lock:
+                dirty, self._dirty = self._dirty, None
+                self._replay(built, dirty)
+                steps = self._steps
+                self._steps = {
+                    counter: steps[counter] if counter in steps else built[counter]
+                    for counter in wanted
+                }
+
+    def _replay(self, built, dirty):
+        # a key updated during the build may be indexed under its old
+        # code, its new one or neither; index it under the new one only
+        for key_id, old in dirty.items():
+            key = self.keys[key_id]
+            for counter, codes in built.items():
+                for stale in old, key:
+                    if stale is not None:
+                        code = int(stale.hotp(counter, self.digest))
+                        self._discard(codes, code, key_id)
+                if key is not None:
+                    self._insert(codes, int(key.hotp(counter, self.digest)), key_id)
+
+    def lookup(self, code, t=None, window=0):
+        """
+        Ids of the keys whose code at time t (default: now), or at up to
+        window steps either side, is code. Steps outside the indexed
+        range are not searched.
+        """
+        current = int((time.time() if t is None else t) / self.period)
+        steps = self._steps
+        code = int(code)
+        found = []
+        for counter in oathtool.search_order(current, window):
+            match = steps.get(counter, {}).get(code)
+            if match is None:
+                continue
+            for key_id in match if type(match) is tuple else (match,):
+                if key_id not in found:
+                    found.append(key_id)
+        return found
+
+    def start(self):
+        """Refresh in a background thread just after each step boundary."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            now = time.time()
+            boundary = (int(now / self.period) + 1) * self.period
+            if self._stop.wait(boundary - now):
+                return
+            self.refresh()
@@ -0,0 +1,271 @@
+"""
+A compact binary keystore of decoded secrets, read through mmap.
+
+Build one from a key list (``label<TAB>secret`` lines, see
+``oathtool.parse_key_line``) or from ``otpauth://`` URIs, one per line::
+
+    $ python -m oathtool.keystore build keys.oks secrets.txt
+    $ oathtool --store keys.oks --label github
+
+Opening a store maps the file without reading it; each lookup hashes
+the label, probes the index and decodes only the matching record.
+
+File layout (all integers little-endian):
+
+- header: magic ``OATHKS1\\0``, record count (u32), index slots (u32),
+  index offset (u64) and 8 reserved bytes;
+- records, back to back: label length (u16), key length (u16), digest
+  id (u8), period (u16), then the UTF-8 label and the raw key bytes;
+- index: a power-of-two number of u64 slots, each empty (0) or one
+  plus the offset of a record, probed linearly from the BLAKE2 hash of
+  the label.
+"""
+
+import argparse
+import array
+import contextlib
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import time
+import urllib.parse
+from typing import NamedTuple
+
+import oathtool
+
+MAGIC = b'OATHKS1\0'
+header = struct.Struct('<8sIIQ8x')
+record = struct.Struct('<HHBH')
+slot = struct.Struct('<Q')
+
+digests = {1: hashlib.sha1, 2: hashlib.sha256, 3: hashlib.sha512}
+digest_ids = {digest().name: id for id, digest in digests.items()}
+
+
+class Entry(NamedTuple):
+    """A stored key: label, OTPKey, digest constructor and period."""
+
+    label: str
+    key: oathtool.OTPKey
+    digest: object
+    period: int
+
+
+def label_hash(label):
+    return int.from_bytes(hashlib.blake2b(label, digest_size=8).digest(), 'little')
+
+
+def check(label, key, digest, period):
+    """Raise ValueError unless the entry fits in a record."""
+    if len(label.encode()) > 0xFFFF:
+        raise ValueError(f'label too long: {label[:20]}...')
+    if len(key) > 0xFFFF:
+        raise ValueError(f'key too long for {label}')
+    if digest not in digest_ids:
+        raise ValueError(f'unsupported algorithm: {digest}')
+    if not 1 <= period <= 0xFFFF:
+        raise ValueError(f'period must be 1 to 65535 seconds: {period}')
+
+
+def build(path, entries):
+    """
+    Write a keystore at path from entries, an iterable of
+    (label, raw key bytes, digest name, period). Return the count.
+    The store is written to a temporary file and renamed into place, so
+    a failed build leaves any existing store at path as it was.
+    """
+    temp = f'{os.fspath(path)}.{os.getpid()}.tmp'
+    try:
+        with open(temp, 'wb') as out:
+            count = _write(out, entries)
+        os.replace(temp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp)
+        raise
+    return count
+
+
+def _write(out, entries):
+    hashes = array.array('Q')
+    offsets = array.array('Q')
+    labels = set()
+    out.write(bytes(header.size))
+    offset = header.size
+    for label, key, digest, period in entries:
+        check(label, key, digest, period)
+        encoded = label.encode()
+        if encoded in labels:
+            raise ValueError(f'duplicate label: {label}')
+        labels.add(encoded)
+        hashes.append(label_hash(encoded))
+        offsets.append(offset)
+        rec = record.pack(len(encoded), len(key), digest_ids[digest], period)
+        out.write(rec + encoded + key)
+        offset += len(rec) + len(encoded) + len(key)
+    size = 1 << max(len(offsets) * 2 - 1, 1).bit_length()
+    table = array.array('Q', bytes(size * slot.size))
+    for hash, rec_offset in zip(hashes, offsets):
+        index = hash & (size - 1)
+        while table[index]:
+            index = (index + 1) & (size - 1)
+        table[index] = rec_offset + 1
+    if sys.byteorder != 'little':  # pragma: no cover
+        table.byteswap()
+    table.tofile(out)
+    out.seek(0)
+    out.write(header.pack(MAGIC, len(offsets), size, offset))
+    return len(offsets)
+
+
+class KeyStore:
+    """
+    A read-only, memory-mapped keystore. Look up entries by label with
+    ``store[label]`` or iterate over all of them in file order.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self.count, self.slots, self.index = header.unpack_from(self.map)
+        except struct.error:
+            magic = None
+        if magic != MAGIC:
+            self.map.close()
+            raise ValueError(f'{path} is not an oathtool keystore')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.map.close()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, label):
+        return self._find(label.encode()) is not None
+
+    def __getitem__(self, label):
+        offset = self._find(label.encode())
+        if offset is None:
+            raise KeyError(label)
+        return self._entry(offset)[0]
+
+    def _find(self, encoded):
+        mask = self.slots - 1
+        index = label_hash(encoded) & mask
+        while True:
+            (value,) = slot.unpack_from(self.map, self.index + index * slot.size)
+            if not value:
+                return None
+            offset = value - 1
+            label_len = record.unpack_from(self.map, offset)[0]
+            start = offset + record.size
+            if self.map[start : start + label_len] == encoded:
+                return offset
+            index = (index + 1) & mask
+
+    def _entry(self, offset):
+        label_len, key_len, digest, period = record.unpack_from(self.map, offset)
+        start = offset + record.size
+        key_start = start + label_len
+        entry = Entry(
+            self.map[start:key_start].decode(),
+            oathtool.OTPKey.from_bytes(self.map[key_start : key_start + key_len]),
+            digests[digest],
+            period,
+        )
+        return entry, key_start + key_len
+
+    def __iter__(self):
+        """All entries, in file order."""
+        offset = header.size
+        for _ in range(self.count):
+            entry, offset = self._entry(offset)
+            yield entry
+
+    def generate_otp(self, label, t=None):
+        """The code for label at time t (default: now)."""
+        entry = self[label]
+        return entry.key.totp(
+            time.time() if t is None else t, entry.digest, entry.period
+        )
+
+
+def parse_uri(uri):
+    """
+    Parse an otpauth:// TOTP URI into (label, raw key, digest, period).
+
+    >>> parse_uri('otpauth://totp/ACME:jo%40example.com?secret=MZXW6YTBOI&algorithm=SHA256')
+    ('ACME:jo@example.com', b'foobar', 'sha256', 30)
+    """
+    parts = urllib.parse.urlsplit(uri)
+    if parts.scheme != 'otpauth' or parts.netloc != 'totp':
+        raise ValueError('only otpauth://totp/ URIs are supported')
+    params = dict(urllib.parse.parse_qsl(parts.query))
+    if params.get('digits', '6') != '6':
+        raise ValueError('only 6-digit codes are supported')
+    digest = params.get('algorithm', 'SHA1').lower()
+    label = urllib.parse.unquote(parts.path.lstrip('/'))
+    key = oathtool.decode_key(params.get('secret', ''))
+    entry = label, key, digest, int(params.get('period', 30))
+    check(*entry)
+    return entry
+
+
+def parse_lines(lines, err=None):
+    """
+    Entries for build from key list lines and otpauth URIs. Invalid lines
+    are reported to err (default: stderr) and skipped.
+    """
+    err = err or sys.stderr
+    for lineno, line in enumerate(lines, 1):
+        try:
+            if line.startswith('otpauth://'):
+                yield parse_uri(line.strip())
+                continue
+            label, secret = oathtool.parse_key_line(line)
+            if secret:
+                entry = label or str(lineno), oathtool.decode_key(secret), 'sha1', 30
+                check(*entry)
+                yield entry
+        except ValueError as e:
+            err.write(f'line {lineno}: {str(e).splitlines()[0]}\n')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m oathtool.keystore',
+        description='Build a binary keystore for oathtool --store',
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_cmd = commands.add_parser('build', help='build a keystore')
+    build_cmd.add_argument('output', help='keystore file to write')
+    build_cmd.add_argument(
+        'input',
+        nargs='?',
+        default='-',
+        help='key list or otpauth:// URIs, one per line (default: stdin)',
+    )
+    args = parser.parse_args(args)
+    try:
+        with (
+            contextlib.nullcontext(sys.stdin)
+            if args.input == '-'
+            else open(args.input, encoding='utf-8')
+        ) as lines:
+            count = build(args.output, parse_lines(lines))
+    except (OSError, ValueError) as e:
+        parser.exit(1, f'Error: {e}\n')
+    print(f'wrote {count} keys to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
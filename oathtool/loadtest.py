@@ -0,0 +1,507 @@
+"""
+Load generation for capacity planning: drive code generation or
+verification at a target rate, or as fast as a number of concurrent
+workers can, and report throughput, latency percentiles and a latency
+histogram.
+
+    $ python -m oathtool.loadtest --keys 10000 --rate 5000 --duration 30
+    $ python -m oathtool.loadtest --operation verify --window 2 --concurrency 8
+    $ python -m oathtool.loadtest --serve --concurrency 16 --json
+
+Requests run in-process by default. With ``--socket PATH`` they go to
+the daemon listening there (see ``oathtool.daemon``), and with
+``--serve`` the load test starts its own daemon, serving its keys, on
+a temporary socket. Everything runs locally.
+
+At a target rate, latency is measured from when each request was due
+rather than when it was sent, so a stalled system is charged for the
+requests queued behind the stall (avoiding coordinated omission).
+"""
+
+import argparse
+import contextlib
+import hashlib
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import oathtool
+from oathtool.sample import secrets
+
+PERCENTILES = (50, 95, 99, 99.9)
+
+
+class Histogram:
+    """
+    An HDR-style latency histogram of integer nanoseconds: each power
+    of two is split into 2**(precision - 1) equal buckets, so recorded
+    values keep a relative precision of about 2**-precision at any
+    magnitude, in a few kilobytes.
+
+    >>> hist = Histogram()
+    >>> for nanos in range(1000, 101000, 1000):
+    ...     hist.record(nanos)
+    >>> hist.percentile(50), hist.percentile(99), hist.max
+    (50175, 99327, 100000)
+    """
+
+    def __init__(self, precision=7):
+        self.precision = precision
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, nanos):
+        shift = max(nanos.bit_length() - self.precision, 0)
+        bucket = shift, nanos >> shift
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += nanos
+        self.min = nanos if self.min is None else min(self.min, nanos)
+        self.max = nanos if self.max is None else max(self.max, nanos)
+
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in other.min, other.max:
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def buckets(self):
+        """(highest value, count) of each non-empty bucket, in order."""
+        for shift, sub in sorted(self.counts):
+            yield min(((sub + 1) << shift) - 1, self.max), self.counts[shift, sub]
+
+    def percentile(self, percent):
+        """The highest value equivalent to the given percentile."""
+        wanted = max(self.count * percent / 100, 1)
+        seen = 0
+        for value, count in self.buckets():
+            seen += count
+            if seen >= wanted:
+                return value
+        return self.max
+
+    def to_dict(self):
+        return dict(
+            count=self.count,
+            min=self.min,
+            max=self.max,
+            mean=self.total / self.count if self.count else None,
+            percentiles={str(p): self.percentile(p) for p in PERCENTILES},
+            buckets=[list(bucket) for bucket in self.buckets()],
+        )
+
+
+def in_process(keys, operation, digest=hashlib.sha1, window=1):
+    """
+    A factory of request functions for workers, each taking a request
+    number, that call generate_otp or verify_otp directly. Verification
+    codes are computed up front, spread over the window around the
+    current step, and verified against that step.
+    """
+    t = time.time()
+    offsets = list(oathtool.search_order(0, window))
+    codes = [
+        oathtool.OTPKey(secret).hotp(int(t / 30) + offsets[n % len(offsets)], digest)
+        for n, (_, secret) in enumerate(keys)
+    ]
+
+    def generate(n):
+        oathtool.generate_otp(keys[n % len(keys)][1], digest=digest)
+        return True
+
+    def verify(n):
+        n %= len(keys)
+        return oathtool.verify_otp(keys[n][1], codes[n], window, digest=digest, t=t)
+
+    return lambda: dict(generate=generate, verify=verify)[operation]
+
+
+def over_socket(path, keys, operation, digest=hashlib.sha1, window=1):
+    """
+    Like in_process, but each worker sends its requests to the daemon
+    at path over its own connection: KEY for generation, and VERIFY
+    (for keys the daemon has loaded under the same labels) for
+    verification. The daemon verifies against its own clock, so codes
+    are computed as each request is made.
+    """
+    from oathtool import daemon
+
+    offsets = list(oathtool.search_order(0, window))
+    decoded = [oathtool.OTPKey(secret) for _, secret in keys]
+
+    def worker():
+        client = daemon.Client(path, timeout=10)
+
+        def generate(n):
+            client.generate_otp(keys[n % len(keys)][1], digest)
+            return True
+
+        def verify(n):
+            key = decoded[n % len(keys)]
+            code = key.hotp(int(time.time() / 30) + offsets[n % len(offsets)], digest)
+            return client.verify(keys[n % len(keys)][0], code) is not None
+
+        request = dict(generate=generate, verify=verify)[operation]
+        request.close = client.close
+        return request
+
+    return worker
+
+
+def _close(request):
+    if hasattr(request, 'close'):
+        request.close()
+
+
+def _workers(worker, concurrency):
+    """concurrency request functions from worker(), or none if one fails."""
+    functions = []
+    try:
+        while len(functions) < concurrency:
+            functions.append(worker())
+    except BaseException:
+        for request in functions:
+            _close(request)
+        raise
+    return functions
+
+
+class _Schedule:
+    """When each request is due, for the threads of one run."""
+
+    def __init__(self, concurrency, rate, duration, requests):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.requests = requests
+        self.shared = itertools.count()
+        self.start = time.perf_counter()
+        self.deadline = self.start + duration
+
+    def due_times(self, index):
+        """(request number, due time) for the thread at index."""
+        rate = self.rate
+        numbers = itertools.count(index, self.concurrency) if rate else self.shared
+        for n in numbers:
+            if self.requests is not None and n >= self.requests:
+                return
+            due = self.start + n / rate if rate else time.perf_counter()
+            if due >= self.deadline:
+                return
+            yield n, due
+
+
+def _drive(request, due_times, hist, tally):
+    try:
+        for n, due in due_times:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                ok = request(n)
+            except (OSError, ValueError):
+                tally[0] += 1
+                continue
+            hist.record(int((time.perf_counter() - due) * 1e9))
+            tally[1] += not ok
+    finally:
+        _close(request)
+
+
+def run(worker, concurrency=1, rate=None, duration=10.0, requests=None):
+    """
+    Issue requests from concurrency threads, each with its own request
+    function from worker(), for duration seconds or until requests have
+    been issued. With a rate, request n is due at n / rate seconds and
+    its latency counts from then; otherwise every thread sends its next
+    request as soon as the last completes. A request function with a
+    close attribute is closed when its thread finishes.
+
+    Return (histogram, elapsed seconds, errors, mismatches), where
+    mismatches are requests that completed but reported failure (such
+    as a code that did not verify).
+    """
+    functions = _workers(worker, concurrency)
+    histograms = [Histogram() for _ in range(concurrency)]
+    tallies = [[0, 0] for _ in range(concurrency)]
+    schedule = _Schedule(concurrency, rate, duration, requests)
+    threads = [
+        threading.Thread(
+            target=_drive,
+            args=(
+                functions[index],
+                schedule.due_times(index),
+                histograms[index],
+                tallies[index],
+            ),
+        )
+        for index in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - schedule.start
+    total = Histogram()
+    for hist in histograms:
+        total.merge(hist)
+    errors, mismatches = (sum(column) for column in zip(*tallies))
+    return total, elapsed, errors, mismatches
+
+
+@contextlib.contextmanager
+def serving(keys, digest, window):
+    """Run a daemon serving keys on a temporary socket; yield its path."""
+    from oathtool import daemon
+
+    with tempfile.TemporaryDirectory() as tmp:
+        key_file = os.path.join(tmp, 'keys')
+        with open(key_file, 'w') as file:
+            file.writelines(f'{label}\t{secret}\n' for label, secret in keys)
+        path = os.path.join(tmp, 'oathtool.sock')
+        command = [sys.executable, '-m', 'oathtool', 'serve', path]
+        command += ['--keys', key_file, '--digest', digest().name]
+        command += ['--window', str(window)]
+        proc = subprocess.Popen(command, stderr=subprocess.DEVNULL)
+        try:
+            for _ in range(100):
+                with contextlib.suppress(OSError):
+                    with daemon.Client(path) as client:
+                        client.request('PING')
+                    break
+                time.sleep(0.05)
+            else:
+                raise RuntimeError('daemon did not start')
+            yield path
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+def format_nanos(nanos):
+    for unit, scale in (('s', 1e9), ('ms', 1e6), ('us', 1e3)):
+        if nanos >= scale:
+            return f'{nanos / scale:.1f} {unit}'
+    return f'{nanos} ns'
+
+
+def histogram_lines(buckets, width=40):
+    """
+    Text bars for histogram buckets of (highest value, count), merged
+    into one bar per power of two.
+
+    >>> print('\\n'.join(histogram_lines([[900, 1], [1000, 3], [1500, 2]], width=6)))
+      <= 1.0 us            4 ######
+      <= 1.5 us            2 ###
+    """
+    merged = {}
+    for value, count in buckets:
+        top, total = merged.get(value.bit_length(), (0, 0))
+        merged[value.bit_length()] = max(top, value), total + count
+    most = max((count for _, count in merged.values()), default=0)
+    return [
+        f'  <= {format_nanos(value):<9} {count:>9} '
+        + '#' * max(round(count * width / most), 1)
+        for _, (value, count) in sorted(merged.items())
+    ]
+
+
+def report(summary):
+    """The summary of a run, as text."""
+    latency = summary['latency']
+    lines = [
+        '{operation}: {keys} keys, {digest}, window {window}, {target}'.format(
+            **summary
+        ),
+        '{requests} requests in {elapsed:.2f} s: {throughput:.1f}/s, '
+        '{errors} errors, {mismatches} mismatches'.format(**summary),
+    ]
+    if latency['count']:
+        lines.append(
+            'latency: min {}, mean {}, max {}'.format(
+                format_nanos(latency['min']),
+                format_nanos(int(latency['mean'])),
+                format_nanos(latency['max']),
+            )
+        )
+        lines += [
+            f'  p{p:<5} {format_nanos(value)}'
+            for p, value in latency['percentiles'].items()
+        ]
+        lines.append('histogram:')
+        lines += histogram_lines(latency['buckets'])
+    return '\n'.join(lines)
+
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m oathtool.loadtest',
+        description='Measure OTP generation or verification under load',
+    )
+    parser.add_argument(
+        '--operation',
+        choices=['generate', 'verify'],
+        default='generate',
+        help='what each request does (default: generate)',
+    )
+    parser.add_argument(
+        '--keys',
+        type=int,
+        default=1000,
+        metavar='N',
+        help='number of generated keys to cycle through (default: 1000)',
+    )
+    parser.add_argument(
+        '--key-file',
+        metavar='FILE',
+        help='use the keys in this key list instead of generated ones',
+    )
+    parser.add_argument(
+        '--digest',
+        choices=sorted(oathtool.digests),
+        default='sha1',
+        help='Hash algorithm for HMAC (default: sha1)',
+    )
+    parser.add_argument(
+        '--window',
+        type=int,
+        default=1,
+        help='time steps either side of now to verify (default: 1)',
+    )
+    parser.add_argument(
+        '--rate', type=float, metavar='N', help='target requests per second'
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=1,
+        metavar='N',
+        help='worker threads (default: 1); without --rate, each sends '
+        'requests back to back',
+    )
+    parser.add_argument(
+        '--duration',
+        type=float,
+        default=10.0,
+        metavar='SECONDS',
+        help='how long to run (default: 10)',
+    )
+    parser.add_argument(
+        '--requests',
+        type=int,
+        metavar='N',
+        help='stop after N requests, if sooner than --duration',
+    )
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument(
+        '--socket',
+        metavar='PATH',
+        help='send requests to the daemon at PATH instead of running them in-process',
+    )
+    target.add_argument(
+        '--serve',
+        action='store_true',
+        help='start a daemon serving the keys and send requests to it',
+    )
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='print the results, including the histogram, as JSON',
+    )
+    return parser
+
+
+def _check_args(parser, args):
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+    if args.rate is not None and args.rate <= 0:
+        parser.error('--rate must be more than 0')
+    if args.duration < 0:
+        parser.error('--duration must be 0 or more')
+    if args.requests is not None and args.requests < 0:
+        parser.error('--requests must be 0 or more')
+
+
+def _read_keys(parser, path):
+    """The valid (label, secret) pairs in the key list at path."""
+    try:
+        with open(path, encoding='utf-8') as file:
+            lines = file.readlines()
+    except (OSError, UnicodeDecodeError) as e:
+        parser.exit(1, f'Error: {e}\n')
+    decoded, invalid = oathtool.decode_keys(lines)
+    for lineno, label, reason in invalid:
+        print(f'line {lineno}: {reason}', file=sys.stderr)
+    parsed = enumerate(map(oathtool.parse_key_line, lines), 1)
+    return [
+        (label or str(lineno), secret)
+        for lineno, (label, secret) in parsed
+        if decoded.pop(label or str(lineno), None) is not None
+    ]
+
+
+def main(args=None):
+    import json
+
+    parser = _parser()
+    args = parser.parse_args(args)
+    _check_args(parser, args)
+
+    if args.key_file:
+        keys = _read_keys(parser, args.key_file)
+    else:
+        keys = [(f'key{n}', secret) for n, secret in enumerate(secrets(args.keys))]
+    if not keys:
+        parser.error('no keys to use')
+    digest = oathtool.digests[args.digest]
+
+    with contextlib.ExitStack() as stack:
+        path = args.socket
+        if args.serve:
+            path = stack.enter_context(serving(keys, digest, args.window))
+        if path:
+            worker = over_socket(path, keys, args.operation, digest, args.window)
+        else:
+            worker = in_process(keys, args.operation, digest, args.window)
+        try:
+            hist, elapsed, errors, mismatches = run(
+                worker, args.concurrency, args.rate, args.duration, args.requests
+            )
+        except OSError as e:
+            parser.exit(1, f'Error: {e}\n')
+
+    summary = dict(
+        operation=args.operation,
+        keys=len(keys),
+        digest=args.digest,
+        window=args.window,
+        target=(
+            (f'{args.rate:g}/s' if args.rate else 'max')
+            + f' with {args.concurrency} workers, '
+            + ('socket' if path else 'in-process')
+        ),
+        requests=hist.count + errors,
+        elapsed=elapsed,
+        throughput=hist.count / elapsed,
+        errors=errors,
+        mismatches=mismatches,
+        latency=hist.to_dict(),
+    )
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(report(summary))
+
+
+if __name__ == '__main__':
+    main()
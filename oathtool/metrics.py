@@ -0,0 +1,231 @@
+"""
+Opt-in instrumentation of the oathtool hot paths.
+
+``enable()`` wraps ``generate_otp``, ``verify_otp``, ``decode_key``,
+the HMAC (``hmac`` and ``OTPKey.hmac``) and ``truncate`` in the
+oathtool module with timers that count calls and errors and record
+latency histograms; ``disable()`` puts the original functions back, so
+when disabled there is no overhead at all. Code that imported one of
+those functions by name (``from oathtool import generate_otp``) before
+enabling keeps the uninstrumented version.
+
+>>> enable()
+>>> oathtool.generate_otp('GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ', 1)
+'287082'
+>>> disable()
+>>> snapshot()['generate_otp']['count']
+1
+>>> print(prometheus(), end='')
+# HELP oathtool_duration_seconds Time spent in instrumented oathtool calls.
+# TYPE oathtool_duration_seconds histogram
+oathtool_duration_seconds_bucket{op="decode_key",le="1e-06"} 0
+...
+oathtool_duration_seconds_count{op="truncate"} 1
+...
+>>> reset()
+
+Export the metrics in the Prometheus text format with ``prometheus()``,
+to a file (for the node exporter's textfile collector) with ``write()``,
+or over HTTP with ``serve()``. Setting ``$OATHTOOL_METRICS`` to a path
+makes the command line enable instrumentation and write the metrics
+there on exit, along with the CPU time used before it started.
+"""
+
+import bisect
+import collections
+import contextlib
+import functools
+import os
+import threading
+import time
+
+import oathtool
+
+BOUNDS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 1e-2, 0.1, 1.0,
+)  # fmt: skip
+"""Upper bounds, in seconds, of the latency histogram buckets."""
+
+targets = [
+    (oathtool, 'generate_otp'),
+    (oathtool, 'verify_otp'),
+    (oathtool, 'decode_key'),
+    (oathtool, 'hmac'),
+    (oathtool.OTPKey, 'hmac'),
+    (oathtool, 'truncate'),
+]
+"""
+The (owner, name) of each instrumented function; the name is also the
+operation its metrics are recorded under.
+"""
+
+
+class Histogram:
+    """Latencies, counted into buckets bounded by BOUNDS (and +Inf)."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(BOUNDS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(
+                count=self.count,
+                sum=self.sum,
+                errors=self.errors,
+                buckets=list(self.counts),
+            )
+
+
+histograms = collections.defaultdict(Histogram)
+_originals = {}
+startup_cpu = None
+
+
+def _instrument(func, hist):
+    perf_counter = time.perf_counter
+
+    @functools.wraps(func)
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            hist.error()
+            raise
+        finally:
+            hist.observe(perf_counter() - start)
+
+    return timed
+
+
+def enable():
+    """Instrument the targets; enabling twice has no further effect."""
+    for owner, name in targets:
+        if (owner, name) not in _originals:
+            func = owner.__dict__[name]
+            _originals[owner, name] = func
+            setattr(owner, name, _instrument(func, histograms[name]))
+
+
+def disable():
+    """Restore the original functions, keeping the metrics so far."""
+    while _originals:
+        (owner, name), func = _originals.popitem()
+        setattr(owner, name, func)
+
+
+def is_enabled():
+    return bool(_originals)
+
+
+@contextlib.contextmanager
+def instrumented():
+    """Instrument the targets within the block."""
+    enable()
+    try:
+        yield
+    finally:
+        disable()
+
+
+def reset():
+    """Discard all metrics recorded so far."""
+    global startup_cpu
+    for hist in histograms.values():
+        hist.__init__()
+    startup_cpu = None
+
+
+def record_startup():
+    """Record the CPU time the process has used so far as its startup."""
+    global startup_cpu
+    startup_cpu = time.process_time()
+
+
+def snapshot():
+    """The metrics of each operation that has been called, by name."""
+    return {op: hist.snapshot() for op, hist in histograms.items() if hist.count}
+
+
+def prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    metrics = snapshot()
+    lines = [
+        '# HELP oathtool_duration_seconds Time spent in instrumented oathtool calls.',
+        '# TYPE oathtool_duration_seconds histogram',
+    ]
+    for op, metric in sorted(metrics.items()):
+        cumulative = 0
+        for bound, count in zip((*BOUNDS, '+Inf'), metric['buckets']):
+            cumulative += count
+            le = bound if bound == '+Inf' else repr(bound)
+            lines.append(
+                f'oathtool_duration_seconds_bucket{{op="{op}",le="{le}"}} {cumulative}'
+            )
+        lines.append(f'oathtool_duration_seconds_sum{{op="{op}"}} {metric["sum"]!r}')
+        lines.append(f'oathtool_duration_seconds_count{{op="{op}"}} {metric["count"]}')
+    lines += [
+        '# HELP oathtool_errors_total Instrumented oathtool calls that raised.',
+        '# TYPE oathtool_errors_total counter',
+    ]
+    lines += [
+        f'oathtool_errors_total{{op="{op}"}} {metric["errors"]}'
+        for op, metric in sorted(metrics.items())
+    ]
+    if startup_cpu is not None:
+        lines += [
+            '# HELP oathtool_startup_cpu_seconds CPU time used before the '
+            'command line started.',
+            '# TYPE oathtool_startup_cpu_seconds gauge',
+            f'oathtool_startup_cpu_seconds {startup_cpu!r}',
+        ]
+    return '\n'.join(lines) + '\n'
+
+
+def write(path):
+    """Write the metrics to path, replacing it atomically."""
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'w', encoding='utf-8') as file:
+        file.write(prometheus())
+    os.replace(temp, path)
+
+
+def serve(address=('127.0.0.1', 9464)):
+    """
+    Serve the metrics over HTTP at address from a background thread, for
+    Prometheus to scrape. Return the server; call its ``shutdown()``
+    to stop.
+    """
+    import http.server
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(address, Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
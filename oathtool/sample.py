@@ -0,0 +1,19 @@
+"""
+Deterministic sample keys for the benchmarks, the load test and the
+tests, so that runs are repeatable.
+
+>>> secrets(2)
+['NOVJIVPD44DIFQQJJSWGFH3PX3MCYB6N', 'PRS4DZMC4LTGF5ZIWT5EESC6HIFF2LZU']
+"""
+
+import base64
+import random
+
+
+def secrets(count, seed=0):
+    """Deterministic pseudo-random 20-byte Base32 secrets."""
+    rand = random.Random(seed)
+    return [
+        base64.b32encode(rand.getrandbits(160).to_bytes(20, 'big')).decode()
+        for _ in range(count)
+    ]
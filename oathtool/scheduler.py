@@ -0,0 +1,131 @@
+"""
+Precompute the next time step's codes ahead of the step boundary, so
+consumers don't all recompute at once when the counter rolls over.
+
+>>> import oathtool
+>>> keys = dict(demo=oathtool.OTPKey('GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'))
+>>> scheduler = Precomputer(keys, lead=5)
+>>> scheduler.precompute(2, deadline=60, now=55)
+>>> scheduler.codes(t=61)['demo']
+'359152'
+>>> scheduler.passes[-1].missed
+False
+
+Run it on a background thread with ``start()``/``stop()``, or as an
+asyncio task with ``asyncio.create_task(scheduler.run())``. Each pass is
+recorded in ``passes`` (the most recent ``history``), and ``missed``
+counts the passes that finished after their step had already begun.
+"""
+
+import asyncio
+import collections
+import hashlib
+import threading
+import time
+from typing import NamedTuple
+
+
+class Pass(NamedTuple):
+    """
+    One precompute pass: the counter computed, how long it took, how many
+    seconds remained before the step began when it finished (negative if
+    late), and whether it missed that deadline.
+    """
+
+    counter: int
+    duration: float
+    slack: float
+    missed: bool
+
+
+class Precomputer:
+    """
+    Current and next-step codes for keys, a mapping of labels to OTPKey
+    objects, with the next step computed lead seconds before it begins.
+    """
+
+    def __init__(self, keys, lead=5, period=30, digest=hashlib.sha1, history=100):
+        self.keys = keys
+        self.lead = lead
+        self.period = period
+        self.digest = digest
+        self.passes = collections.deque(maxlen=history)
+        self.missed = 0
+        self._steps = {}
+        self._publish_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def compute(self, counter):
+        return {
+            label: key.hotp(counter, self.digest) for label, key in self.keys.items()
+        }
+
+    def _publish(self, counter, codes):
+        # replace the whole mapping so readers never see a partial update,
+        # and merge under a lock so concurrent publishers don't drop steps
+        with self._publish_lock:
+            steps = {c: v for c, v in self._steps.items() if c >= counter - 1}
+            steps[counter] = codes
+            self._steps = steps
+
+    def codes(self, t=None):
+        """
+        The codes, by label, for the step containing t (default: now).
+        A step that was not precomputed is computed on demand.
+        """
+        counter = int((time.time() if t is None else t) / self.period)
+        try:
+            return self._steps[counter]
+        except KeyError:
+            codes = self.compute(counter)
+            self._publish(counter, codes)
+            return codes
+
+    def code(self, label, t=None):
+        return self.codes(t)[label]
+
+    def precompute(self, counter, deadline, now=None):
+        """Compute and publish the codes for counter, recording the pass."""
+        started = time.perf_counter()
+        self._publish(counter, self.compute(counter))
+        duration = time.perf_counter() - started
+        slack = deadline - (time.time() if now is None else now + duration)
+        self.passes.append(Pass(counter, duration, slack, slack < 0))
+        self.missed += slack < 0
+
+    def plan(self, now):
+        """The next (counter, start time, deadline) to precompute."""
+        counter = int(now / self.period) + 1
+        if counter in self._steps:
+            counter += 1
+        deadline = counter * self.period
+        return counter, deadline - self.lead, deadline
+
+    def start(self):
+        """Precompute each step on a background thread."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            counter, start, deadline = self.plan(time.time())
+            if self._stop.wait(max(0, start - time.time())):
+                return
+            self.precompute(counter, deadline)
+
+    async def run(self):
+        """Precompute each step from an asyncio task, off the event loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            counter, start, deadline = self.plan(time.time())
+            await asyncio.sleep(max(0, start - time.time()))
+            await loop.run_in_executor(None, self.precompute, counter, deadline)
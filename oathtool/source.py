@@ -0,0 +1,265 @@
+"""
+A key list file that is reloaded in place as it changes, decoding only
+the entries that were added or rotated.
+
+>>> import tempfile
+>>> with tempfile.TemporaryDirectory() as tmp:
+...     path = os.path.join(tmp, 'secrets.txt')
+...     with open(path, 'w', encoding='utf-8') as file:
+...         _ = file.write('alice\\tGEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ\\n')
+...     source = KeySource(path)
+...     with open(path, 'a', encoding='utf-8') as file:
+...         _ = file.write('bob\\tMZXW6YTBOJUWU23MNU\\n')
+...     source.poll()
+...     sorted(source.keys)
+Change(added=['bob'], removed=[], rotated=[], invalid=[])
+['alice', 'bob']
+
+``keys`` is a snapshot, a dict of labels to OTPKey objects that is
+replaced, never modified, on reload: a request that reads it once sees
+one consistent version of the file throughout. Listeners registered
+with ``subscribe()`` are told of each change, to update indexes derived
+from the keys (see ``LabelIndex``) without rebuilding them.
+
+Changes are detected by polling the file's modification time and size,
+with ``poll()`` or from a background thread with ``start()``. Replace
+the file atomically (write a new one and rename it over the old) so
+that a poll never reads it half-written. The file is read as UTF-8.
+A listener that raises is logged and skipped; the other listeners, and
+the background thread, carry on.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from typing import NamedTuple
+
+import oathtool
+from oathtool.index import CodeIndex
+
+logger = logging.getLogger(__name__)
+
+
+class Change(NamedTuple):
+    """
+    The labels added, removed and rotated (given a new secret) by a reload,
+    and (lineno, label, reason) for each new line that could not be
+    decoded. An entry whose new secret is invalid is removed rather than
+    kept with its old secret.
+    """
+
+    added: list
+    removed: list
+    rotated: list
+    invalid: list
+
+
+class KeySource:
+    """
+    The keys in the key list (see oathtool.parse_key_line) at path.
+    Lines without a label are labeled by line number, and the first of
+    several lines with the same label wins.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.keys = {}
+        self.listeners = []
+        self._lines = set()
+        self._line_of = {}
+        self._simple = False
+        self._stat = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.reload()
+
+    def subscribe(self, listener):
+        """Call listener(change, keys) after each reload that changes keys."""
+        self.listeners.append(listener)
+
+    def poll(self):
+        """Reload if the file has changed; return the Change, or None."""
+        stat = os.stat(self.path)
+        if (stat.st_mtime_ns, stat.st_size) == self._stat:
+            return None
+        return self.reload()
+
+    def reload(self):
+        """
+        Re-read the file and apply the difference to keys; return the
+        Change. Only the secrets on added or changed lines are decoded,
+        and invalid lines are reported when they first appear.
+        """
+        with self._lock:
+            with open(self.path, encoding='utf-8') as file:
+                stat = os.fstat(file.fileno())
+                lines = file.read().splitlines()
+            current = set(lines)
+            # every label on its own line, and no repeated lines but blank ones
+            simple = len(lines) - len(current) == max(lines.count('') - 1, 0)
+            changes = self._diff(current) if simple and self._simple else None
+            if changes is None:
+                changes, invalid, simple = self._parse(lines)
+            else:
+                invalid = []
+            change = self._apply(changes, invalid, lines)
+            self._lines = current
+            self._simple = simple
+            self._stat = stat.st_mtime_ns, stat.st_size
+            return change
+
+    def _diff(self, current):
+        """
+        The changes from the lines added and removed since the last
+        load, by label: a (secret, line) or None for a removal. Return
+        None if that is not enough (a new line lacks a label or repeats
+        one), so that the whole file is parsed instead.
+        """
+        gone = self._lines - current
+        changes = {}
+        for line in gone:
+            label, secret = oathtool.parse_key_line(line)
+            if secret:
+                changes[label] = None
+        for line in current - self._lines:
+            label, secret = oathtool.parse_key_line(line)
+            if not secret:
+                continue
+            if label is None or changes.get(label) is not None:
+                return None
+            if label in self._line_of and self._line_of[label] not in gone:
+                return None
+            changes[label] = secret, line
+        return changes
+
+    def _parse(self, lines):
+        """
+        The changes, as for _diff, from every line; the invalid
+        (duplicate) lines; and whether every line has its own label.
+        """
+        seen = {}
+        invalid = []
+        simple = True
+        for lineno, line in enumerate(lines, 1):
+            label, secret = oathtool.parse_key_line(line)
+            if not secret:
+                continue
+            if label is None:
+                label = str(lineno)
+                simple = False
+            if label in seen:
+                invalid.append((lineno, label, 'Duplicate label'))
+                simple = False
+            else:
+                seen[label] = secret, line
+        changes = {
+            label: value
+            for label, value in seen.items()
+            if self._line_of.get(label) != value[1]
+        }
+        changes.update((label, None) for label in self._line_of if label not in seen)
+        return changes, invalid, simple
+
+    def _apply(self, changes, invalid, lines):
+        keys = dict(self.keys) if changes else self.keys
+        added, removed, rotated = [], [], []
+        for label, value in changes.items():
+            if value is None:
+                del self._line_of[label]
+                if keys.pop(label, None) is not None:
+                    removed.append(label)
+                continue
+            secret, line = value
+            self._line_of[label] = line
+            old = keys.get(label)
+            try:
+                key = oathtool.OTPKey.from_bytes(oathtool.b32decode(secret))
+            except ValueError as e:
+                invalid.append((lines.index(line) + 1, label, str(e)))
+                if keys.pop(label, None) is not None:
+                    removed.append(label)
+                continue
+            if old is None:
+                added.append(label)
+            elif old.key != key.key:
+                rotated.append(label)
+            else:
+                # the same secret, reformatted
+                continue
+            keys[label] = key
+        self.keys = keys
+        change = Change(added, removed, rotated, sorted(invalid))
+        if added or removed or rotated:
+            self._notify(change, keys)
+        return change
+
+    def _notify(self, change, keys):
+        for listener in self.listeners:
+            try:
+                listener(change, keys)
+            except Exception:
+                logger.exception('key source listener %r failed', listener)
+
+    def start(self, interval=1.0):
+        """Poll every interval seconds in a background thread."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(interval,), daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.poll()
+            except (OSError, UnicodeDecodeError):
+                # missing or unreadable for now; keep the last good keys
+                pass
+            except Exception:
+                logger.exception('reloading %s failed', self.path)
+
+
+class LabelIndex:
+    """
+    A CodeIndex over the keys of a KeySource, kept up to date with each
+    reload by re-indexing only the keys that changed, and answering
+    with labels rather than key ids. Ids of removed keys are reused.
+    """
+
+    def __init__(self, source, window=1, digest=hashlib.sha1, period=30, t=None):
+        self.labels = list(source.keys)
+        self.ids = {label: key_id for key_id, label in enumerate(self.labels)}
+        self._free = []
+        self.index = CodeIndex(list(source.keys.values()), window, digest, period, t)
+        source.subscribe(self.apply)
+
+    def apply(self, change, keys):
+        for label in change.removed:
+            key_id = self.ids.pop(label)
+            self.index.update(key_id, None)
+            self.labels[key_id] = None
+            self._free.append(key_id)
+        for label in change.rotated:
+            self.index.update(self.ids[label], keys[label])
+        for label in change.added:
+            key_id = self._free.pop() if self._free else len(self.labels)
+            if key_id == len(self.labels):
+                self.labels.append(label)
+            else:
+                self.labels[key_id] = label
+            self.ids[label] = key_id
+            self.index.update(key_id, keys[label])
+
+    def lookup(self, code, t=None, window=0):
+        """Labels of the keys whose code is code (see CodeIndex.lookup)."""
+        labels = self.labels
+        return [labels[key_id] for key_id in self.index.lookup(code, t, window)]
@@ -0,0 +1,129 @@
+"""
+Tests for the batching asyncio API.
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+
+import pytest
+
+from oathtool import aio
+
+SECRET = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+
+
+class CountingExecutor(concurrent.futures.ThreadPoolExecutor):
+    """A thread pool that records the size of each batch it runs."""
+
+    def __init__(self):
+        super().__init__(1)
+        self.batches = []
+
+    def submit(self, fn, requests, *args):
+        self.batches.append(len(requests))
+        return super().submit(fn, requests, *args)
+
+
+@pytest.fixture
+def executor():
+    with CountingExecutor() as executor:
+        yield executor
+
+
+@pytest.fixture(autouse=True)
+def default_settings():
+    saved = dict(aio.settings)
+    yield
+    aio.configure(**saved)
+
+
+class TestBatcher:
+    def test_coalesces(self, executor):
+        batcher = aio.Batcher(max_batch=4, max_delay=0.01, executor=executor)
+
+        async def burst():
+            calls = [batcher.generate_otp(SECRET, n) for n in range(1, 11)]
+            return await asyncio.gather(*calls)
+
+        codes = asyncio.run(burst())
+        assert codes[:3] == ['287082', '359152', '969429']
+        assert executor.batches == [4, 4, 2]
+
+    def test_max_delay(self, executor):
+        """A lone request waits no longer than max_delay for company."""
+        batcher = aio.Batcher(max_batch=100, max_delay=0.01, executor=executor)
+
+        async def one():
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            code = await batcher.generate_otp(SECRET, 1)
+            return code, loop.time() - start
+
+        code, elapsed = asyncio.run(one())
+        assert code == '287082'
+        assert 0.01 <= elapsed < 1
+        assert executor.batches == [1]
+
+    def test_errors_are_per_request(self, executor):
+        batcher = aio.Batcher(executor=executor)
+
+        async def mixed():
+            return await asyncio.gather(
+                batcher.verify_otp(SECRET, '287082', t=59),
+                batcher.verify_otp('!!', '287082'),
+                batcher.generate_otp(SECRET, 2, hashlib.sha256),
+                return_exceptions=True,
+            )
+
+        good, bad, sha256 = asyncio.run(mixed())
+        assert good == 1
+        assert isinstance(bad, ValueError)
+        assert sha256 == '254785'
+        assert executor.batches == [3]
+
+    def test_cancelled_caller(self, executor):
+        """Cancelling one request leaves the rest of its batch alone."""
+        batcher = aio.Batcher(executor=executor)
+
+        async def cancel_one():
+            first = asyncio.ensure_future(batcher.generate_otp(SECRET, 1))
+            second = asyncio.ensure_future(batcher.generate_otp(SECRET, 2))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second, first.cancelled()
+
+        assert asyncio.run(cancel_one()) == ('359152', True)
+
+    def test_one_loop(self):
+        batcher = aio.Batcher(max_batch=1)
+        asyncio.run(batcher.generate_otp(SECRET, 1))
+        with pytest.raises(RuntimeError):
+            asyncio.run(batcher.generate_otp(SECRET, 1))
+
+    def test_process_pool(self):
+        with concurrent.futures.ProcessPoolExecutor(1) as pool:
+            batcher = aio.Batcher(executor=pool)
+            assert asyncio.run(batcher.generate_otp(SECRET, 1)) == '287082'
+
+
+class TestModuleFunctions:
+    def test_configure(self, executor):
+        aio.configure(max_batch=2, executor=executor)
+
+        async def burst():
+            calls = [aio.agenerate_otp(SECRET, n) for n in range(1, 6)]
+            calls.append(aio.averify_otp(SECRET, '359152', t=59))
+            return await asyncio.gather(*calls)
+
+        assert asyncio.run(burst())[-1] == 2
+        assert executor.batches == [2, 2, 2]
+
+    def test_unknown_setting(self):
+        with pytest.raises(TypeError):
+            aio.configure(max_size=10)
+
+    def test_current_step(self):
+        """Without a counter, the code is for the step of the call."""
+        code = asyncio.run(aio.agenerate_otp(SECRET))
+        assert aio.oathtool.verify_otp(SECRET, code, window=1) is not None
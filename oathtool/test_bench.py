@@ -0,0 +1,70 @@
+"""
+Tests for the benchmark runner's JSON output and baseline comparison.
+"""
+
+import json
+
+import pytest
+
+from oathtool import bench
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """A single quick benchmark, 'fake', with settable results."""
+    values = {'fake-time': 1.0, 'fake-rate': 100.0}
+
+    def fake():
+        yield bench.result('fake-time', values['fake-time'])
+        yield bench.result('fake-rate', values['fake-rate'], 'keys/s')
+
+    monkeypatch.setattr(bench, 'benchmarks', dict(fake=fake))
+    return values
+
+
+class TestMain:
+    def test_json(self, fake, tmp_path, capsys):
+        bench.main(['--json', str(tmp_path / 'out.json')])
+        doc = json.loads((tmp_path / 'out.json').read_text())
+        assert doc['results'] == [
+            dict(name='fake-time', value=1.0, unit='s'),
+            dict(name='fake-rate', value=100.0, unit='keys/s'),
+        ]
+        assert 'fake-rate' in capsys.readouterr().out
+
+    def test_json_stdout(self, fake, capsys):
+        bench.main(['--json', '-'])
+        out, err = capsys.readouterr()
+        assert json.loads(out)['results'][0]['name'] == 'fake-time'
+        assert 'fake-time' in err
+
+    def test_baseline(self, fake, tmp_path, capsys):
+        baseline = str(tmp_path / 'baseline.json')
+        bench.main(['--json', baseline])
+        fake.update({'fake-time': 1.05, 'fake-rate': 95.0})
+        bench.main(['--baseline', baseline])
+        fake['fake-rate'] = 50.0
+        with pytest.raises(SystemExit) as exc_info:
+            bench.main(['--baseline', baseline])
+        assert exc_info.value.code == 1
+        assert 'regression: fake-rate' in capsys.readouterr().err
+        bench.main(['--baseline', baseline, '--threshold', 'fake-rate=1.5'])
+
+    def test_over_budget(self, monkeypatch, tmp_path, capsys):
+        def fake():
+            yield bench.result('fake-slow', 0.02, budget=0.01)
+            yield bench.result('fake-time', 1.0)
+
+        monkeypatch.setattr(bench, 'benchmarks', dict(fake=fake))
+        with pytest.raises(SystemExit) as exc_info:
+            bench.main(['--json', str(tmp_path / 'out.json')])
+        assert exc_info.value.code == 1
+        # the whole run is reported before it fails
+        doc = json.loads((tmp_path / 'out.json').read_text())
+        assert [res['name'] for res in doc['results']] == ['fake-slow', 'fake-time']
+        assert 'over budget: fake-slow' in capsys.readouterr().err
+
+    def test_unknown(self, fake):
+        with pytest.raises(SystemExit) as exc_info:
+            bench.main(['window'])
+        assert exc_info.value.code == 2
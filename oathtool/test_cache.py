@@ -0,0 +1,77 @@
+"""
+Tests for the time-step-aware code cache.
+"""
+
+import hashlib
+import threading
+
+import oathtool
+from oathtool.cache import CodeCache
+
+SECRET = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+
+
+class TestCodeCache:
+    def test_hit_and_miss(self):
+        cache = CodeCache()
+        assert cache.generate_otp(SECRET, now=59) == '287082'
+        assert cache.generate_otp(SECRET, now=45) == '287082'
+        info = cache.cache_info()
+        assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+
+    def test_digest_is_part_of_key(self):
+        cache = CodeCache()
+        sha1 = cache.generate_otp(SECRET, now=59)
+        sha256 = cache.generate_otp(SECRET, digest=hashlib.sha256, now=59)
+        assert sha1 != sha256
+        assert cache.cache_info().misses == 2
+
+    def test_expires_at_step_boundary(self):
+        cache = CodeCache()
+        cache.generate_otp(SECRET, now=59)
+        cache.generate_otp(SECRET, now=60)
+        info = cache.cache_info()
+        assert (info.expirations, info.currsize) == (1, 1)
+
+    def test_past_counters_not_cached(self):
+        cache = CodeCache()
+        assert cache.generate_otp(SECRET, 1, now=600) == '287082'
+        assert cache.cache_info().currsize == 0
+
+    def test_lru_eviction(self):
+        cache = CodeCache(maxsize=2)
+        for counter in (10, 11, 12):
+            cache.generate_otp(SECRET, counter, now=0)
+        info = cache.cache_info()
+        assert (info.evictions, info.currsize) == (1, 2)
+        cache.generate_otp(SECRET, 10, now=0)
+        assert cache.cache_info().misses == 4
+
+    def test_no_secrets_retained(self):
+        cache = CodeCache()
+        cache.generate_otp(SECRET, now=0)
+        for fingerprint, _, _ in cache._entries:
+            assert SECRET.encode() not in fingerprint
+            assert oathtool.decode_key(SECRET) not in fingerprint
+
+    def test_thread_safety(self):
+        cache = CodeCache(maxsize=8)
+
+        def work():
+            for counter in range(100):
+                cache.generate_otp(SECRET, counter % 16, now=0)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        info = cache.cache_info()
+        assert info.hits + info.misses == 800
+        assert info.currsize <= 8
+
+    def test_clear(self):
+        cache = CodeCache()
+        cache.generate_otp(SECRET, now=0)
+        cache.cache_clear()
+        assert cache.cache_info() == (0, 0, 0, 0, 4096, 0)
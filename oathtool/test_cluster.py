@@ -0,0 +1,168 @@
+"""
+Tests for consistent-hash sharding over daemons.
+"""
+
+import collections
+import sys
+import tempfile
+
+import pytest
+
+import oathtool
+from oathtool.sample import secrets
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="Unix sockets")
+
+if sys.platform != 'win32':
+    from oathtool import cluster
+
+labels = [f'user{n}' for n in range(5000)]
+
+
+class TestHashRing:
+    def test_balance(self):
+        ring = cluster.HashRing([f'node{n}' for n in range(4)])
+        counts = collections.Counter(map(ring.node_for, labels))
+        assert len(counts) == 4
+        assert max(counts.values()) < 1.4 * len(labels) / 4
+
+    def test_add_moves_only_to_new_node(self):
+        ring = cluster.HashRing([f'node{n}' for n in range(4)])
+        before = {label: ring.node_for(label) for label in labels}
+        ring.add('node4')
+        moved = {label for label in labels if ring.node_for(label) != before[label]}
+        assert {ring.node_for(label) for label in moved} == {'node4'}
+        assert 0.1 < len(moved) / len(labels) < 0.3
+
+    def test_remove_moves_only_its_keys(self):
+        ring = cluster.HashRing([f'node{n}' for n in range(4)])
+        before = {label: ring.node_for(label) for label in labels}
+        ring.remove('node2')
+        assert ring.nodes == ['node0', 'node1', 'node3']
+        for label in labels:
+            if before[label] != 'node2':
+                assert ring.node_for(label) == before[label]
+
+    def test_errors(self):
+        ring = cluster.HashRing(['a'])
+        with pytest.raises(ValueError):
+            ring.add('a')
+        ring.remove('a')
+        with pytest.raises(ValueError):
+            ring.remove('a')
+        with pytest.raises(LookupError):
+            ring.node_for('user0')
+
+
+@pytest.fixture
+def nodes():
+    """Four idle worker daemons; the cluster starts with the first three."""
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [f'{tmp}/node{n}.sock' for n in range(4)]
+        with cluster.workers(paths):
+            yield paths
+
+
+class TestCluster:
+    keys = [(f'user{n}', secret) for n, secret in enumerate(secrets(300))]
+
+    def load(self, paths):
+        shards = cluster.Cluster(paths)
+        invalid = shards.load(f'{label}\t{secret}\n' for label, secret in self.keys)
+        assert invalid == []
+        return shards
+
+    def check(self, shards):
+        for label, secret in self.keys[::7]:
+            code = oathtool.generate_otp(secret, 1)
+            assert shards.code(label, 1) == code
+            assert shards.verify(label, oathtool.generate_otp(secret)) is not None
+        assert sorted(sum(shards.labels().values(), [])) == sorted(
+            label for label, _ in self.keys
+        )
+
+    def test_routing(self, nodes):
+        with self.load(nodes[:3]) as shards:
+            for node, held in shards.labels().items():
+                assert held
+                assert {shards.ring.node_for(label) for label in held} == {node}
+            self.check(shards)
+
+    def test_add_node(self, nodes):
+        with self.load(nodes[:3]) as shards:
+            before = shards.labels()
+            moved = shards.add_node(nodes[3])
+            after = shards.labels()
+            assert moved == len(after[nodes[3]])
+            # keys only ever leave the old nodes
+            for node in nodes[:3]:
+                assert set(after[node]) <= set(before[node])
+            self.check(shards)
+
+    def test_remove_node(self, nodes):
+        with self.load(nodes) as shards:
+            before = shards.labels()
+            assert shards.remove_node(nodes[1]) == len(before[nodes[1]])
+            assert shards.ring.nodes == [nodes[0], nodes[2], nodes[3]]
+            after = shards.labels()
+            for node in after:
+                assert set(before[node]) <= set(after[node])
+            self.check(shards)
+
+    def test_remove_last_node(self, nodes):
+        with cluster.Cluster(nodes[:1]) as shards:
+            shards.add('user', 'JBSWY3DPEHPK3PXP')
+            with pytest.raises(ValueError, match='nowhere to go'):
+                shards.remove_node(nodes[0])
+            assert shards.code('user', 1) == oathtool.generate_otp(
+                'JBSWY3DPEHPK3PXP', 1
+            )
+
+    def test_failed_move_keeps_key(self, nodes, monkeypatch):
+        with self.load(nodes[:3]) as shards:
+            target = shards.client(nodes[3])
+            monkeypatch.setattr(target, 'add', None)  # fails when called
+            with pytest.raises(TypeError):
+                shards.add_node(nodes[3])
+            assert shards.ring.nodes == nodes[:3]
+            self.check(shards)
+
+    def test_add_missing_node(self, nodes):
+        with self.load(nodes[:3]) as shards:
+            with pytest.raises(OSError):
+                shards.add_node(nodes[0] + '.missing')
+            assert shards.ring.nodes == nodes[:3]
+            self.check(shards)
+
+    @pytest.mark.parametrize('change', ['add_node', 'remove_node'])
+    def test_failure_partway_rolled_back(self, nodes, monkeypatch, change):
+        with self.load(nodes[:3]) as shards:
+            calls = []
+            move = shards._move
+
+            def failing_move(label, source):
+                calls.append(label)
+                if len(calls) == 5:
+                    raise OSError('connection lost')
+                move(label, source)
+
+            monkeypatch.setattr(shards, '_move', failing_move)
+            node = nodes[3] if change == 'add_node' else nodes[1]
+            with pytest.raises(OSError):
+                getattr(shards, change)(node)
+            monkeypatch.setattr(shards, '_move', move)
+            assert shards.ring.nodes == nodes[:3]
+            for held_by, held in shards.labels().items():
+                assert {shards.ring.node_for(label) for label in held} <= {held_by}
+            self.check(shards)
+
+    def test_invalid_keys(self, nodes):
+        with cluster.Cluster(nodes) as shards:
+            lines = ['good\tJBSWY3DPEHPK3PXP', 'bad\t!!', 'has space\tJBSWY3DPEHPK3PXP']
+            invalid = shards.load(lines)
+            assert [label for _, label, _ in invalid] == ['bad', 'has space']
+            assert sum(shards.labels().values(), []) == ['good']
+            with pytest.raises(ValueError):
+                shards.add('has space', 'JBSWY3DPEHPK3PXP')
+            with pytest.raises(ValueError):
+                shards.code('missing')
@@ -4,8 +4,12 @@ Unit tests for oathtool core functions.
 Tests the core cryptographic and utility functions.
 """
 
+import base64
+import binascii
 import hashlib
 import hmac as stdlib_hmac
+import io
+import sys
 from unittest.mock import patch
 
 import pytest
@@ -216,3 +220,252 @@ class TestRFCCompliance:
             counter = timestamp // 30
             result = oathtool.generate_otp(secret, counter, digest=hashlib.sha256)
             assert result == expected_code
+
+
+class TestOTPKey:
+    """Tests for the precompiled key object."""
+
+    def test_matches_generate_otp(self):
+        """Codes match generate_otp for both digests."""
+        key = oathtool.OTPKey('JBSWY3DPEHPK3PXP')
+        for counter in (1, 12345, 52276810):
+            assert key.hotp(counter) == oathtool.generate_otp('JBSWY3DPEHPK3PXP', counter)
+            assert key.hotp(counter, hashlib.sha256) == oathtool.generate_otp(
+                'JBSWY3DPEHPK3PXP', counter, digest=hashlib.sha256
+            )
+
+    def test_hmac_matches_stdlib(self):
+        """Cloned keyed state gives the same HMAC as a fresh one."""
+        key = oathtool.OTPKey('GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ')
+        expected = stdlib_hmac.new(b'12345678901234567890', b'msg', hashlib.sha1)
+        assert key.hmac(b'msg') == expected.digest()
+        # repeated use does not disturb the prototype
+        assert key.hmac(b'msg') == expected.digest()
+
+    def test_prototype_cached_per_digest(self):
+        """One keyed prototype is kept per digest."""
+        key = oathtool.OTPKey('JBSWY3DPEHPK3PXP')
+        key.hotp(1)
+        key.hotp(2)
+        key.hotp(1, hashlib.sha256)
+        assert len(key._macs) == 2
+
+    def test_totp_period(self):
+        """totp() selects the counter from the time and period."""
+        key = oathtool.OTPKey('GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ')
+        assert key.totp(59) == '287082'
+        assert key.totp(1111111109) == '081804'
+        assert key.totp(120, period=60) == key.hotp(2)
+
+    def test_invalid_key(self):
+        """Invalid secrets are rejected at construction."""
+        with pytest.raises(ValueError, match='Invalid secret key'):
+            oathtool.OTPKey('INVALID!!!')
+
+    def test_slots(self):
+        """Instances carry no per-instance dict."""
+        assert not hasattr(oathtool.OTPKey('AAAA'), '__dict__')
+
+
+class TestGenerateOTPRange:
+    """Tests for the counter-window API."""
+
+    def test_matches_generate_otp(self):
+        """Each code in the range matches an individual call."""
+        key = 'JBSWY3DPEHPK3PXP'
+        codes = list(oathtool.generate_otp_range(key, 1000, 11))
+        assert codes == [oathtool.generate_otp(key, c) for c in range(1000, 1011)]
+
+    def test_rfc4226_vectors(self):
+        """RFC 4226 Appendix D vectors from one call."""
+        secret = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+        assert list(oathtool.generate_otp_range(secret, 0, 4)) == [
+            '755224', '287082', '359152', '969429',
+        ]
+
+    def test_sha256(self):
+        """Digest selection is honored."""
+        key = 'JBSWY3DPEHPK3PXP'
+        codes = list(oathtool.generate_otp_range(key, 5, 2, digest=hashlib.sha256))
+        assert codes == [
+            oathtool.generate_otp(key, c, digest=hashlib.sha256) for c in (5, 6)
+        ]
+
+    def test_empty(self):
+        """A zero-length window yields nothing."""
+        assert list(oathtool.generate_otp_range('JBSWY3DPEHPK3PXP', 1, 0)) == []
+
+    def test_invalid_key_raises_eagerly(self):
+        """Key errors surface at call time, not on first iteration."""
+        with pytest.raises(ValueError, match='Invalid secret key'):
+            oathtool.generate_otp_range('INVALID!!!', 1, 3)
+
+
+class TestDecodeKeys:
+    """Tests for the single-pass Base32 decoder and bulk ingestion."""
+
+    @pytest.mark.parametrize('size', range(26))
+    def test_matches_stdlib(self, size):
+        """b32decode agrees with base64.b32decode for every length."""
+        raw = bytes(range(size))
+        encoded = base64.b32encode(raw).decode()
+        assert oathtool.b32decode(encoded) == raw
+        assert oathtool.b32decode(encoded.rstrip('=').lower()) == raw
+
+    @pytest.mark.parametrize(
+        'key, reason',
+        [
+            ('MZX', 'Incorrect padding'),
+            ('MZXW6YTB=', 'Incorrect padding'),
+            ('=', 'Incorrect padding'),
+            ('MZXW6YT!', 'Non-base32 digit found'),
+            ('MZ=W6YTB', 'Non-base32 digit found'),
+            ('MZXW6YTÉ', 'Non-base32 digit found'),
+        ],
+    )
+    def test_invalid(self, key, reason):
+        """Invalid input raises binascii.Error, as base64.b32decode does."""
+        with pytest.raises(binascii.Error, match=reason):
+            oathtool.b32decode(key)
+
+    def test_decode_key_message(self):
+        """decode_key still reports invalid keys as a friendly ValueError."""
+        with pytest.raises(ValueError, match='Invalid secret key: Incorrect padding'):
+            oathtool.decode_key('MZX')
+
+    def test_report(self):
+        """Invalid lines and repeated labels are reported, not raised."""
+        lines = io.StringIO(
+            'github\tMZXW 6YTB OI\n\nJBSWY3DPEHPK3PXP\nbad\t!!\ngithub\tMZXW6\n'
+        )
+        keys, invalid = oathtool.decode_keys(lines)
+        assert keys == {'github': b'foobar', '3': base64.b32decode('JBSWY3DPEHPK3PXP')}
+        assert invalid == [
+            (4, 'bad', 'Non-base32 digit found'),
+            (5, 'github', 'Duplicate label'),
+        ]
+
+
+class TestVerifyOTP:
+    """Tests for code verification."""
+
+    secret = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+
+    def test_current_step(self):
+        assert oathtool.verify_otp(self.secret, '050471', t=1111111111) == 37037037
+
+    def test_window(self):
+        """Codes one step either side are accepted by default."""
+        # counter 2 is 359152
+        assert oathtool.verify_otp(self.secret, '359152', t=30) == 2
+        assert oathtool.verify_otp(self.secret, '359152', t=90) == 2
+        assert oathtool.verify_otp(self.secret, '359152', t=120) is None
+        assert oathtool.verify_otp(self.secret, '359152', t=120, window=2) == 2
+
+    def test_replay(self):
+        """Counters at or before last_used_counter are rejected."""
+        assert oathtool.verify_otp(self.secret, '359152', t=60, last_used_counter=1) == 2
+        assert oathtool.verify_otp(self.secret, '359152', t=60, last_used_counter=2) is None
+
+    def test_invalid_code(self):
+        assert oathtool.verify_otp(self.secret, '000000', t=60) is None
+        assert oathtool.verify_otp(self.secret, 'garbage', t=60) is None
+        assert oathtool.verify_otp(self.secret, '12345é', t=60) is None
+        assert oathtool.verify_otp(self.secret, '٣٥٩١٥٢', t=60) is None
+        assert oathtool.verify_otp(self.secret, -1, t=60) is None
+
+    def test_integer_code(self):
+        """Integer codes are zero-padded before comparison."""
+        # counter 37037036 is 081804
+        assert oathtool.verify_otp(self.secret, 81804, t=1111111109) == 37037036
+
+    def test_sha256(self):
+        secret = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQGEZA'
+        assert oathtool.verify_otp(secret, '119246', t=59, digest=hashlib.sha256) == 1
+
+    def test_stops_at_first_match(self):
+        """Only candidates up to the match are computed."""
+        with patch('oathtool.truncate', wraps=oathtool.truncate) as truncate:
+            assert oathtool.verify_otp(self.secret, '359152', t=60, window=5) == 2
+        assert truncate.call_count == 1
+
+    def test_uses_constant_time_compare(self):
+        with patch('hmac.compare_digest', wraps=stdlib_hmac.compare_digest) as cmp:
+            oathtool.verify_otp(self.secret, '000000', t=60)
+        assert cmp.call_count == 3
+
+
+class TestHMACBackends:
+    """Tests for the HMAC backend registry."""
+
+    @pytest.fixture(autouse=True)
+    def isolated(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(oathtool, '_hmac_backend', None)
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        monkeypatch.delenv('OATHTOOL_HMAC_BACKEND', raising=False)
+
+    @pytest.mark.parametrize('name', sorted(oathtool.hmac_backends))
+    @pytest.mark.parametrize('digest', [hashlib.sha1, hashlib.sha256, hashlib.sha512])
+    @pytest.mark.parametrize('key', [b'', b'key', b'k' * 64, b'k' * 200])
+    def test_backends_match_stdlib(self, name, digest, key):
+        mac = oathtool.hmac_backends[name](key, digest)
+        for msg in (b'', b'\0' * 8, bytearray(b'message')):
+            assert mac(msg) == stdlib_hmac.new(key, msg, digest).digest()
+
+    def test_default(self):
+        assert oathtool.hmac_backend() == 'copy'
+
+    def test_env_override(self, monkeypatch):
+        monkeypatch.setenv('OATHTOOL_HMAC_BACKEND', 'digest')
+        assert oathtool.hmac_backend() == 'digest'
+
+    def test_use_backend(self):
+        oathtool.use_hmac_backend('new')
+        assert oathtool.hmac_backend() == 'new'
+        assert oathtool.OTPKey('GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ').hotp(1) == '287082'
+        with pytest.raises(ValueError, match='unknown HMAC backend'):
+            oathtool.use_hmac_backend('nope')
+
+    def test_calibrate_saves_choice(self, monkeypatch):
+        timings = oathtool.calibrate_hmac(number=10)
+        assert set(timings) == set(oathtool.hmac_backends)
+        fastest = min(timings, key=timings.get)
+        assert oathtool.hmac_backend() == fastest
+        # a fresh process picks the saved choice up
+        monkeypatch.setattr(oathtool, '_hmac_backend', None)
+        assert oathtool.hmac_backend() == fastest
+
+    def test_calibrate_times_keying(self, monkeypatch):
+        def slow_keying(key, digest):
+            for _ in range(50):
+                stdlib_hmac.new(key, None, digest)
+            return lambda msg: b''
+
+        monkeypatch.setitem(oathtool.hmac_backends, 'slow', slow_keying)
+        timings = oathtool.calibrate_hmac(number=10, save=False)
+        assert oathtool.hmac_backend() != 'slow'
+        assert timings['slow'] > min(timings.values())
+
+    def test_one_shot_hmac_skips_backends(self, monkeypatch):
+        monkeypatch.setattr(oathtool, 'keyed_hmac', None)  # must not be called
+        msg = bytes(8)
+        assert oathtool.hmac(b'key', msg) == stdlib_hmac.new(b'key', msg, 'sha1').digest()
+
+    def test_calibration_from_other_python_ignored(self, monkeypatch):
+        oathtool.calibrate_hmac(number=10)
+        monkeypatch.setattr(oathtool, '_hmac_backend', None)
+        monkeypatch.setattr(sys, 'version', 'other')
+        assert oathtool.hmac_backend() == 'copy'
+
+    def test_main_calibrate(self, capsys):
+        with patch.object(sys, 'argv', ['prog', '--calibrate']):
+            oathtool.main()
+        assert 'selected: ' in capsys.readouterr().out
+
+    def test_main_digest(self, capsys):
+        secret = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQGEZA'
+        for flags in (['--sha256'], ['--digest', 'sha256']):
+            with patch.object(sys, 'argv', ['prog', *flags, secret]):
+                with patch('time.time', return_value=59), patch('sys.stdin'):
+                    oathtool.main()
+            assert capsys.readouterr().out.strip() == '119246'
@@ -0,0 +1,141 @@
+"""
+Tests for the persistent HOTP counter store.
+"""
+
+import concurrent.futures
+import sys
+import threading
+from unittest.mock import patch
+
+import pytest
+
+import oathtool
+
+counters = pytest.importorskip('oathtool.counters', reason='needs fcntl (Unix)')
+
+key = oathtool.OTPKey('GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ')
+
+
+def hammer(path, slot, count):
+    """Increment slot count times from a fresh store; return the values."""
+    with counters.CounterStore(path) as store:
+        return [store.increment(slot) for _ in range(count)]
+
+
+class TestCounterStore:
+    def test_new_file(self, tmp_path):
+        with counters.CounterStore(tmp_path / 'c', slots=3) as store:
+            assert len(store) == 3
+            assert [store.get(slot) for slot in range(3)] == [0, 0, 0]
+
+    def test_persists(self, tmp_path):
+        with counters.CounterStore(tmp_path / 'c') as store:
+            store.set(0, 41)
+            assert store.increment(0) == 41
+        with counters.CounterStore(tmp_path / 'c') as store:
+            assert store.get(0) == 42
+
+    def test_grows(self, tmp_path):
+        with counters.CounterStore(tmp_path / 'c', slots=1) as store:
+            with pytest.raises(IndexError):
+                store.get(4)
+            # another opener extends the file; the first one remaps
+            with counters.CounterStore(tmp_path / 'c', slots=5) as other:
+                other.set(4, 7)
+            assert store.get(4) == 7
+            assert len(store) == 5
+
+    def test_not_a_counter_file(self, tmp_path):
+        path = tmp_path / 'c'
+        path.write_bytes(b'not counters at all')
+        with pytest.raises(ValueError, match='not an oathtool counter file'):
+            counters.CounterStore(path)
+
+    def test_hotp(self, tmp_path):
+        """Codes follow RFC 4226 and advance the counter."""
+        with counters.CounterStore(tmp_path / 'c') as store:
+            assert [store.hotp(0, key) for _ in range(3)] == [
+                '755224',
+                '287082',
+                '359152',
+            ]
+            assert store.get(0) == 3
+
+    def test_verify_looks_ahead(self, tmp_path):
+        with counters.CounterStore(tmp_path / 'c') as store:
+            store.set(0, 5)
+            assert store.verify(0, key, key.hotp(4), window=3) is None
+            assert store.verify(0, key, key.hotp(9), window=3) is None
+            assert store.get(0) == 5
+            assert store.verify(0, key, key.hotp(7), window=3) == 7
+            assert store.get(0) == 8
+            # a code is good only once
+            assert store.verify(0, key, key.hotp(7), window=3) is None
+
+    def test_threads(self, tmp_path):
+        with counters.CounterStore(tmp_path / 'c') as store:
+            seen = []
+
+            def run():
+                seen.extend(store.increment(0) for _ in range(500))
+
+            threads = [threading.Thread(target=run) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert sorted(seen) == list(range(2000))
+
+    def test_processes(self, tmp_path):
+        """Many writer processes never hand out the same counter twice."""
+        path = tmp_path / 'c'
+        counters.CounterStore(path, slots=2).close()
+        workers, count = 8, 2000
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            futures = [
+                pool.submit(hammer, path, worker % 2, count)
+                for worker in range(workers)
+            ]
+            results = [future.result() for future in futures]
+        for slot in (0, 1):
+            values = sorted(v for r in results[slot::2] for v in r)
+            assert values == list(range(workers // 2 * count))
+        with counters.CounterStore(path) as store:
+            assert store.get(0) == store.get(1) == workers // 2 * count
+
+
+class TestCLI:
+    def run(self, *args):
+        argv = ['prog', '--hotp', *args, 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ']
+        with patch.object(sys, 'argv', argv):
+            oathtool.main()
+
+    def test_counter(self, capsys):
+        self.run('--counter', '1')
+        assert capsys.readouterr().out == '287082\n'
+
+    def test_counter_file(self, tmp_path, capsys):
+        path = str(tmp_path / 'c')
+        for _ in range(2):
+            self.run('--counter-file', path, '--slot', '2')
+        assert capsys.readouterr().out == '755224\n287082\n'
+        with counters.CounterStore(path) as store:
+            assert [store.get(slot) for slot in range(3)] == [0, 0, 2]
+
+    @pytest.mark.parametrize(
+        'argv',
+        [
+            ['--hotp'],
+            ['--hotp', '--counter', '1', '--counter-file', 'c'],
+            ['--counter', '1'],
+            ['--slot', '1', '--hotp', '--counter', '1'],
+            ['--hotp', '--counter', '99999999999999999999'],
+            ['--hotp', '--counter', '-1'],
+            ['--hotp', '--counter-file', 'c', '--slot', '-1'],
+        ],
+    )
+    def test_usage_errors(self, argv):
+        with patch.object(sys, 'argv', ['prog', *argv, 'JBSWY3DPEHPK3PXP']):
+            with pytest.raises(SystemExit) as exc_info:
+                oathtool.main()
+        assert exc_info.value.code == 2
@@ -0,0 +1,241 @@
+"""
+Tests for the Unix socket daemon and its client.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import os
+import socket
+import stat
+import sys
+import tempfile
+import threading
+from unittest.mock import patch
+
+import pytest
+
+import oathtool
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="Unix sockets")
+
+if sys.platform != 'win32':
+    from oathtool import daemon
+
+SECRET = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+
+
+@pytest.fixture
+def socket_path():
+    # AF_UNIX paths are limited to ~100 bytes; tmp_path can be longer
+    with tempfile.TemporaryDirectory() as tmp:
+        yield f'{tmp}/oathtool.sock'
+
+
+@pytest.fixture
+def running(socket_path):
+    """A daemon serving one key on a background event loop."""
+    server = daemon.Server.from_lines([f'demo\t{SECRET}'], export=True)
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    task = loop.create_task(server.serve(socket_path, ready.set))
+
+    def run():
+        with contextlib.suppress(asyncio.CancelledError):
+            loop.run_until_complete(task)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    ready.wait(5)
+    yield socket_path
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join(5)
+    loop.close()
+
+
+class TestServer:
+    """Tests for protocol handling."""
+
+    def test_code_now(self):
+        server = daemon.Server.from_lines([f'demo\t{SECRET}'])
+        assert server.handle_line('CODE demo', now=59) == 'OK 287082'
+
+    def test_verify_window(self):
+        server = daemon.Server.from_lines([f'demo\t{SECRET}'], window=1)
+        # counter 1 is one step behind now=60 (counter 2)
+        assert server.handle_line('VERIFY demo 287082', now=60) == 'OK 1'
+        assert server.handle_line('VERIFY demo 287082', now=120) == 'FAIL'
+
+    def test_key_digest(self):
+        server = daemon.Server()
+        expected = oathtool.generate_otp(SECRET, 2, digest=hashlib.sha256)
+        assert server.handle_line(f'KEY sha256 {SECRET}', now=60) == 'OK ' + expected
+        assert server.handle_line('KEY md5 AAAA').startswith('ERR unsupported')
+
+    def test_errors(self):
+        server = daemon.Server()
+        assert server.handle_line('KEY sha1 KEY0').startswith('ERR Invalid secret key')
+        assert server.handle_line('NOPE').startswith('ERR unknown command')
+
+    def test_add_del(self):
+        server = daemon.Server()
+        assert server.handle_line(f'ADD demo {SECRET}') == 'OK'
+        assert server.handle_line('LABELS') == 'OK demo'
+        assert server.handle_line('CODE demo 1') == 'OK 287082'
+        assert server.handle_line('DEL demo') == 'OK'
+        assert server.handle_line('LABELS') == 'OK'
+        assert server.handle_line('DEL demo') == 'ERR unknown label: demo'
+        assert server.handle_line('ADD demo').startswith('ERR usage')
+        assert server.handle_line('ADD demo KEY0').startswith('ERR Invalid')
+
+    def test_export(self):
+        server = daemon.Server.from_lines([f'demo\t{SECRET}'])
+        assert server.handle_line('EXPORT demo').startswith('ERR EXPORT is disabled')
+        server.export = True
+        assert server.handle_line('EXPORT demo') == f'OK {SECRET}'
+        assert server.handle_line('LABELS') == 'OK demo'
+
+    def test_counter_range(self):
+        server = daemon.Server.from_lines([f'demo\t{SECRET}'])
+        response = server.handle_line('CODE demo 99999999999999999999')
+        assert response.startswith('ERR counter out of range')
+        assert server.handle_line('CODE demo -1').startswith('ERR counter')
+
+    def test_verify_non_ascii(self):
+        server = daemon.Server.from_lines([f'demo\t{SECRET}'])
+        assert server.handle_line('VERIFY demo 12345é', now=60) == 'FAIL'
+
+    def test_invalid_key_list(self):
+        with pytest.raises(ValueError):
+            daemon.Server.from_lines(['bad\tKEY0'])
+
+
+class TestClient:
+    """Tests against a live daemon."""
+
+    def test_requests(self, running):
+        with daemon.Client(running) as client:
+            assert client.request('PING') == ''
+            code = client.code('demo', 1)
+            assert code == '287082'
+            assert client.verify('demo', '000000') is None
+            with pytest.raises(ValueError, match='unknown label'):
+                client.code('nobody')
+
+    def test_move_key(self, running):
+        with daemon.Client(running) as client:
+            client.add('other', client.export('demo'))
+            client.delete('demo')
+            assert client.labels() == ['other']
+            assert client.code('other', 1) == '287082'
+
+    def test_generate_otp(self, running):
+        with patch('time.time', return_value=59):
+            assert daemon.generate_otp(SECRET, running) == '287082'
+
+    def test_fallback(self, socket_path):
+        """No daemon: the code is computed in-process."""
+        with patch('time.time', return_value=59):
+            assert daemon.generate_otp(SECRET, socket_path) == '287082'
+
+    def test_rejects_newlines(self, running):
+        """A word can't smuggle in a second request."""
+        with daemon.Client(running) as client:
+            with pytest.raises(ValueError, match='invalid request word'):
+                client.generate_otp(f'{SECRET}\n{SECRET}')
+            with pytest.raises(ValueError, match='invalid request word'):
+                client.code('demo 1')
+            # the connection is still in step
+            assert client.code('demo', 1) == '287082'
+
+    def test_long_line(self, running):
+        """An over-long line gets an error, and the connection carries on."""
+        with daemon.Client(running) as client:
+            client.file.write(b'CODE ' + b'x' * 200_000 + b'\n')
+            client.file.flush()
+            assert client.file.readline() == b'ERR line too long\n'
+            assert client.code('demo', 1) == '287082'
+
+    def test_spaced_key(self, running):
+        spaced = ' '.join(SECRET[n : n + 4] for n in range(0, 32, 4))
+        with daemon.Client(running) as client:
+            assert client.generate_otp(spaced) == client.generate_otp(SECRET)
+
+    def test_main_multiline_key(self, running, capsys, monkeypatch):
+        monkeypatch.setenv('OATHTOOL_SOCKET', running)
+        with patch.object(sys, 'argv', ['prog', f'{SECRET}\n{SECRET}']):
+            with pytest.raises(SystemExit) as exc_info:
+                oathtool.main()
+        assert exc_info.value.code == 1
+        assert capsys.readouterr().out == ''
+
+    def test_many_concurrent_connections(self, running):
+        """Many simultaneous connections are served by the one loop."""
+
+        async def one():
+            reader, writer = await asyncio.open_unix_connection(running)
+            writer.write(b'CODE demo 1\n')
+            await writer.drain()
+            line = await reader.readline()
+            writer.close()
+            return line
+
+        async def many():
+            return await asyncio.gather(*(one() for _ in range(500)))
+
+        assert set(asyncio.run(many())) == {b'OK 287082\n'}
+
+    def test_main_socket_option(self, running, capsys):
+        argv = ['prog', '--socket', running, SECRET]
+        with patch.object(sys, 'argv', argv), patch('time.time', return_value=59):
+            oathtool.main()
+        assert capsys.readouterr().out.strip() == '287082'
+
+
+class TestSocketPath:
+    """serve() only ever replaces a stale socket."""
+
+    def serve(self, path):
+        server = daemon.Server()
+
+        async def start():
+            task = asyncio.ensure_future(server.serve(path))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+        asyncio.run(start())
+
+    def test_owner_only(self, running):
+        assert stat.S_IMODE(os.stat(running).st_mode) == 0o600
+
+    def test_regular_file(self, socket_path):
+        with open(socket_path, 'w') as file:
+            file.write('precious')
+        with pytest.raises(FileExistsError, match='not a socket'):
+            self.serve(socket_path)
+        with open(socket_path) as file:
+            assert file.read() == 'precious'
+
+    def test_running_daemon(self, running):
+        with pytest.raises(FileExistsError, match='already listening'):
+            self.serve(running)
+        with daemon.Client(running) as client:
+            assert client.code('demo', 1) == '287082'
+
+    def test_stale_socket(self, socket_path):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(socket_path)
+        stale.close()
+        self.serve(socket_path)
+        assert not os.path.exists(socket_path)
+
+    def test_main_refuses(self, socket_path, capsys):
+        with open(socket_path, 'w'):
+            pass
+        with pytest.raises(SystemExit) as exc_info:
+            daemon.main([socket_path])
+        assert exc_info.value.code == 1
+        assert 'not a socket' in capsys.readouterr().err
+        assert os.path.exists(socket_path)
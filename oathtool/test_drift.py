@@ -0,0 +1,91 @@
+"""
+Tests for per-key clock-drift tracking.
+"""
+
+import io
+
+import oathtool
+from oathtool.drift import DriftTracker
+
+key = oathtool.OTPKey('GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ')
+
+
+def count_hmacs(monkeypatch):
+    calls = []
+
+    def truncate(HMAC, orig=oathtool.truncate):
+        calls.append(None)
+        return orig(HMAC)
+
+    monkeypatch.setattr(oathtool, 'truncate', truncate)
+    return calls
+
+
+class TestDriftTracker:
+    def test_learns_offset(self, monkeypatch):
+        tracker = DriftTracker()
+        first, second = key.hotp(98), key.hotp(198)
+        calls = count_hmacs(monkeypatch)
+        assert tracker.verify(5, key, first, t=100 * 30, window=3) == 98
+        assert len(calls) == 4  # 100, 99, 101, 98
+        assert tracker.offset(5) == -2
+        calls.clear()
+        assert tracker.verify(5, key, second, t=200 * 30, window=3) == 198
+        assert len(calls) == 1
+
+    def test_falls_back_to_window_on_miss(self, monkeypatch):
+        tracker = DriftTracker()
+        tracker.record(0, 3)
+        # the client has since drifted one step back
+        code = key.hotp(102)
+        calls = count_hmacs(monkeypatch)
+        assert tracker.verify(0, key, code, t=100 * 30, window=2) == 102
+        assert len(calls) == 6  # 103, then 100, 99, 101, 98, 102
+        assert tracker.offset(0) == 2
+
+    def test_clock_put_right(self):
+        """A client skewed beyond the window is accepted once it is fixed."""
+        tracker = DriftTracker()
+        assert tracker.verify(0, key, key.hotp(13), t=10 * 30, window=3) == 13
+        assert tracker.offset(0) == 3
+        assert tracker.verify(0, key, key.hotp(20), t=20 * 30, window=1) == 20
+        assert tracker.offset(0) == 0
+        assert tracker.verify(0, key, key.hotp(30), t=30 * 30, window=1) == 30
+
+    def test_miss_keeps_offset(self):
+        tracker = DriftTracker()
+        tracker.record(0, 2)
+        assert tracker.verify(0, key, '000000', t=100 * 30) is None
+        assert tracker.offset(0) == 2
+
+    def test_non_ascii_code(self):
+        tracker = DriftTracker()
+        tracker.record(0, 2)
+        assert tracker.verify(0, key, '12345é', t=100 * 30) is None
+        assert tracker.offset(0) == 2
+
+    def test_replay(self):
+        tracker = DriftTracker()
+        code = key.hotp(100)
+        assert tracker.verify(0, key, code, t=100 * 30) == 100
+        assert tracker.verify(0, key, code, t=100 * 30, last_used_counter=100) is None
+
+    def test_clamped(self):
+        tracker = DriftTracker(max_drift=5)
+        tracker.record(0, 50)
+        tracker.record(1, -500)
+        assert (tracker.offset(0), tracker.offset(1)) == (5, -5)
+
+    def test_compact_and_persistable(self):
+        tracker = DriftTracker()
+        tracker.record(999, -1)
+        tracker.record(3, 7)
+        assert len(tracker) == 1000
+        assert tracker.offsets.itemsize == 1
+        buf = io.BytesIO()
+        tracker.save(buf)
+        buf.seek(0)
+        loaded = DriftTracker.load(buf)
+        assert loaded.offsets == tracker.offsets
+        assert loaded.offset(3) == 7
+        assert loaded.offset(5000) == 0
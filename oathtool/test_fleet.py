@@ -0,0 +1,80 @@
+"""
+Tests for the array-backed key fleet.
+"""
+
+import hashlib
+
+import pytest
+
+import oathtool
+from oathtool.fleet import KeyFleet
+from oathtool.sample import secrets
+
+SECRETS = secrets(50)
+
+
+class TestKeyFleet:
+    def test_codes_match_generate_otp(self):
+        fleet = KeyFleet(SECRETS)
+        assert len(fleet) == 50
+        assert fleet.codes_at(1234) == [oathtool.generate_otp(s, 1234) for s in SECRETS]
+
+    def test_sha256(self):
+        fleet = KeyFleet(SECRETS[:3])
+        assert fleet.codes_at(7, hashlib.sha256) == [
+            oathtool.generate_otp(s, 7, digest=hashlib.sha256) for s in SECRETS[:3]
+        ]
+
+    @pytest.mark.parametrize('name', sorted(oathtool.hmac_backends))
+    def test_uses_hmac_backend(self, monkeypatch, name):
+        monkeypatch.setattr(oathtool, '_hmac_backend', name)
+        used = []
+        backend = oathtool.hmac_backends[name]
+        monkeypatch.setitem(
+            oathtool.hmac_backends, name, lambda *args: used.append(1) or backend(*args)
+        )
+        fleet = KeyFleet(SECRETS[:3])
+        assert fleet.codes_at(9) == [oathtool.generate_otp(s, 9) for s in SECRETS[:3]]
+        assert len(used) >= 3
+
+    def test_packed_storage(self):
+        fleet = KeyFleet(SECRETS)
+        assert len(fleet.data) == 50 * 20
+        assert fleet.key(3) == oathtool.decode_key(SECRETS[3])
+
+    def test_add_and_remove_keep_ids(self):
+        fleet = KeyFleet(SECRETS[:10])
+        fleet.remove(2)
+        new_id = fleet.add(SECRETS[10])
+        assert new_id == 10
+        assert 2 not in fleet and 10 in fleet
+        assert len(fleet) == 10
+        codes = fleet.codes_at(99)
+        assert codes[2] is None
+        assert codes[10] == oathtool.generate_otp(SECRETS[10], 99)
+        with pytest.raises(KeyError):
+            fleet.remove(2)
+
+    def test_compaction(self):
+        fleet = KeyFleet(SECRETS[:10])
+        for key_id in range(6):
+            fleet.remove(key_id)
+        # compacted once removed bytes outweighed the live ones
+        assert len(fleet.data) < 10 * 20
+        assert fleet.codes_at(5)[6:] == [
+            oathtool.generate_otp(s, 5) for s in SECRETS[6:10]
+        ]
+        assert fleet.key(9) == oathtool.decode_key(SECRETS[9])
+
+    def test_verify_many(self):
+        fleet = KeyFleet(SECRETS[:3])
+        attempts = [
+            (0, oathtool.generate_otp(SECRETS[0], 100)),
+            (1, oathtool.generate_otp(SECRETS[1], 101)),
+            (2, '000000'),
+        ]
+        assert list(fleet.verify_many(attempts, 100, window=1)) == [100, 101, None]
+
+    def test_invalid_secret(self):
+        with pytest.raises(ValueError, match='Invalid secret key'):
+            KeyFleet(['KEY0'])
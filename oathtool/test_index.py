@@ -0,0 +1,74 @@
+"""
+Tests for the reverse code index.
+"""
+
+import threading
+import time
+
+import oathtool
+from oathtool.index import CodeIndex
+from oathtool.sample import secrets
+
+keys = [oathtool.OTPKey(secret) for secret in secrets(50)]
+
+
+class TestCodeIndex:
+    def test_lookup_every_key(self):
+        index = CodeIndex(keys, t=3000)
+        for key_id, key in enumerate(keys):
+            assert key_id in index.lookup(key.hotp(100), t=3000)
+
+    def test_adjacent_steps(self):
+        index = CodeIndex(keys, t=3000)
+        code = keys[7].hotp(101)
+        assert 7 not in index.lookup(code, t=3000)
+        assert 7 in index.lookup(code, t=3000, window=1)
+        # beyond the indexed window
+        assert index.lookup(keys[7].hotp(105), t=3000, window=5) == []
+
+    def test_shared_codes(self):
+        same = [keys[0], keys[1], keys[0]]
+        index = CodeIndex(same, window=0, t=0)
+        assert index.lookup(keys[0].hotp(0), t=0) == [0, 2]
+
+    def test_incremental_refresh(self, monkeypatch):
+        index = CodeIndex(keys, t=3000)
+        built = []
+        orig = index.build_step
+        monkeypatch.setattr(index, 'build_step', lambda c: built.append(c) or orig(c))
+        index.refresh(t=3010)
+        assert built == []
+        index.refresh(t=3030)
+        assert built == [102]
+        assert sorted(index._steps) == [100, 101, 102]
+
+    def test_update_during_refresh(self, monkeypatch):
+        """update() is not blocked by a refresh, and is not lost by it."""
+        index = CodeIndex(list(keys), t=3000)
+        orig = index.build_step
+
+        def build_step(counter):
+            worker = threading.Thread(target=index.update, args=(3, keys[40]))
+            worker.start()
+            worker.join(5)
+            assert not worker.is_alive()
+            index.update(len(index.keys), keys[41])
+            return orig(counter)
+
+        monkeypatch.setattr(index, 'build_step', build_step)
+        index.refresh(t=3030)
+        for counter in (101, 102):
+            code = keys[40].hotp(counter)
+            assert index.lookup(code, t=3030, window=1).count(3) == 1
+            assert 3 not in index.lookup(keys[3].hotp(counter), t=counter * 30)
+            assert 50 in index.lookup(keys[41].hotp(counter), t=counter * 30)
+
+    def test_background_refresh(self):
+        index = CodeIndex(keys, period=0.05)
+        index.start()
+        try:
+            time.sleep(0.2)
+        finally:
+            index.stop()
+        current = int(time.time() / 0.05)
+        assert current in index._steps or current - 1 in index._steps
@@ -2,6 +2,7 @@
 Unit tests for oathtool CLI interface and I/O functions.
 """
 
+import subprocess
 import sys
 from io import StringIO
 from unittest.mock import Mock, patch
@@ -119,6 +120,32 @@ class TestMain:
             assert exc_info.value.code == 1
             assert 'Invalid secret key' in capsys.readouterr().err
 
+    def test_main_empty_stdin(self, capsys):
+        """Empty stdin falls through to the parser's error."""
+        with patch.object(sys, 'argv', ['prog']):
+            mock_stdin = StringIO('\n')
+            mock_stdin.isatty = Mock(return_value=False)
+            with patch.object(sys, 'stdin', mock_stdin):
+                with pytest.raises(SystemExit) as exc_info:
+                    oathtool.main()
+            assert exc_info.value.code == 2
+            assert 'cannot be empty' in capsys.readouterr().err
+
+    def test_main_fast_path_imports(self):
+        """A lone key is handled without argparse or importlib.metadata."""
+        code = (
+            'import sys, oathtool; '
+            'sys.argv = ["oathtool", "JBSWY3DPEHPK3PXP"]; '
+            'oathtool.main(); '
+            'print(*sorted({"argparse", "importlib.metadata"} & set(sys.modules)))'
+        )
+        proc = subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True, check=True
+        )
+        code, loaded = proc.stdout.splitlines()
+        assert_valid_otp(code)
+        assert loaded == ''
+
     def test_main_argument_priority(self, fixed_time, capsys):
         """Command line argument takes priority over stdin."""
         with patch.object(sys, 'argv', ['prog', 'JBSWY3DPEHPK3PXP']):
@@ -153,3 +180,124 @@ class TestErrorHandling:
         with pytest.raises(ValueError) as exc_info:
             oathtool.generate_otp(invalid_key, 1)
         assert 'Invalid secret key' in str(exc_info.value)
+
+
+def batch_stdin(text):
+    mock_stdin = StringIO(text)
+    mock_stdin.isatty = Mock(return_value=False)
+    return patch.object(sys, 'stdin', mock_stdin)
+
+
+class TestBatch:
+    """Tests for --batch streaming mode."""
+
+    def test_batch_labels(self, fixed_time, capsys):
+        """Labeled and unlabeled lines produce 'label code' output."""
+        text = 'github\tJBSWY3DPEHPK3PXP\n\nMZXW6YTBOJUWU23MNU\n'
+        with patch.object(sys, 'argv', ['prog', '--batch']), batch_stdin(text):
+            oathtool.main()
+        lines = capsys.readouterr().out.splitlines()
+        expected = oathtool.generate_otp('JBSWY3DPEHPK3PXP')
+        assert lines[0] == f'github {expected}'
+        label, code = lines[1].split()
+        assert label == '3'
+        assert_valid_otp(code)
+
+    def test_batch_json(self, fixed_time, capsys):
+        """--format json writes one JSON object per line."""
+        import json
+
+        text = 'a\tJBSWY3DPEHPK3PXP\nb\tMZXW6YTBOJUWU23MNU\n'
+        argv = ['prog', '--batch', '--format', 'json']
+        with patch.object(sys, 'argv', argv), batch_stdin(text):
+            oathtool.main()
+        records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert [r['label'] for r in records] == ['a', 'b']
+        for record in records:
+            assert_valid_otp(record['code'])
+
+    def test_batch_bad_lines(self, fixed_time, capsys):
+        """Bad lines are reported to stderr without aborting."""
+        text = 'bad\tKEY0KEY\ngood\tJBSWY3DPEHPK3PXP\n'
+        with patch.object(sys, 'argv', ['prog', '--batch']), batch_stdin(text):
+            with pytest.raises(SystemExit) as exc_info:
+                oathtool.main()
+        assert exc_info.value.code == 1
+        captured = capsys.readouterr()
+        assert captured.out.startswith('good ')
+        assert captured.err.startswith('line 1: Invalid secret key')
+
+    def test_batch_rejects_key_argument(self):
+        """--batch does not accept a key argument."""
+        argv = ['prog', '--batch', 'JBSWY3DPEHPK3PXP']
+        with patch.object(sys, 'argv', argv), batch_stdin(''):
+            with pytest.raises(SystemExit) as exc_info:
+                oathtool.main()
+        assert exc_info.value.code == 2
+
+    def test_generate_batch_is_lazy(self):
+        """Lines are consumed only as results are requested."""
+        consumed = []
+
+        def lines():
+            for n in range(3):
+                consumed.append(n)
+                yield 'JBSWY3DPEHPK3PXP'
+
+        results = oathtool.generate_batch(lines())
+        next(results)
+        assert consumed == [0]
+
+
+class TestBulk:
+    """Tests for the parallel bulk engine and --jobs."""
+
+    lines = ['JBSWY3DPEHPK3PXP', 'x\tKEY0', '', 'y\tMZXW6YTBOJUWU23MNU'] * 5
+
+    @pytest.mark.parametrize('executor', ['thread', 'process'])
+    def test_matches_batch_in_order(self, executor):
+        """Results match generate_batch in input order across chunks."""
+        expected = oathtool.generate_batch(self.lines)
+        results = oathtool.generate_bulk(
+            self.lines, jobs=2, executor=executor, chunk_size=3
+        )
+        # worker processes see the real clock, so compare all but the codes
+        assert [(n, label, error) for n, label, _, error in results] == [
+            (n, label, error) for n, label, _, error in expected
+        ]
+
+    def test_thread_codes(self, fixed_time):
+        """Thread backend codes match generate_otp."""
+        results = oathtool.generate_bulk(
+            ['JBSWY3DPEHPK3PXP'] * 10, jobs=3, executor='thread', chunk_size=2
+        )
+        expected = oathtool.generate_otp('JBSWY3DPEHPK3PXP')
+        assert [code for _, _, code, _ in results] == [expected] * 10
+
+    def test_main_jobs(self, fixed_time, capsys):
+        """--jobs produces the same output as plain --batch."""
+        text = 'a\tJBSWY3DPEHPK3PXP\nb\tMZXW6YTBOJUWU23MNU\n'
+        with patch.object(sys, 'argv', ['prog', '--batch']), batch_stdin(text):
+            oathtool.main()
+        serial = capsys.readouterr().out
+        argv = ['prog', '--batch', '--jobs', '1']
+        with patch.object(sys, 'argv', argv), batch_stdin(text):
+            oathtool.main()
+        assert capsys.readouterr().out == serial
+
+    def test_main_jobs_requires_batch(self, mock_tty_stdin):
+        """--jobs without --batch is a usage error."""
+        argv = ['prog', '--jobs', '2', 'JBSWY3DPEHPK3PXP']
+        with patch.object(sys, 'argv', argv):
+            with pytest.raises(SystemExit) as exc_info:
+                oathtool.main()
+        assert exc_info.value.code == 2
+
+    def test_main_jobs_negative(self, capsys):
+        """A negative --jobs is a usage error, not an executor traceback."""
+        argv = ['prog', '--batch', '--jobs', '-2']
+        with patch.object(sys, 'argv', argv):
+            with pytest.raises(SystemExit) as exc_info:
+                oathtool.main()
+        assert exc_info.value.code == 2
+        assert 'must be 0 or more' in capsys.readouterr().err
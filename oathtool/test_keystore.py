@@ -0,0 +1,124 @@
+"""
+Tests for the memory-mapped keystore.
+"""
+
+import hashlib
+import io
+import sys
+from unittest.mock import patch
+
+import pytest
+
+import oathtool
+from oathtool import keystore
+from oathtool.sample import secrets
+
+RFC_SHA1 = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+RFC_SHA256 = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQGEZA'
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    lines = [
+        f'rfc\t{RFC_SHA1}\n',
+        f'otpauth://totp/ACME:rfc256?secret={RFC_SHA256}&algorithm=SHA256\n',
+        f'otpauth://totp/minute?secret={RFC_SHA1}&period=60\n',
+        '\n',
+        'bad\tKEY0\n',
+    ]
+    lines += [f'acct{n}\t{secret}\n' for n, secret in enumerate(secrets(100))]
+    path = tmp_path / 'keys.oks'
+    keystore.build(path, keystore.parse_lines(lines, err=io.StringIO()))
+    return path
+
+
+class TestKeyStore:
+    def test_lookup(self, store_path):
+        with keystore.KeyStore(store_path) as store:
+            assert len(store) == 103
+            assert 'rfc' in store and 'bad' not in store
+            assert store.generate_otp('rfc', t=59) == '287082'
+            assert store.generate_otp('ACME:rfc256', t=59) == '119246'
+            assert store['ACME:rfc256'].digest is hashlib.sha256
+            assert store.generate_otp('minute', t=119) == '287082'
+            with pytest.raises(KeyError):
+                store['missing']
+
+    def test_all_labels_found(self, store_path):
+        with keystore.KeyStore(store_path) as store:
+            for n, secret in enumerate(secrets(100)):
+                entry = store[f'acct{n}']
+                assert entry.key.key == oathtool.decode_key(secret)
+
+    def test_iteration(self, store_path):
+        with keystore.KeyStore(store_path) as store:
+            labels = [entry.label for entry in store]
+        assert labels[:3] == ['rfc', 'ACME:rfc256', 'minute']
+        assert len(labels) == 103
+
+    def test_not_a_keystore(self, tmp_path):
+        path = tmp_path / 'junk'
+        path.write_bytes(b'junk')
+        with pytest.raises(ValueError, match='not an oathtool keystore'):
+            keystore.KeyStore(path)
+
+    def test_duplicate_label(self, tmp_path):
+        entries = [('a', b'k', 'sha1', 30)] * 2
+        with pytest.raises(ValueError, match='duplicate'):
+            keystore.build(tmp_path / 'dup.oks', entries)
+
+    @pytest.mark.parametrize('period', [0, 70000])
+    def test_period_out_of_range(self, period):
+        uri = f'otpauth://totp/x?secret={RFC_SHA1}&period={period}'
+        with pytest.raises(ValueError, match='period must be'):
+            keystore.parse_uri(uri)
+
+    def test_label_too_long(self, tmp_path):
+        entries = [('x' * 70000, b'k', 'sha1', 30)]
+        with pytest.raises(ValueError, match='label too long'):
+            keystore.build(tmp_path / 'long.oks', entries)
+
+    def test_failed_build_keeps_store(self, store_path):
+        before = store_path.read_bytes()
+        entries = [('a', b'k', 'sha1', 30), ('b', b'k', 'sha1', 0)]
+        with pytest.raises(ValueError):
+            keystore.build(store_path, entries)
+        assert store_path.read_bytes() == before
+        assert list(store_path.parent.iterdir()) == [store_path]
+
+    def test_parse_errors_reported(self):
+        err = io.StringIO()
+        lines = ['bad\tKEY0\n', 'otpauth://hotp/x?secret=AAAA\n', 'ok\tAAAA\n']
+        entries = list(keystore.parse_lines(lines, err=err))
+        assert [entry[0] for entry in entries] == ['ok']
+        assert err.getvalue().splitlines()[0].startswith('line 1: Invalid secret key')
+        assert 'line 2: only otpauth://totp/' in err.getvalue()
+
+    def test_build_cli(self, tmp_path, capsys):
+        source = tmp_path / 'secrets.txt'
+        source.write_text(f'rfc\t{RFC_SHA1}\n')
+        keystore.main(['build', str(tmp_path / 'out.oks'), str(source)])
+        assert 'wrote 1 keys' in capsys.readouterr().err
+        with keystore.KeyStore(tmp_path / 'out.oks') as store:
+            assert store.generate_otp('rfc', t=59) == '287082'
+
+
+class TestMainStore:
+    def test_store_label(self, store_path, capsys):
+        argv = ['prog', '--store', str(store_path), '--label', 'rfc']
+        with patch.object(sys, 'argv', argv), patch('time.time', return_value=59):
+            oathtool.main()
+        assert capsys.readouterr().out.strip() == '287082'
+
+    def test_missing_label(self, store_path, capsys):
+        argv = ['prog', '--store', str(store_path), '--label', 'nobody']
+        with patch.object(sys, 'argv', argv), pytest.raises(SystemExit) as exc_info:
+            oathtool.main()
+        assert exc_info.value.code == 1
+        assert "no key labeled 'nobody'" in capsys.readouterr().err
+
+    def test_label_requires_store(self):
+        with patch.object(sys, 'argv', ['prog', '--label', 'rfc']):
+            with pytest.raises(SystemExit) as exc_info:
+                oathtool.main()
+        assert exc_info.value.code == 2
@@ -0,0 +1,139 @@
+"""
+Tests for the load-generation harness.
+"""
+
+import json
+import sys
+
+import pytest
+
+from oathtool import loadtest
+from oathtool.sample import secrets
+
+keys = [(f'key{n}', secret) for n, secret in enumerate(secrets(20))]
+
+
+class TestHistogram:
+    def test_precision(self):
+        """Every value lands in a bucket within 1/128 of it."""
+        hist = loadtest.Histogram()
+        for nanos in (1, 127, 128, 129, 10**6, 10**6 + 1, 10**10):
+            hist.record(nanos)
+        for value, count in hist.buckets():
+            assert count
+        assert hist.percentile(100) == 10**10
+        assert hist.percentile(0) == 1
+        assert 10**6 <= hist.percentile(70) < 10**6 * (1 + 1 / 128)
+
+    def test_merge(self):
+        first, second, both = (loadtest.Histogram() for _ in range(3))
+        for nanos in range(1, 5000, 7):
+            (first if nanos % 2 else second).record(nanos)
+            both.record(nanos)
+        first.merge(second)
+        assert first.to_dict() == both.to_dict()
+
+    def test_empty(self):
+        data = loadtest.Histogram().to_dict()
+        assert data['count'] == 0
+        assert data['mean'] is None
+
+
+class TestRun:
+    def test_requests(self):
+        worker = loadtest.in_process(keys, 'generate')
+        hist, elapsed, errors, mismatches = loadtest.run(
+            worker, concurrency=3, requests=500
+        )
+        assert (hist.count, errors, mismatches) == (500, 0, 0)
+
+    def test_verify(self):
+        worker = loadtest.in_process(keys, 'verify', window=2)
+        hist, elapsed, errors, mismatches = loadtest.run(worker, requests=100)
+        assert (hist.count, errors, mismatches) == (100, 0, 0)
+
+    def test_rate(self):
+        """At a target rate, requests are spread over the duration."""
+        worker = loadtest.in_process(keys, 'generate')
+        hist, elapsed, errors, mismatches = loadtest.run(
+            worker, concurrency=2, rate=200, duration=0.25
+        )
+        assert hist.count == 50
+        assert elapsed >= 0.24
+
+    def test_errors(self):
+        def worker():
+            def request(n):
+                if n % 2:
+                    raise OSError('refused')
+                return n % 4 == 0
+
+            return request
+
+        hist, elapsed, errors, mismatches = loadtest.run(worker, requests=8)
+        assert (hist.count, errors, mismatches) == (4, 4, 2)
+
+    def test_failed_worker_closes_others(self):
+        """Request functions already made are closed if a later one fails."""
+        made, closed = [], []
+
+        def worker():
+            if made:
+                raise OSError('refused')
+
+            def request(n):
+                return True
+
+            request.close = lambda: closed.append(request)
+            made.append(request)
+            return request
+
+        with pytest.raises(OSError):
+            loadtest.run(worker, concurrency=3, requests=10)
+        assert closed == made
+
+
+class TestMain:
+    def test_text(self, capsys):
+        loadtest.main(['--keys', '5', '--requests', '50'])
+        out = capsys.readouterr().out
+        assert '50 requests in' in out
+        assert '  p99.9 ' in out
+        assert 'histogram:' in out
+        assert out.rstrip().endswith('#')
+
+    def test_json(self, capsys):
+        loadtest.main(['--operation', 'verify', '--requests', '50', '--json'])
+        summary = json.loads(capsys.readouterr().out)
+        assert summary['requests'] == summary['latency']['count'] == 50
+        assert summary['mismatches'] == 0
+        assert list(summary['latency']['percentiles']) == ['50', '95', '99', '99.9']
+
+    def test_key_file(self, tmp_path, capsys):
+        path = tmp_path / 'keys'
+        path.write_text(''.join(f'{label}\t{secret}\n' for label, secret in keys))
+        loadtest.main(['--key-file', str(path), '--requests', '10', '--json'])
+        assert json.loads(capsys.readouterr().out)['keys'] == 20
+
+    @pytest.mark.parametrize(
+        'argv',
+        [
+            ['--rate', '-5'],
+            ['--rate', '0'],
+            ['--duration', '-1'],
+            ['--requests', '-1'],
+            ['--concurrency', '0'],
+        ],
+    )
+    def test_usage_errors(self, argv):
+        with pytest.raises(SystemExit) as exc_info:
+            loadtest.main(argv)
+        assert exc_info.value.code == 2
+
+    @pytest.mark.skipif(sys.platform == 'win32', reason='needs Unix sockets')
+    def test_serve(self, capsys):
+        argv = ['--serve', '--keys', '5', '--operation', 'verify']
+        loadtest.main([*argv, '--requests', '20', '--json'])
+        summary = json.loads(capsys.readouterr().out)
+        assert summary['target'].endswith('socket')
+        assert (summary['errors'], summary['mismatches']) == (0, 0)
@@ -0,0 +1,105 @@
+"""
+Tests for the opt-in instrumentation.
+"""
+
+import os
+import subprocess
+import sys
+import urllib.request
+
+import pytest
+
+import oathtool
+from oathtool import metrics
+
+SECRET = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+
+
+@pytest.fixture(autouse=True)
+def clean():
+    yield
+    metrics.disable()
+    metrics.reset()
+
+
+class TestInstrumentation:
+    def test_disabled_is_untouched(self):
+        """Disabling restores the very same function objects."""
+        before = [owner.__dict__[name] for owner, name in metrics.targets]
+        metrics.enable()
+        metrics.enable()
+        assert metrics.is_enabled()
+        assert oathtool.generate_otp is not before[0]
+        metrics.disable()
+        assert [owner.__dict__[name] for owner, name in metrics.targets] == before
+
+    def test_counts(self):
+        with metrics.instrumented():
+            assert oathtool.generate_otp(SECRET, 1) == '287082'
+            assert oathtool.verify_otp(SECRET, '287082', t=59) == 1
+        oathtool.generate_otp(SECRET, 1)  # not counted once disabled
+        counts = {op: metric['count'] for op, metric in metrics.snapshot().items()}
+        # verify_otp checks the current step (counter 1) first
+        assert counts == dict(
+            generate_otp=1, verify_otp=1, decode_key=2, hmac=2, truncate=2
+        )
+        metric = metrics.snapshot()['generate_otp']
+        assert sum(metric['buckets']) == 1
+        assert metric['sum'] > 0
+
+    def test_errors(self):
+        with metrics.instrumented():
+            with pytest.raises(ValueError):
+                oathtool.generate_otp('!!', 1)
+        assert metrics.snapshot()['generate_otp']['errors'] == 1
+        assert metrics.snapshot()['decode_key']['errors'] == 1
+
+    def test_prometheus(self):
+        with metrics.instrumented():
+            oathtool.hmac(b'key', b'msg')
+        text = metrics.prometheus()
+        assert '# TYPE oathtool_duration_seconds histogram' in text
+        assert 'oathtool_duration_seconds_bucket{op="hmac",le="+Inf"} 1\n' in text
+        assert 'oathtool_duration_seconds_count{op="hmac"} 1\n' in text
+        assert 'oathtool_errors_total{op="hmac"} 0\n' in text
+
+    def test_reset(self):
+        with metrics.instrumented():
+            oathtool.hmac(b'key', b'msg')
+        metrics.reset()
+        assert metrics.snapshot() == {}
+
+
+class TestExport:
+    def test_write(self, tmp_path):
+        with metrics.instrumented():
+            oathtool.hmac(b'key', b'msg')
+        metrics.write(tmp_path / 'oathtool.prom')
+        assert (tmp_path / 'oathtool.prom').read_text() == metrics.prometheus()
+        assert os.listdir(tmp_path) == ['oathtool.prom']
+
+    def test_serve(self):
+        with metrics.instrumented():
+            oathtool.hmac(b'key', b'msg')
+        server = metrics.serve(('127.0.0.1', 0))
+        try:
+            url = 'http://127.0.0.1:%d/metrics' % server.server_address[1]
+            with urllib.request.urlopen(url) as response:
+                assert response.read().decode() == metrics.prometheus()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_command_line(self, tmp_path):
+        """$OATHTOOL_METRICS makes the command line write its metrics."""
+        path = tmp_path / 'oathtool.prom'
+        env = dict(os.environ, OATHTOOL_METRICS=str(path))
+        subprocess.run(
+            [sys.executable, '-m', 'oathtool', SECRET],
+            env=env,
+            capture_output=True,
+            check=True,
+        )
+        text = path.read_text()
+        assert 'oathtool_duration_seconds_count{op="generate_otp"} 1\n' in text
+        assert 'oathtool_startup_cpu_seconds ' in text
@@ -0,0 +1,86 @@
+"""
+Tests for the precompute-ahead scheduler.
+"""
+
+import asyncio
+import threading
+import time
+
+import oathtool
+from oathtool.sample import secrets
+from oathtool.scheduler import Precomputer
+
+keys = {f'acct{n}': oathtool.OTPKey(secret) for n, secret in enumerate(secrets(20))}
+
+
+class TestPrecomputer:
+    def test_codes_match(self):
+        scheduler = Precomputer(keys)
+        codes = scheduler.codes(t=3000)
+        assert codes == {label: key.hotp(100) for label, key in keys.items()}
+        assert scheduler.code('acct3', t=3000) == keys['acct3'].hotp(100)
+
+    def test_precomputed_step_is_served(self, monkeypatch):
+        scheduler = Precomputer(keys)
+        scheduler.precompute(101, deadline=3030, now=3025)
+        monkeypatch.setattr(scheduler, 'compute', None)  # must not be called
+        assert scheduler.codes(t=3030)['acct0'] == keys['acct0'].hotp(101)
+
+    def test_old_steps_pruned(self):
+        scheduler = Precomputer(keys)
+        for counter in range(100, 105):
+            scheduler.precompute(counter, deadline=counter * 30)
+        assert sorted(scheduler._steps) == [103, 104]
+
+    def test_concurrent_publish(self):
+        scheduler = Precomputer(keys)
+
+        def publish(counter):
+            for _ in range(200):
+                scheduler._publish(counter, {})
+
+        threads = [
+            threading.Thread(target=publish, args=(100 + n % 2,)) for n in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(scheduler._steps) == [100, 101]
+
+    def test_instrumentation(self):
+        scheduler = Precomputer(keys, history=2)
+        scheduler.precompute(101, deadline=3030, now=3025)
+        scheduler.precompute(102, deadline=3060, now=3061)
+        scheduler.precompute(103, deadline=3090, now=3085)
+        assert [p.counter for p in scheduler.passes] == [102, 103]
+        assert [p.missed for p in scheduler.passes] == [True, False]
+        assert scheduler.missed == 1
+        assert all(p.duration > 0 for p in scheduler.passes)
+
+    def test_plan(self):
+        scheduler = Precomputer(keys, lead=5)
+        assert scheduler.plan(3010) == (101, 3025, 3030)
+        scheduler.precompute(101, deadline=3030)
+        assert scheduler.plan(3026) == (102, 3055, 3060)
+
+    def test_background_thread(self):
+        scheduler = Precomputer(keys, lead=0.05, period=0.1)
+        scheduler.start()
+        try:
+            time.sleep(0.35)
+        finally:
+            scheduler.stop()
+        assert len(scheduler.passes) >= 2
+        assert scheduler.missed == 0
+
+    def test_asyncio_task(self):
+        scheduler = Precomputer(keys, lead=0.05, period=0.1)
+
+        async def run_for(seconds):
+            task = asyncio.create_task(scheduler.run())
+            await asyncio.sleep(seconds)
+            task.cancel()
+
+        asyncio.run(run_for(0.35))
+        assert len(scheduler.passes) >= 2
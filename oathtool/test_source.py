@@ -0,0 +1,197 @@
+"""
+Tests for the hot-reloading key source.
+"""
+
+import os
+import random
+import time
+
+import pytest
+
+import oathtool
+from oathtool.sample import secrets
+from oathtool.source import KeySource, LabelIndex
+
+fleet = secrets(50)
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / 'secrets.txt'
+    write(path, [f'user{n}\t{fleet[n]}' for n in range(10)])
+    return path
+
+
+def write(path, lines):
+    """Replace the file atomically, as a deployment would."""
+    temp = f'{path}.tmp'
+    with open(temp, 'w', encoding='utf-8') as file:
+        file.writelines(line + '\n' for line in lines)
+    os.replace(temp, path)
+
+
+def snapshot(source):
+    return {label: key.key for label, key in source.keys.items()}
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    """A list recording each secret decoded."""
+    decoded = []
+    orig = oathtool.b32decode
+
+    def b32decode(key):
+        decoded.append(key)
+        return orig(key)
+
+    monkeypatch.setattr(oathtool, 'b32decode', b32decode)
+    return decoded
+
+
+class TestKeySource:
+    def test_load(self, path):
+        source = KeySource(path)
+        assert sorted(source.keys) == sorted(f'user{n}' for n in range(10))
+        assert source.keys['user3'].hotp(1) == oathtool.generate_otp(fleet[3], 1)
+
+    def test_poll_unchanged(self, path):
+        source = KeySource(path)
+        assert source.poll() is None
+
+    def test_delta(self, path, decodes):
+        source = KeySource(path)
+        before = source.keys
+        decodes.clear()
+        lines = [f'user{n}\t{fleet[n]}' for n in range(10) if n != 4]
+        lines[0] = f'user0\t{fleet[20]}'
+        lines.append(f'user10\t{fleet[10]}')
+        write(path, lines)
+        change = source.poll()
+        assert change == (['user10'], ['user4'], ['user0'], [])
+        assert sorted(decodes) == sorted([fleet[20], fleet[10]])
+        assert source.keys['user0'].key == oathtool.decode_key(fleet[20])
+        # readers holding the previous snapshot are unaffected
+        assert 'user4' in before and 'user10' not in before
+        assert before['user0'].key == oathtool.decode_key(fleet[0])
+
+    def test_reformatted(self, path):
+        source = KeySource(path)
+        spaced = ' '.join(fleet[1][i : i + 4] for i in range(0, 32, 4)).lower()
+        lines = [f'user{n}\t{fleet[n]}' for n in range(10)]
+        lines[1] = f'user1\t{spaced}'
+        write(path, lines)
+        assert source.reload() == ([], [], [], [])
+
+    def test_invalid(self, path):
+        lines = [f'user{n}\t{fleet[n]}' for n in range(10)]
+        lines[2] = 'user2\t!!'
+        write(path, lines)
+        source = KeySource(path)
+        assert 'user2' not in source.keys
+        # a bad rotation drops the key rather than keeping the old secret
+        lines[3] = 'user3\tKEY0'
+        write(path, lines)
+        change = source.reload()
+        assert change.removed == ['user3']
+        assert [(lineno, label) for lineno, label, _ in change.invalid] == [
+            (4, 'user3')
+        ]
+        lines[2] = f'user2\t{fleet[2]}'
+        write(path, lines)
+        assert source.reload().added == ['user2']
+
+    def test_numbered_and_duplicates(self, path):
+        """Unlabeled lines and repeated labels force a full parse."""
+        write(path, [fleet[0], f'dup\t{fleet[1]}', f'dup\t{fleet[2]}'])
+        source = KeySource(path)
+        assert snapshot(source) == {
+            '1': oathtool.decode_key(fleet[0]),
+            'dup': oathtool.decode_key(fleet[1]),
+        }
+        write(path, [f'new\t{fleet[3]}', fleet[0], f'dup\t{fleet[2]}'])
+        change = source.reload()
+        assert sorted(change.added) == ['2', 'new']
+        assert change.removed == ['1']
+        assert change.rotated == ['dup']
+
+    def test_matches_full_load(self, path):
+        """After any series of edits, the keys are those of a fresh load."""
+        rand = random.Random(0)
+        source = KeySource(path)
+        lines = [f'user{n}\t{fleet[n]}' for n in range(10)]
+        for _ in range(200):
+            edit = rand.randrange(6)
+            if edit == 0 and lines:
+                del lines[rand.randrange(len(lines))]
+            elif edit == 1:
+                label = f'user{rand.randrange(30)}'
+                lines.insert(
+                    rand.randrange(len(lines) + 1), f'{label}\t{rand.choice(fleet)}'
+                )
+            elif edit == 2 and lines:
+                n = rand.randrange(len(lines))
+                label = oathtool.parse_key_line(lines[n])[0]
+                lines[n] = f'{label}\t{rand.choice(fleet)}'
+            elif edit == 3:
+                lines.insert(rand.randrange(len(lines) + 1), rand.choice(['', 'x\t!!']))
+            elif edit == 4:
+                lines.insert(rand.randrange(len(lines) + 1), rand.choice(fleet))
+            elif edit == 5 and lines:
+                lines.append(rand.choice(lines))
+            write(path, lines)
+            source.reload()
+            assert snapshot(source) == snapshot(KeySource(path))
+
+    def test_background(self, path):
+        source = KeySource(path)
+        source.start(interval=0.01)
+        try:
+            write(path, [f'other\t{fleet[0]}'])
+            for _ in range(500):
+                if list(source.keys) == ['other']:
+                    break
+                time.sleep(0.01)
+            assert list(source.keys) == ['other']
+        finally:
+            source.stop()
+
+    def test_failing_listener(self, path, caplog):
+        source = KeySource(path)
+        seen = []
+
+        def broken(change, keys):
+            raise RuntimeError('listener bug')
+
+        source.subscribe(broken)
+        source.subscribe(lambda change, keys: seen.append(change.added))
+        source.start(interval=0.01)
+        try:
+            for label in ('other', 'third'):
+                write(path, [f'{label}\t{fleet[0]}'])
+                for _ in range(500):
+                    if list(source.keys) == [label]:
+                        break
+                    time.sleep(0.01)
+        finally:
+            source.stop()
+        assert seen == [['other'], ['third']]
+        assert 'listener bug' in caplog.text
+
+
+class TestLabelIndex:
+    def test_follows_source(self, path, monkeypatch):
+        source = KeySource(path)
+        index = LabelIndex(source, t=59)
+        assert index.lookup(oathtool.generate_otp(fleet[5], 1), t=59) == ['user5']
+        lines = [f'user{n}\t{fleet[n]}' for n in range(10) if n != 5]
+        lines[0] = f'user0\t{fleet[30]}'
+        lines.append(f'user11\t{fleet[11]}')
+        write(path, lines)
+        builds = []
+        monkeypatch.setattr(index.index, 'build_step', builds.append)
+        source.reload()
+        assert builds == []
+        assert index.lookup(oathtool.generate_otp(fleet[5], 1), t=59) == []
+        assert index.lookup(oathtool.generate_otp(fleet[30], 1), t=59) == ['user0']
+        assert index.lookup(oathtool.generate_otp(fleet[0], 1), t=59) == []
+        assert index.lookup(oathtool.generate_otp(fleet[11], 1), t=59) == ['user11']
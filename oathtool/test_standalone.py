@@ -0,0 +1,61 @@
+"""
+Tests for the standalone script builder, generate-script.
+"""
+
+import os
+import runpy
+import subprocess
+import sys
+
+import pytest
+
+import oathtool
+
+generate = runpy.run_path(
+    os.path.join(os.path.dirname(oathtool.__file__), 'generate-script.py')
+)
+
+
+class TestStrip:
+    """Tests for stripping the module for a standalone build."""
+
+    def test_docstrings_removed(self):
+        """Module, attribute and function docstrings all go."""
+        code = generate['strip'](
+            '"""Module."""\nx = 1\n"""Attribute."""\ndef f():\n    """Function."""\n',
+            '1.0',
+        )
+        assert '"""' not in code and "'" not in code
+        namespace = {}
+        exec(code, namespace)
+        assert namespace['f']() is None
+
+    def test_version_fixed(self):
+        """get_version returns the build-time version, and codes still work."""
+        with open(oathtool.__file__, encoding='utf-8') as file:
+            code = generate['strip'](file.read(), '1.2.3')
+        namespace = {}
+        exec(code, namespace)
+        assert namespace['get_version']() == '1.2.3'
+        assert namespace['generate_otp']('JBSWY3DPEHPK3PXP', 1) == '996554'
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='Unix executable scripts')
+class TestStandalone:
+    """The generated scripts run on their own."""
+
+    @pytest.mark.parametrize('format', ['script', 'stripped', 'zipapp'])
+    def test_generates_code(self, tmp_path, format):
+        """Each format prints a code without the oathtool package."""
+        target = tmp_path / 'oathtool'
+        target.write_bytes(generate['standalone'](format))
+        # run from elsewhere so the oathtool package cannot be imported
+        proc = subprocess.run(
+            [sys.executable, '-I', target, 'JBSWY3DPEHPK3PXP'],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=tmp_path,
+        )
+        code = proc.stdout.strip()
+        assert len(code) == 6 and code.isdigit()
@@ -0,0 +1,102 @@
+"""
+Tests for vectorized bulk generation.
+"""
+
+import hashlib
+
+import pytest
+
+import oathtool
+from oathtool import vector
+from oathtool.sample import secrets
+
+RAW = [oathtool.decode_key(secret) for secret in secrets(64)]
+
+
+def expected(counter, digest=hashlib.sha1):
+    return [oathtool.OTPKey.from_bytes(key).hotp(counter, digest) for key in RAW]
+
+
+class TestFallback:
+    def test_bulk_codes_without_numpy(self, monkeypatch):
+        monkeypatch.setattr(vector, 'np', None)
+        assert vector.bulk_codes(RAW, 99) == expected(99)
+
+    def test_numpy_functions_require_numpy(self, monkeypatch):
+        monkeypatch.setattr(vector, 'np', None)
+        with pytest.raises(ImportError, match='oathtool\\[vector\\]'):
+            vector.digest_matrix(RAW, 1)
+
+
+class TestNumPy:
+    @pytest.fixture(autouse=True)
+    def numpy(self):
+        return pytest.importorskip('numpy')
+
+    @pytest.mark.parametrize('digest', [hashlib.sha1, hashlib.sha256, hashlib.sha512])
+    def test_bulk_codes(self, digest):
+        assert vector.bulk_codes(RAW, 12345, digest) == expected(12345, digest)
+
+    def test_digest_matrix_shape(self):
+        assert vector.digest_matrix(RAW, 1, hashlib.sha256).shape == (64, 32)
+
+    def test_every_offset(self, numpy):
+        """All 16 truncation offsets, including the last possible one."""
+        rows = numpy.array(
+            [list(range(i * 3, i * 3 + 19)) + [i] for i in range(16)], numpy.uint8
+        )
+        codes = vector.truncate_array(rows)
+        assert [f'{code:06d}' for code in codes] == [
+            oathtool.truncate(bytes(row)) for row in rows
+        ]
+
+    def test_high_bit_masked(self, numpy):
+        rows = numpy.full((1, 20), 0xFF, numpy.uint8)
+        assert vector.truncate_array(rows)[0] == 0x7FFFFFFF % 1000000
+
+    def test_format_codes(self, numpy):
+        codes = numpy.array([0, 7, 999999], numpy.uint32)
+        assert vector.format_codes(codes) == b'000000\n000007\n999999\n'
+        assert vector.format_codes(codes, b'') == b'000000000007999999'
+
+    def test_empty(self):
+        assert vector.bulk_codes([], 1) == []
+
+
+class TestHMACBatch:
+    @pytest.fixture(autouse=True)
+    def numpy(self):
+        return pytest.importorskip('numpy')
+
+    def test_rfc4226_vectors(self):
+        batch = vector.HMACBatch([b'12345678901234567890'])
+        codes = [f'{batch.codes(counter)[0]:06d}' for counter in range(10)]
+        assert codes == [
+            '755224', '287082', '359152', '969429', '338314',
+            '254676', '287922', '162583', '399871', '520489',
+        ]  # fmt: skip
+
+    @pytest.mark.parametrize(
+        'key,digest,expected',
+        [
+            (b'12345678901234567890', hashlib.sha1, '005924'),
+            (b'12345678901234567890123456789012', hashlib.sha256, '819424'),
+        ],
+    )
+    def test_rfc6238_vectors(self, key, digest, expected):
+        batch = vector.HMACBatch([key], digest)
+        assert f'{batch.codes(1234567890 // 30)[0]:06d}' == expected
+
+    @pytest.mark.parametrize('digest', [hashlib.sha1, hashlib.sha256])
+    def test_matches_hmac_bit_for_bit(self, digest):
+        keys = RAW + [b'', b'k', b'x' * 63, b'y' * 64, b'z' * 65, b'w' * 200]
+        batch = vector.HMACBatch(keys, digest)
+        for counter in (0, 1, 2**40 + 7):
+            msg = oathtool._counter.pack(counter)
+            assert [bytes(row) for row in batch.digests(counter)] == [
+                oathtool.hmac(key, msg, digest) for key in keys
+            ]
+
+    def test_unsupported_digest(self):
+        with pytest.raises(ValueError, match='unsupported digest'):
+            vector.HMACBatch(RAW, hashlib.sha512)
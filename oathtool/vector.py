@@ -0,0 +1,236 @@
+"""
+Vectorized code generation for many keys at once, using NumPy when it
+is installed (``pip install oathtool[vector]``).
+
+The HMACs are still computed one key at a time; their digests are then
+collected into one ``(N, digest_size)`` uint8 array, and the dynamic
+truncation, 31-bit extraction and reduction to six digits run over all
+rows in a single vectorized pass.
+
+>>> keys = [oathtool.decode_key('GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ')] * 2
+>>> bulk_codes(keys, 1)
+['287082', '287082']
+"""
+
+import hashlib
+import hmac
+
+import oathtool
+
+try:
+    import numpy as np
+except ImportError:  # pragma: nocover
+    np = None
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError('NumPy is required; install oathtool[vector]')
+
+
+def digest_matrix(keys, counter, digest=hashlib.sha1):
+    """
+    The HMAC of counter under each raw key in keys, as the rows of an
+    (N, digest_size) uint8 array.
+    """
+    require_numpy()
+    msg = oathtool._counter.pack(counter)
+    blob = b''.join(hmac.digest(key, msg, digest) for key in keys)
+    return np.frombuffer(blob, dtype=np.uint8).reshape(-1, digest().digest_size)
+
+
+def truncate_array(digests):
+    """
+    Dynamic truncation of each row of digests to a code, as a uint32
+    array.
+
+    >>> truncate_array(np.frombuffer(bytes(range(20)), np.uint8).reshape(1, 20))
+    array([595078], dtype=uint32)
+    """
+    require_numpy()
+    offsets = (digests[:, -1] & 0x0F).astype(np.intp)
+    window = np.take_along_axis(digests, offsets[:, None] + np.arange(4), axis=1)
+    value = window.astype(np.uint32) << np.array([24, 16, 8, 0], dtype=np.uint32)
+    return (np.bitwise_or.reduce(value, axis=1) & 0x7FFFFFFF) % 1000000
+
+
+def format_codes(codes, sep=b'\n'):
+    """
+    Format codes as zero-padded six-digit ASCII, each followed by sep,
+    in one bytes blob.
+
+    >>> format_codes(np.array([487656, 42], dtype=np.uint32))
+    b'487656\\n000042\\n'
+    """
+    require_numpy()
+    powers = 10 ** np.arange(5, -1, -1, dtype=np.uint32)
+    digits = (codes[:, None] // powers % 10 + ord('0')).astype(np.uint8)
+    if sep:
+        separators = np.frombuffer(sep, np.uint8)
+        digits = np.hstack([
+            digits,
+            np.broadcast_to(separators, (len(codes), len(sep))),
+        ])
+    return digits.tobytes()
+
+
+def bulk_codes(keys, counter, digest=hashlib.sha1):
+    """
+    The code for counter under each raw key in keys, as a list of
+    strings; vectorized with NumPy, or a scalar loop without it.
+    """
+    if np is None:
+        msg = oathtool._counter.pack(counter)
+        return [oathtool.truncate(hmac.digest(key, msg, digest)) for key in keys]
+    text = format_codes(truncate_array(digest_matrix(keys, counter, digest)), b'')
+    text = text.decode()
+    return [text[pos : pos + 6] for pos in range(0, len(text), 6)]
+
+
+# Experimental: HMAC computed in NumPy, one lane per key.
+#
+# An HOTP message is a single 8-byte counter, so after the key blocks
+# (compressed once per batch) each code needs exactly two compressions:
+# the inner block holding the counter, identical in every lane, and the
+# outer block holding the inner digest.
+
+SHA1_IV = [0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476, 0xC3D2E1F0]
+SHA1_K = [0x5A827999, 0x6ED9EBA1, 0x8F1BBCDC, 0xCA62C1D6]
+
+SHA256_IV = [
+    0x6A09E667, 0xBB67AE85, 0x3C6EF372, 0xA54FF53A,
+    0x510E527F, 0x9B05688C, 0x1F83D9AB, 0x5BE0CD19,
+]  # fmt: skip
+SHA256_K = [
+    0x428A2F98, 0x71374491, 0xB5C0FBCF, 0xE9B5DBA5,
+    0x3956C25B, 0x59F111F1, 0x923F82A4, 0xAB1C5ED5,
+    0xD807AA98, 0x12835B01, 0x243185BE, 0x550C7DC3,
+    0x72BE5D74, 0x80DEB1FE, 0x9BDC06A7, 0xC19BF174,
+    0xE49B69C1, 0xEFBE4786, 0x0FC19DC6, 0x240CA1CC,
+    0x2DE92C6F, 0x4A7484AA, 0x5CB0A9DC, 0x76F988DA,
+    0x983E5152, 0xA831C66D, 0xB00327C8, 0xBF597FC7,
+    0xC6E00BF3, 0xD5A79147, 0x06CA6351, 0x14292967,
+    0x27B70A85, 0x2E1B2138, 0x4D2C6DFC, 0x53380D13,
+    0x650A7354, 0x766A0ABB, 0x81C2C92E, 0x92722C85,
+    0xA2BFE8A1, 0xA81A664B, 0xC24B8B70, 0xC76C51A3,
+    0xD192E819, 0xD6990624, 0xF40E3585, 0x106AA070,
+    0x19A4C116, 0x1E376C08, 0x2748774C, 0x34B0BCB5,
+    0x391C0CB3, 0x4ED8AA4A, 0x5B9CCA4F, 0x682E6FF3,
+    0x748F82EE, 0x78A5636F, 0x84C87814, 0x8CC70208,
+    0x90BEFFFA, 0xA4506CEB, 0xBEF9A3F7, 0xC67178F2,
+]  # fmt: skip
+
+BLOCK_SIZE = 64
+
+
+def _rotl(x, n):
+    return (x << np.uint32(n)) | (x >> np.uint32(32 - n))
+
+
+def _rotr(x, n):
+    return (x >> np.uint32(n)) | (x << np.uint32(32 - n))
+
+
+def _sha1_compress(state, w):
+    w = list(w)
+    for t in range(16, 80):
+        w.append(_rotl(w[t - 3] ^ w[t - 8] ^ w[t - 14] ^ w[t - 16], 1))
+    a, b, c, d, e = state
+    k0, k1, k2, k3 = (np.uint32(k) for k in SHA1_K)
+    for t in range(80):
+        if t < 20:
+            f, k = (b & c) | (~b & d), k0
+        elif t < 40:
+            f, k = b ^ c ^ d, k1
+        elif t < 60:
+            f, k = (b & c) | (b & d) | (c & d), k2
+        else:
+            f, k = b ^ c ^ d, k3
+        a, b, c, d, e = _rotl(a, 5) + f + e + k + w[t], a, _rotl(b, 30), c, d
+    return [s + x for s, x in zip(state, (a, b, c, d, e))]
+
+
+def _sha256_compress(state, w):
+    w = list(w)
+    for t in range(16, 64):
+        s0 = _rotr(w[t - 15], 7) ^ _rotr(w[t - 15], 18) ^ (w[t - 15] >> np.uint32(3))
+        s1 = _rotr(w[t - 2], 17) ^ _rotr(w[t - 2], 19) ^ (w[t - 2] >> np.uint32(10))
+        w.append(w[t - 16] + s0 + w[t - 7] + s1)
+    a, b, c, d, e, f, g, h = state
+    for t in range(64):
+        s1 = _rotr(e, 6) ^ _rotr(e, 11) ^ _rotr(e, 25)
+        t1 = h + s1 + ((e & f) ^ (~e & g)) + np.uint32(SHA256_K[t]) + w[t]
+        s0 = _rotr(a, 2) ^ _rotr(a, 13) ^ _rotr(a, 22)
+        t2 = s0 + ((a & b) ^ (a & c) ^ (b & c))
+        a, b, c, d, e, f, g, h = t1 + t2, a, b, c, d + t1, e, f, g
+    return [s + x for s, x in zip(state, (a, b, c, d, e, f, g, h))]
+
+
+_engines = {
+    'sha1': (SHA1_IV, _sha1_compress),
+    'sha256': (SHA256_IV, _sha256_compress),
+}
+
+
+def _words(blocks):
+    """(N, 64) uint8 blocks as 16 big-endian uint32 lanes of length N."""
+    return np.ascontiguousarray(blocks).view('>u4').astype(np.uint32).T
+
+
+def _pad_block(data, prefix_len):
+    """
+    The final SHA block after prefix_len bytes of already-compressed
+    input, holding data, an (N, m) uint8 array.
+    """
+    rows, size = data.shape
+    block = np.zeros((rows, BLOCK_SIZE), np.uint8)
+    block[:, :size] = data
+    block[:, size] = 0x80
+    bits = (prefix_len + size) * 8
+    block[:, -8:] = np.frombuffer(bits.to_bytes(8, 'big'), np.uint8)
+    return block
+
+
+class HMACBatch:
+    """
+    Experimental: HMAC-SHA1 or HMAC-SHA256 of an 8-byte HOTP counter
+    under many keys at once, computed with NumPy, one lane per key.
+
+    The keyed inner and outer states are computed once per batch, so
+    each counter costs two vectorized compressions in total.
+
+    >>> keys = [b'12345678901234567890'] * 2
+    >>> batch = HMACBatch(keys)
+    >>> format_codes(truncate_array(batch.digests(1)))
+    b'287082\\n287082\\n'
+    """
+
+    def __init__(self, keys, digest=hashlib.sha1):
+        require_numpy()
+        self.name = digest().name
+        try:
+            iv, self.compress = _engines[self.name]
+        except KeyError:
+            raise ValueError(f'unsupported digest: {self.name}') from None
+        keys = [digest(key).digest() if len(key) > BLOCK_SIZE else key for key in keys]
+        padded = np.zeros((len(keys), BLOCK_SIZE), np.uint8)
+        for row, key in enumerate(keys):
+            padded[row, : len(key)] = np.frombuffer(key, np.uint8)
+        iv = [np.full(len(keys), word, np.uint32) for word in iv]
+        self.inner = self.compress(iv, _words(padded ^ np.uint8(0x36)))
+        self.outer = self.compress(iv, _words(padded ^ np.uint8(0x5C)))
+
+    def __len__(self):
+        return len(self.inner[0])
+
+    def digests(self, counter):
+        """The HMAC of counter under every key, as (N, digest_size) uint8."""
+        msg = np.frombuffer(oathtool._counter.pack(counter), np.uint8)[None, :]
+        inner = self.compress(self.inner, _words(_pad_block(msg, BLOCK_SIZE)))
+        inner = np.stack(inner, axis=1).astype('>u4').view(np.uint8)
+        outer = self.compress(self.outer, _words(_pad_block(inner, BLOCK_SIZE)))
+        return np.stack(outer, axis=1).astype('>u4').view(np.uint8)
+
+    def codes(self, counter):
+        """The code for counter under every key, as a uint32 array."""
+        return truncate_array(self.digests(counter))